@@ -5,7 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.ingest.ingest import ingest_files
-from src.vectorstore.pinecone_client import PineconeClient
+from src.vectorstore.pinecone_cache import get_pinecone_client
 
 def main():
     print("==================================================")
@@ -16,7 +16,7 @@ def main():
     # Step 1: Chunking & archiving
     print("\n[Stage 1/2] Ingesting & Chunking Files...")
     try:
-        ingest_files()
+        removed = ingest_files()
     except Exception as e:
         print(f"❌ Error during ingestion: {e}")
         return
@@ -24,8 +24,10 @@ def main():
     # Step 2: Embedding & Inserting into Pinecone
     print("\n[Stage 2/2] Embedding & Upserting to Pinecone...")
     try:
-        pc_client = PineconeClient()
+        pc_client = get_pinecone_client()
         pc_client.upsert_all_chunks()
+        if removed:
+            pc_client.delete_chunks(removed)
     except Exception as e:
         print(f"❌ Error during vector upsert: {e}")
         return
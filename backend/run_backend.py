@@ -5,6 +5,7 @@ Starts the Flask API server for the RAG chatbot
 
 import sys
 import os
+import argparse
 
 # Ensure UTF-8 output on Windows
 try:
@@ -14,13 +15,27 @@ except Exception:
 
 def main():
     """Start the Flask backend server"""
+    parser = argparse.ArgumentParser(description="RAG Chatbot backend server")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")),
+                        help="Pre-forked worker processes sharing the loaded models (Unix only)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "5000")))
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        from src.api.prefork import PreforkServer, fork_supported
+        if fork_supported():
+            PreforkServer(host='0.0.0.0', port=args.port, workers=args.workers).serve_forever()
+            return
+        print("⚠️ Pre-fork workers need os.fork (not available on Windows); "
+              "falling back to a single process.")
+
     print("=" * 60)
     print("🚀 Starting RAG Chatbot Backend Server")
     print("=" * 60)
     print()
     print("📋 Server Information:")
-    print("   • Port: 5000")
-    print("   • API Base: http://localhost:5000/api")
+    print(f"   • Port: {args.port}")
+    print(f"   • API Base: http://localhost:{args.port}/api")
     print("   • CORS: Enabled")
     print()
     print("⏳ Initializing...")
@@ -32,11 +47,12 @@ def main():
         print("✅ Backend loaded successfully")
         print()
         print("=" * 60)
-        print("🌐 Backend running at http://localhost:5000")
+        print(f"🌐 Backend running at http://localhost:{args.port}")
         print("=" * 60)
         print()
         print("💡 API Endpoints:")
         print("   • GET  /api/health  - Health check")
+        print("   • GET  /api/health/ready - Readiness (models loaded)")
         print("   • POST /api/query   - Submit questions")
         print("   • GET  /api/info    - System information")
         print()
@@ -47,7 +63,7 @@ def main():
         # Start Flask server
         app.run(
             host='0.0.0.0',
-            port=5000,
+            port=args.port,
             debug=False,
             use_reloader=False
         )
@@ -1,28 +1,33 @@
 """
 Flask API for RAG Chatbot
 Provides REST endpoints for the frontend to interact with the RAG pipeline
+
+Importing this module is cheap: the RAG pipeline, HTTP clients and pymongo
+are imported on first use, and models/connections are brought up by a single
+background warmup (see src/api/warmup.py) that gates /api/health/ready.
 """
 
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 import sys
+import json
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from pymongo import MongoClient, ASCENDING
 from bson import ObjectId
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from src.rag.pipeline import run_rag_pipeline, _parse_pinecone_response, _build_context, PROMPT_TEMPLATE
-from src.embed.embedder_cache import get_embedder
-from src.vectorstore.pinecone_cache import get_pinecone_client
-from src.llm.ollama_health import check_ollama_health
-from src.llm.llm_ollama import generate_llm_stream
+from src.llm.scheduler import get_llm_scheduler, SchedulerRejected
+from src.api.sse import SSEWriter, SSE_RESUME_GRACE_SEC, new_stream, get_stream, parse_last_event_id, pump
+from src.api.warmup import warmup
+from src.api.passwords import get_password_hasher, LoginRateLimiter, AuthRejected
+from src.vectorstore.filters import normalize_filter
 
 # Load environment variables from a .env file (if present)
 load_dotenv()
@@ -46,86 +51,140 @@ token_minutes = int(os.getenv('TOKEN_EXPIRES_MIN', '60'))
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=token_minutes)
 jwt = JWTManager(app)
 
-# ------------------
-# Warmup on startup (run after app is created)
-# ------------------
-def _warmup_background():
-    try:
-        if os.getenv('PRELOAD_MODELS', 'true').lower() == 'true':
-            try:
-                emb = get_embedder()
-                _ = emb.embed_text('hi')
-            except Exception:
-                pass
-            try:
-                pc = get_pinecone_client()
-                _ = pc.query([0.0]*768, top_k=1)
-            except Exception:
-                pass
-            try:
-                check_ollama_health()
-            except Exception:
-                pass
-    except Exception:
-        pass
-
-# Start warmup thread immediately (Flask 3 removed before_first_request)
-try:
-    threading.Thread(target=_warmup_background, daemon=True).start()
-except Exception:
-    pass
-
-# MongoDB setup
+# MongoDB setup (connected lazily: by the warmup, or by the first request)
 MONGO_URI = os.getenv('MONGO_URI')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
+# After a failed connection attempt, wait 1 s, 2 s, 4 s, ... up to this before the next one
+MONGO_RETRY_MAX_SEC = float(os.getenv('MONGO_RETRY_MAX_SEC', '60'))
 mongo_client = None
 db = None
 users_col = None
 chats_col = None
 messages_col = None
+chat_retention = None
+condenser = None
+chat_access = None
+_mongo_ready = False
+_mongo_lock = threading.Lock()
+_mongo_backoff = 0.0
+_mongo_retry_at = 0.0
 
-if MONGO_URI and MONGO_DB_NAME:
-    try:
-        # Short timeout so a bad URI/credentials don't hang startup forever
-        mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        # Force an initial ping to validate connection & auth
-        mongo_client.admin.command('ping')
 
-        db = mongo_client[MONGO_DB_NAME]
-        users_col = db['users']
-        chats_col = db['chats']
-        messages_col = db['messages']
+def _init_mongo():
+    """
+    Connect to MongoDB once per process; safe to call from any thread.
+    After a failure, calls fail fast until the retry backoff has passed.
+    """
+    global mongo_client, db, users_col, chats_col, messages_col, chat_retention, condenser, chat_access
+    global _mongo_ready, _mongo_backoff, _mongo_retry_at
+    if _mongo_ready:
+        return
+    with _mongo_lock:
+        if _mongo_ready:
+            return
+        if not (MONGO_URI and MONGO_DB_NAME):
+            _mongo_ready = True
+            return
+        wait = _mongo_retry_at - time.monotonic()
+        if wait > 0:
+            raise RuntimeError(f"MongoDB is unavailable; next connection attempt in {wait:.0f}s")
+        try:
+            from pymongo import MongoClient, ASCENDING
+            from src.chat.retention import ChatRetention
+            from src.rag.condense import ConversationCondenser
+            from src.chat.access_cache import ChatAccessCache
+
+            # Short timeout so a bad URI/credentials don't hang startup forever
+            client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+            # Force an initial ping to validate connection & auth
+            client.admin.command('ping')
+
+            database = client[MONGO_DB_NAME]
+            users = database['users']
+            chats = database['chats']
+            messages = database['messages']
+
+            # Indexes
+            try:
+                users.create_index([('email', ASCENDING)], unique=True)
+                chats.create_index([('user_id', ASCENDING), ('created_at', ASCENDING)])
+                messages.create_index([('chat_id', ASCENDING), ('created_at', ASCENDING)])
+                database['chat_tombstones'].create_index([('removed_at', ASCENDING)])
+            except Exception:
+                # Index creation errors are non-fatal
+                pass
+
+            mongo_client, db = client, database
+            users_col, chats_col, messages_col = users, chats, messages
+            chat_retention = ChatRetention(database['chat_rings'], chats, messages,
+                                           database['chat_tombstones'], database['leases'])
+            chat_retention.sweeper.start()
+            condenser = ConversationCondenser(messages)
+            chat_access = ChatAccessCache(users, chats)
+            _mongo_ready = True
+            _mongo_backoff = 0.0
+            print("✅ Connected to MongoDB and initialized collections")
+        except Exception as e:
+            # Log but keep API running so we can return a clear error to the frontend
+            _mongo_backoff = min(MONGO_RETRY_MAX_SEC, max(1.0, _mongo_backoff * 2))
+            _mongo_retry_at = time.monotonic() + _mongo_backoff
+            print(f"⚠️ Failed to connect/authenticate with MongoDB: {e} "
+                  f"(retrying in {_mongo_backoff:.0f}s)")
+            raise
+
 
-        # Indexes
+def _warm_mongo():
+    """Warmup step: retry until MongoDB is connected (readiness waits for it)."""
+    while True:
         try:
-            users_col.create_index([('email', ASCENDING)], unique=True)
-            chats_col.create_index([('user_id', ASCENDING), ('created_at', ASCENDING)])
-            messages_col.create_index([('chat_id', ASCENDING), ('created_at', ASCENDING)])
+            return _init_mongo()
         except Exception:
-            # Index creation errors are non-fatal
-            pass
-        print("✅ Connected to MongoDB and initialized collections")
-    except Exception as e:
-        # Log but keep API running so we can return a clear error to the frontend
-        print(f"⚠️ Failed to connect/authenticate with MongoDB: {e}")
-        mongo_client = None
-        db = None
-        users_col = None
-        chats_col = None
-        messages_col = None
-
-# Optional: Pre-initialize models on startup if requested
-preload = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
-if preload:
-    print(" Pre-loading models for faster responses...")
+            time.sleep(max(0.1, _mongo_retry_at - time.monotonic()))
+
+
+@app.before_request
+def _ensure_mongo():
+    # Liveness/readiness probes must never block on the database
+    if request.path.startswith('/api/health'):
+        return
     try:
-        get_embedder()
-        get_pinecone_client()
-        print(" Models pre-loaded successfully")
-    except Exception as e:
-        print(f" Warning: Could not pre-load models: {e}")
-else:
-    print(" Skipping model preloading (set PRELOAD_MODELS=true to enable)")
+        _init_mongo()
+    except Exception:
+        pass
+
+
+# ------------------
+# Warmup on startup: one coordinated path, reported by /api/health/ready
+# ------------------
+def _warm_embedder():
+    from src.embed.embedder_cache import get_embedder
+    get_embedder().embed_query('warmup')
+
+
+def _warm_vector_store():
+    from src.vectorstore.pinecone_cache import get_pinecone_client
+    pc = get_pinecone_client()
+    pc.query([0.0] * pc.embedding_dim, top_k=1)
+
+
+def _warm_ollama():
+    from src.llm.ollama_pool import get_ollama_pool
+    pool = get_ollama_pool()
+    pool.probe_all()
+    ok, msg = pool.health()
+    if not ok:
+        raise RuntimeError(msg)
+
+
+if os.getenv('PRELOAD_MODELS', 'true').lower() == 'true':
+    warmup.add_step('embedder', _warm_embedder)
+    warmup.add_step('vector_store', _warm_vector_store)
+# Ollama first: the MongoDB step does not return until it has connected
+warmup.add_step('ollama', _warm_ollama, required=False)
+warmup.add_step('mongo', _warm_mongo)
+
+if os.getenv('API_WARMUP_ON_IMPORT', 'true').lower() == 'true':
+    warmup.start()
 
 
 def oid(s):
@@ -135,6 +194,98 @@ def oid(s):
         return None
 
 
+# Thread pool for the independent steps of a chat turn (lookup, insert,
+# health check, retrieval). Created lazily, and again after a fork.
+_prep_executor = None
+_prep_executor_pid = None
+_prep_executor_lock = threading.Lock()
+
+
+def _prep_pool() -> ThreadPoolExecutor:
+    global _prep_executor, _prep_executor_pid
+    if _prep_executor is None or _prep_executor_pid != os.getpid():
+        with _prep_executor_lock:
+            if _prep_executor is None or _prep_executor_pid != os.getpid():
+                _prep_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('API_PREP_WORKERS', '16')),
+                    thread_name_prefix='rag-prep',
+                )
+                _prep_executor_pid = os.getpid()
+    return _prep_executor
+
+
+def _prepare_rag(chat_id, content, before, top_k):
+    """Condense, retrieve and build the prompt for one chat turn."""
+    from src.rag.pipeline import retrieve, _build_context, build_prompt
+    rq = _retrieval_query(chat_id, content, before)
+    retrieved = retrieve(rq, top_k=top_k)
+    context = _build_context(retrieved, max_chars_per_item=250)
+    system, prompt = build_prompt(context, content)
+    return retrieved, system, prompt
+
+
+def _retrieval_query(chat_id, content, before):
+    """Standalone retrieval query for a chat turn (falls back to the raw content)."""
+    if condenser is None:
+        return content
+    try:
+        return condenser.condense(oid(chat_id), content, before=before)
+    except Exception as e:
+        print(f"⚠️ Query condensation failed: {e}")
+        return content
+
+
+def _abandon_rag(rag_f, chat_id):
+    """Stop or discard a speculative _prepare_rag whose chat turn was refused."""
+    if rag_f.cancel() or condenser is None:
+        return
+    # Already running: once done, drop the condensed query it cached for this turn
+    rag_f.add_done_callback(lambda _: condenser.forget(oid(chat_id)))
+
+
+def _rejected(e: SchedulerRejected):
+    """JSON error for a request refused by the LLM scheduler."""
+    resp = jsonify({'error': str(e), 'queue': get_llm_scheduler().stats()})
+    resp.status_code = e.status_code
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp
+
+
+def _auth_rejected(e: AuthRejected):
+    resp = jsonify({'error': str(e)})
+    resp.status_code = e.status_code
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp
+
+
+def _client_ip() -> str:
+    # Behind a reverse proxy, trust the forwarded address only when told to
+    if os.getenv('AUTH_TRUST_PROXY', 'false').lower() == 'true' and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+
+def _format_sources(retrieved):
+    """Sources as returned to API clients."""
+    return [{
+        'source_file': item.get('source_file', 'unknown'),
+        'score': round(item.get('score') or 0, 4),
+        'snippet': (item.get('text_snippet') or '')[:200]  # First 200 chars
+    } for item in retrieved]
+
+
+def _owns_chat(uid, chat_id) -> bool:
+    """Ownership check, answered from the access cache when possible."""
+    return chat_access.owns(oid(uid), oid(chat_id))
+
+
+def _touch_chat(uid, chat_id):
+    try:
+        chat_retention.touch(oid(uid), oid(chat_id))
+    except Exception:
+        pass
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -144,13 +295,31 @@ def health_check():
     })
 
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({'status': 'alive', 'pid': os.getpid()})
+
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: models are loaded and the database is reachable"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
 @app.route('/api/query', methods=['POST'])
 def query():
     """
     Main query endpoint
-    Expects JSON: { "question": "your question here", "top_k": 4 }
-    Returns: { "answer": "...", "sources": [...] }
+    Expects JSON: { "question": "your question here", "top_k": 4,
+                    "filter": { "trimester": "third", "year": { "$gte": 2015 } } }
+    ("filter" is optional; fields and operators: src/vectorstore/filters.py)
+    Returns: { "answer": "...", "sources": [...], "partial": false }
+    ("partial": some vector shards did not answer, see src/vectorstore/sharded.py)
     """
+    from src.llm.ollama_health import check_ollama_health
+    from src.rag.pipeline import run_rag_pipeline
     try:
         data = request.get_json()
         
@@ -166,6 +335,11 @@ def query():
             return jsonify({
                 'error': 'Question cannot be empty'
             }), 400
+
+        try:
+            flt = normalize_filter(data.get('filter'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter: {e}'}), 400
         
         # Check Ollama health before processing
         is_healthy, health_msg = check_ollama_health()
@@ -175,20 +349,15 @@ def query():
             }), 503
         
         # Run the RAG pipeline
-        answer, retrieved = run_rag_pipeline(question, top_k=top_k)
-        
-        # Format sources for frontend
-        sources = []
-        for item in retrieved:
-            sources.append({
-                'source_file': item.get('source_file', 'unknown'),
-                'score': round(item.get('score', 0), 4),
-                'snippet': item.get('text_snippet', '')[:200]  # First 200 chars
-            })
+        try:
+            answer, retrieved = run_rag_pipeline(question, top_k=top_k, filter=flt)
+        except SchedulerRejected as e:
+            return _rejected(e)
         
         return jsonify({
             'answer': answer,
-            'sources': sources,
+            'sources': _format_sources(retrieved),
+            'partial': getattr(retrieved, 'partial', False),
             'question': question
         })
     
@@ -198,10 +367,63 @@ def query():
         }), 500
 
 
+@app.route('/api/query/batch', methods=['POST'])
+def query_batch():
+    """
+    Bulk questions, e.g. FAQ review runs
+    Expects JSON: { "questions": ["...", {"id": "faq-1", "question": "..."}], "top_k": 4, "filter": {...} }
+    Streams NDJSON, one line per question as soon as its answer is ready:
+      { "index": 0, "id": "faq-1", "question": "...", "answer": "...", "sources": [...], "partial": false, "timings": {...} }
+    followed by a final { "done": true, "count": N, "seconds": ... } line.
+    """
+    from src.llm.ollama_health import check_ollama_health
+    from src.rag.batch import run_batch, BATCH_MAX_QUESTIONS
+    data = request.get_json() or {}
+    items = data.get('questions')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'questions must be a non-empty list'}), 400
+    if len(items) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch'}), 413
+    ids, questions = [], []
+    for i, it in enumerate(items):
+        q = it.get('question') if isinstance(it, dict) else it
+        if not isinstance(q, str) or not q.strip():
+            return jsonify({'error': f'questions[{i}] is empty'}), 400
+        ids.append(it.get('id') if isinstance(it, dict) else None)
+        questions.append(q.strip())
+    try:
+        top_k = int(data.get('top_k', 4))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    try:
+        flt = normalize_filter(data.get('filter'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {e}'}), 400
+
+    is_healthy, health_msg = check_ollama_health()
+    if not is_healthy:
+        return jsonify({'error': f'Ollama service issue: {health_msg}'}), 503
+
+    def generate():
+        start = time.time()
+        count = 0
+        for result in run_batch(questions, top_k=top_k, filter=flt):
+            result['id'] = ids[result['index']]
+            result['sources'] = _format_sources(result.get('sources') or [])
+            count += 1
+            yield json.dumps(result, default=str) + '\n'
+        yield json.dumps({'done': True, 'count': count, 'seconds': round(time.time() - start, 2)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/info', methods=['GET'])
 def info():
     """Get system information"""
     from src.main.settings import LLM_MODEL, EMBEDDING_MODEL, PINECONE_INDEX
+    from src.llm.ollama_health import check_ollama_health
+    from src.llm.ollama_pool import get_ollama_pool
     
     # Check Ollama status
     is_healthy, health_msg = check_ollama_health()
@@ -211,13 +433,16 @@ def info():
         'embedding_model': EMBEDDING_MODEL,
         'pinecone_index': PINECONE_INDEX,
         'ollama_status': 'healthy' if is_healthy else 'unhealthy',
-        'ollama_message': health_msg
+        'ollama_message': health_msg,
+        'llm_queue': get_llm_scheduler().stats(),
+        'ollama_endpoints': get_ollama_pool().stats()
     })
 
 
 @app.route('/api/ollama/status', methods=['GET'])
 def ollama_status():
     """Check Ollama service status"""
+    from src.llm.ollama_health import check_ollama_health
     is_healthy, message = check_ollama_health()
     
     return jsonify({
@@ -231,10 +456,17 @@ def ollama_status():
 # Auth Endpoints (JWT)
 # =====================
 
+auth_limiter = LoginRateLimiter()
+
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     if users_col is None:
         return jsonify({'error': 'Database not configured'}), 500
+    try:
+        auth_limiter.check(_client_ip())
+    except AuthRejected as e:
+        return _auth_rejected(e)
     data = request.get_json() or {}
     email = (data.get('email') or '').strip().lower()
     password = data.get('password') or ''
@@ -243,7 +475,10 @@ def register():
         return jsonify({'error': 'email and password are required'}), 400
     if users_col.find_one({'email': email}):
         return jsonify({'error': 'Email already in use'}), 409
-    pwd_hash = generate_password_hash(password)
+    try:
+        pwd_hash = get_password_hasher().hash(password)
+    except AuthRejected as e:
+        return _auth_rejected(e)
     user_doc = {
         'email': email,
         'password_hash': pwd_hash,
@@ -266,9 +501,26 @@ def login():
     password = data.get('password') or ''
     if not email or not password:
         return jsonify({'error': 'email and password are required'}), 400
+    try:
+        auth_limiter.check(_client_ip())
+    except AuthRejected as e:
+        return _auth_rejected(e)
     user = users_col.find_one({'email': email})
-    if not user or not check_password_hash(user.get('password_hash', ''), password):
+    if not user:
         return jsonify({'error': 'Invalid credentials'}), 401
+    hasher = get_password_hasher()
+    try:
+        ok, needs_rehash = hasher.verify(user.get('password_hash', ''), password)
+    except AuthRejected as e:
+        return _auth_rejected(e)
+    if not ok:
+        return jsonify({'error': 'Invalid credentials'}), 401
+    if needs_rehash:
+        # PASSWORD_HASH_METHOD changed since this hash was made: upgrade it now
+        try:
+            users_col.update_one({'_id': user['_id']}, {'$set': {'password_hash': hasher.hash(password)}})
+        except Exception as e:
+            print(f"⚠️ Password rehash skipped: {e}")
     user_id = str(user['_id'])
     access_token = create_access_token(identity=user_id)
     return jsonify({'access_token': access_token, 'user': {'id': user_id, 'email': email, 'name': user.get('name', '')}})
@@ -278,10 +530,10 @@ def login():
 @jwt_required()
 def me():
     uid = get_jwt_identity()
-    u = users_col.find_one({'_id': oid(uid)}) if users_col is not None else None
-    if not u:
+    profile = chat_access.profile(oid(uid)) if chat_access is not None else None
+    if not profile:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify({'id': str(u['_id']), 'email': u['email'], 'name': u.get('name', '')})
+    return jsonify(profile)
 
 
 # ==========================
@@ -303,18 +555,13 @@ def create_chat():
         'updated_at': datetime.utcnow(),
     }
     res = chats_col.insert_one(doc)
-    # Trim to last 10 chats for this user (delete older ones)
+    chat_access.remember(oid(uid), res.inserted_id)
+    # Trim to the last CHAT_HISTORY_LIMIT chats; messages of evicted chats are swept in the background
     try:
-        total = chats_col.count_documents({'user_id': oid(uid)})
-        if total > 10:
-            to_delete_count = total - 10
-            old_cursor = chats_col.find({'user_id': oid(uid)}).sort('updated_at', 1).limit(to_delete_count)
-            old_ids = [c['_id'] for c in old_cursor]
-            if old_ids:
-                chats_col.delete_many({'_id': {'$in': old_ids}})
-                messages_col.delete_many({'chat_id': {'$in': old_ids}})
-    except Exception:
-        pass
+        evicted = chat_retention.register(oid(uid), res.inserted_id)
+        chat_access.forget(oid(uid), evicted)
+    except Exception as e:
+        print(f"⚠️ Chat retention update failed: {e}")
     return jsonify({'id': str(res.inserted_id), 'title': title}), 201
 
 
@@ -325,7 +572,7 @@ def list_chats():
         return jsonify({'error': 'Database not configured'}), 500
     uid = get_jwt_identity()
     chats = []
-    for c in chats_col.find({'user_id': oid(uid)}).sort('updated_at', -1).limit(10):
+    for c in chats_col.find({'user_id': oid(uid)}).sort('updated_at', -1).limit(chat_retention.limit):
         chats.append({'id': str(c['_id']), 'title': c.get('title', ''), 'created_at': c.get('created_at'), 'updated_at': c.get('updated_at')})
     return jsonify(chats)
 
@@ -343,6 +590,7 @@ def rename_chat(chat_id):
     res = chats_col.update_one({'_id': oid(chat_id), 'user_id': oid(uid)}, {'$set': {'title': title, 'updated_at': datetime.utcnow()}})
     if res.matched_count == 0:
         return jsonify({'error': 'Chat not found'}), 404
+    chat_access.forget(oid(uid), [chat_id])
     return jsonify({'ok': True})
 
 
@@ -352,10 +600,20 @@ def delete_chat(chat_id):
     if chats_col is None or messages_col is None:
         return jsonify({'error': 'Database not configured'}), 500
     uid = get_jwt_identity()
+    # Tombstone first: if the process dies before the messages are deleted, the sweeper does it
+    # (a tombstone for a chat that was not deleted is dropped without touching its messages)
+    if oid(chat_id) is not None:
+        chat_retention.sweeper.enqueue([oid(chat_id)])
     res = chats_col.delete_one({'_id': oid(chat_id), 'user_id': oid(uid)})
+    chat_access.forget(oid(uid), [chat_id])
     if res.deleted_count == 0:
         return jsonify({'error': 'Chat not found'}), 404
     messages_col.delete_many({'chat_id': oid(chat_id)})
+    try:
+        chat_retention.forget(oid(uid), oid(chat_id))
+        condenser.forget(oid(chat_id))
+    except Exception:
+        pass
     return jsonify({'ok': True})
 
 
@@ -365,23 +623,26 @@ def list_messages(chat_id):
     if messages_col is None or chats_col is None:
         return jsonify({'error': 'Database not configured'}), 500
     uid = get_jwt_identity()
-    chat = chats_col.find_one({'_id': oid(chat_id), 'user_id': oid(uid)})
-    if not chat:
+    if not _owns_chat(uid, chat_id):
         return jsonify({'error': 'Chat not found'}), 404
     msgs = []
     for m in messages_col.find({'chat_id': oid(chat_id)}).sort('created_at', 1):
-        msgs.append({'id': str(m['_id']), 'role': m.get('role'), 'content': m.get('content'), 'created_at': m.get('created_at')})
+        msg = {'id': str(m['_id']), 'role': m.get('role'), 'content': m.get('content'), 'created_at': m.get('created_at')}
+        if m.get('truncated'):
+            msg['truncated'] = True
+        msgs.append(msg)
     return jsonify(msgs)
 
 
 @app.route('/api/chats/<chat_id>/messages', methods=['POST'])
 @jwt_required()
 def add_message(chat_id):
+    from src.llm.ollama_health import check_ollama_health
+    from src.rag.pipeline import run_rag_pipeline
     if messages_col is None or chats_col is None:
         return jsonify({'error': 'Database not configured'}), 500
     uid = get_jwt_identity()
-    chat = chats_col.find_one({'_id': oid(chat_id), 'user_id': oid(uid)})
-    if not chat:
+    if not _owns_chat(uid, chat_id):
         return jsonify({'error': 'Chat not found'}), 404
     data = request.get_json() or {}
     content = (data.get('content') or '').strip()
@@ -401,7 +662,12 @@ def add_message(chat_id):
     is_healthy, health_msg = check_ollama_health()
     if not is_healthy:
         return jsonify({'error': f'Ollama service issue: {health_msg}'}), 503
-    answer, retrieved = run_rag_pipeline(content, top_k=data.get('top_k', 4))
+    rq = _retrieval_query(chat_id, content, user_msg['created_at'])
+    try:
+        answer, retrieved = run_rag_pipeline(content, top_k=data.get('top_k', 4), retrieval_query=rq,
+                                             session_id=str(chat_id))
+    except SchedulerRejected as e:
+        return _rejected(e)
 
     # Save assistant message
     asst_msg = {
@@ -412,15 +678,17 @@ def add_message(chat_id):
     }
     asst_res = messages_col.insert_one(asst_msg)
 
-    # Update chat timestamp
+    # Update chat timestamp and keep it at the newest end of the retention ring
     chats_col.update_one({'_id': oid(chat_id)}, {'$set': {'updated_at': datetime.utcnow()}})
+    _touch_chat(uid, chat_id)
 
     return jsonify({
         'user_message': {'id': str(user_res.inserted_id)},
         'assistant_message': {
             'id': str(asst_res.inserted_id),
             'content': answer,
-            'sources': retrieved
+            'sources': retrieved,
+            'partial': getattr(retrieved, 'partial', False)
         }
     }), 201
 
@@ -428,86 +696,211 @@ def add_message(chat_id):
 @app.route('/api/chats/<chat_id>/messages/stream', methods=['POST'])
 @jwt_required()
 def add_message_stream(chat_id):
+    from src.llm.ollama_health import check_ollama_health
+    from src.llm.llm_ollama import LLMStream
     if messages_col is None or chats_col is None:
         return jsonify({'error': 'Database not configured'}), 500
     uid = get_jwt_identity()
-    chat = chats_col.find_one({'_id': oid(chat_id), 'user_id': oid(uid)})
-    if not chat:
-        return jsonify({'error': 'Chat not found'}), 404
 
     data = request.get_json() or {}
     content = (data.get('content') or '').strip()
     if not content:
         return jsonify({'error': 'content required'}), 400
+    try:
+        top_k = int(data.get('top_k', 4))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k must be an integer'}), 400
+
+    created_at = datetime.utcnow()
+    pool = _prep_pool()
+    health_f = pool.submit(check_ollama_health)
+    # Condensation reads the chat's history, so ownership is settled first
+    # (usually from the access cache); then retrieval overlaps with the
+    # admission check, the user message insert and the health check.
+    if not _owns_chat(uid, chat_id):
+        return jsonify({'error': 'Chat not found'}), 404
+    rag_f = pool.submit(_prepare_rag, chat_id, content, created_at, top_k)
+
+    # Admission control: reject before any side effects when the LLM queue is full
+    scheduler = get_llm_scheduler()
+    try:
+        ticket = scheduler.enqueue()
+    except SchedulerRejected as e:
+        _abandon_rag(rag_f, chat_id)
+        return _rejected(e)
 
-    # Save user message first
+    # Save user message (overlaps with retrieval)
     user_msg = {
         'chat_id': oid(chat_id),
         'role': 'user',
         'content': content,
-        'created_at': datetime.utcnow()
+        'created_at': created_at
     }
-    messages_col.insert_one(user_msg)
+    insert_f = pool.submit(messages_col.insert_one, user_msg)
 
     # Health check
-    is_healthy, health_msg = check_ollama_health()
+    is_healthy, health_msg = health_f.result()
     if not is_healthy:
+        scheduler.release(ticket)
+        _abandon_rag(rag_f, chat_id)
         return jsonify({'error': f'Ollama service issue: {health_msg}'}), 503
 
-    # Build RAG prompt (replicating pipeline steps quickly)
-    try:
-        embedder = get_embedder()
-        qvec = embedder.embed_text(content)
-        pine = get_pinecone_client()
-        raw = pine.query(qvec, top_k=int((request.get_json() or {}).get('top_k', 4)))
-        if hasattr(raw, 'to_dict'):
-            raw = raw.to_dict()
-        retrieved = _parse_pinecone_response(raw)
-        context = _build_context(retrieved, max_chars_per_item=250)
-        prompt = PROMPT_TEMPLATE.format(context=context, question=content)
-    except Exception as e:
-        return jsonify({'error': f'RAG prep failed: {str(e)}'}), 500
+    replay = new_stream(owner=(uid, str(chat_id)))
+    writer = SSEWriter(replay)
+
+    def save_answer(text, truncated=False):
+        # The user message must be stored before the answer
+        insert_f.result()
+        asst_doc = {
+            'chat_id': oid(chat_id),
+            'role': 'assistant',
+            'content': text,
+            'created_at': datetime.utcnow()
+        }
+        if truncated:
+            asst_doc['truncated'] = True
+        messages_col.insert_one(asst_doc)
+        chats_col.update_one({'_id': oid(chat_id)}, {'$set': {'updated_at': datetime.utcnow()}})
+        _touch_chat(uid, chat_id)
+
+    state = {'detached': False}
+
+    def finish_detached(tokens, buffer, llm):
+        """
+        The client dropped mid-answer: keep generating into the replay buffer
+        so a resume (GET below) gets the whole answer. Stops, keeping what
+        was generated, once nobody has been reading for SSE_RESUME_GRACE_SEC.
+        """
+        completed = False
+        try:
+            for chunk in tokens:
+                if chunk is not None:
+                    buffer.append(chunk)
+                    writer.token(chunk)
+                else:
+                    writer.flush()
+                if replay.unread_for() > SSE_RESUME_GRACE_SEC:
+                    break
+            else:
+                completed = True
+        except Exception as e:
+            print(f"⚠️ Detached generation failed: {e}")
+        finally:
+            if not completed:
+                llm.cancel()
+            writer.flush()
+            try:
+                if buffer:
+                    save_answer(''.join(buffer), truncated=not completed)
+            except Exception as e:
+                print(f"⚠️ Could not save detached answer: {e}")
+            if completed:
+                writer.event('done', 'done')
+            else:
+                writer.event('error', 'generation stopped before the answer was complete')
+            writer.close()
+            scheduler.release(ticket)
 
     def event_stream():
         buffer = []
+        llm = None
+        tokens = None
+        completed = False
         try:
-            # Send sources first so UI can render them while streaming
-            try:
-                import json as _json
-                yield "event: sources\n" + f"data: {_json.dumps(retrieved)}\n\n"
-            except Exception:
-                pass
             # Quick ready event to confirm stream open on client
-            try:
-                yield "event: ready\ndata: ok\n\n"
-            except Exception:
-                pass
-            for chunk in generate_llm_stream(prompt):
-                if not chunk:
-                    continue
-                buffer.append(chunk)
-                yield f"data: {chunk}\n\n"
-            full_text = ''.join(buffer)
+            yield writer.event('ready', 'ok')
+            # Send sources as soon as retrieval finishes so the UI can render them while streaming
+            while True:
+                try:
+                    retrieved, system, prompt = rag_f.result(timeout=writer.heartbeat_sec)
+                    break
+                except FutureTimeout:
+                    yield writer.heartbeat() or ''
+                except Exception as e:
+                    yield writer.event('error', f'RAG prep failed: {str(e)}')
+                    return
+            yield writer.event('sources', json.dumps(retrieved))
+            if getattr(retrieved, 'partial', False):
+                # Some shards did not answer: the sources (and answer) may be incomplete
+                yield writer.event('partial', json.dumps(retrieved.shards))
+            # Wait for a generation slot, telling the client where it is in line
+            for position in scheduler.wait(ticket, poll=writer.heartbeat_sec):
+                yield writer.event('queue', json.dumps({'position': position}))
+            # Tokens are read on a helper thread so this generator keeps
+            # writing (flushes, heartbeats) and notices a closed connection
+            llm = LLMStream(prompt, system=system, session_id=str(chat_id))
+            tokens = pump(llm, writer.window)
+            for chunk in tokens:
+                if chunk is None:
+                    frame = writer.flush() or writer.heartbeat()
+                else:
+                    buffer.append(chunk)
+                    frame = writer.token(chunk)
+                if frame:
+                    yield frame
+            yield writer.flush() or ''
+            completed = True
             # Save assistant message and update chat timestamp
-            asst_doc = {
-                'chat_id': oid(chat_id),
-                'role': 'assistant',
-                'content': full_text,
-                'created_at': datetime.utcnow()
-            }
-            messages_col.insert_one(asst_doc)
-            chats_col.update_one({'_id': oid(chat_id)}, {'$set': {'updated_at': datetime.utcnow()}})
-            yield "event: done\ndata: done\n\n"
+            save_answer(''.join(buffer))
+            yield writer.event('done', 'done')
+        except GeneratorExit:
+            # Client went away mid-answer: finish in the background for a resume
+            replay.detach()
+            if tokens is not None and not completed and SSE_RESUME_GRACE_SEC > 0:
+                state['detached'] = True
+                threading.Thread(target=finish_detached, args=(tokens, buffer, llm),
+                                 name="sse-detached", daemon=True).start()
+            raise
         except Exception as e:
-            yield f"event: error\ndata: {str(e)}\n\n"
+            yield writer.event('error', str(e))
+        finally:
+            # The stream failed (or the client left with no grace period):
+            # stop Ollama right away and keep whatever was generated so far
+            if not completed and not state['detached']:
+                if llm is not None:
+                    llm.cancel()
+                if buffer:
+                    try:
+                        save_answer(''.join(buffer), truncated=True)
+                    except Exception as e:
+                        print(f"⚠️ Could not save truncated answer: {e}")
+            if not state['detached']:
+                writer.close()
+                scheduler.release(ticket)
+
+    response = Response(stream_with_context(event_stream()), headers=_sse_headers(replay.stream_id))
+    # Also frees the slot if the client goes away before the stream starts
+    response.call_on_close(lambda: state['detached'] or scheduler.release(ticket))
+    return response
+
+
+@app.route('/api/chats/<chat_id>/messages/stream', methods=['GET'])
+@jwt_required()
+def resume_message_stream(chat_id):
+    """
+    Resume an answer stream after a dropped connection.
+    Replays every frame after `Last-Event-ID` (header or ?last_event_id=),
+    then follows the stream live until it ends. Generation keeps running for
+    SSE_RESUME_GRACE_SEC after the client drops, so the resumed stream ends
+    with the full answer and `done`.
+    """
+    uid = get_jwt_identity()
+    stream_id, last_seq = parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    replay = get_stream(stream_id) if stream_id else None
+    if replay is None or replay.owner != (uid, str(chat_id)):
+        return jsonify({'error': 'Stream not found or expired'}), 404
+    return Response(replay.follow(last_seq), headers=_sse_headers(replay.stream_id))
+
 
-    headers = {
+def _sse_headers(stream_id):
+    return {
         'Content-Type': 'text/event-stream',
         'Cache-Control': 'no-cache',
         'Connection': 'keep-alive',
         'X-Accel-Buffering': 'no',
+        'X-Stream-Id': stream_id,
     }
-    return Response(stream_with_context(event_stream()), headers=headers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+"""
+Password hashing off the request threads
+scrypt/pbkdf2 are deliberately CPU-expensive. Running them inline lets a
+burst of logins occupy every request thread and core while chat streams
+wait. Here they run on a small dedicated pool instead:
+
+ - at most PASSWORD_HASH_WORKERS hashes run at once (hashlib releases the
+   GIL, so this is the real CPU budget for auth), at most
+   PASSWORD_HASH_MAX_PENDING wait; beyond that requests are refused (503)
+ - PASSWORD_HASH_METHOD selects the Werkzeug method and cost, e.g.
+   "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+ - PasswordHasher.verify reports when a stored hash uses other parameters,
+   so login can transparently re-hash it
+ - LoginRateLimiter: per-IP token bucket for the auth endpoints (429)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional, Tuple
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from src.main.ttl_cache import TTLCache
+
+
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+PASSWORD_HASH_TIMEOUT_SEC = float(os.getenv("PASSWORD_HASH_TIMEOUT_SEC", "10"))
+
+# "<attempts>/<seconds>" per client IP for login and register
+AUTH_RATE_LIMIT = os.getenv("AUTH_RATE_LIMIT", "10/60")
+
+
+class AuthRejected(Exception):
+    """Base class for auth requests refused before doing any work."""
+    status_code = 503
+    retry_after = 2
+
+
+class HashingBusy(AuthRejected):
+    status_code = 503
+
+
+class RateLimited(AuthRejected):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many attempts, please try again later")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+# ---------------------------------------------------------
+# Hashing pool (created lazily, and again after a fork)
+# ---------------------------------------------------------
+class PasswordHasher:
+    def __init__(self, method: str = PASSWORD_HASH_METHOD, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING, timeout: float = PASSWORD_HASH_TIMEOUT_SEC):
+        self.method = method
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, max_pending))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._tag: Optional[str] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix="pwd-hash")
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Authentication is busy, please retry shortly")
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy("Authentication timed out, please retry shortly")
+
+    def _method_tag(self) -> str:
+        # Werkzeug stores "<method with parameters>$salt$hash"; hashing once
+        # gives the normalized form (e.g. "scrypt" -> "scrypt:32768:8:1")
+        if self._tag is None:
+            self._tag = self._run(generate_password_hash, "", self.method).split("$", 1)[0]
+        return self._tag
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash: str, password: str) -> Tuple[bool, bool]:
+        """Returns (valid, needs_rehash)."""
+        if not stored_hash:
+            return False, False
+        ok = self._run(check_password_hash, stored_hash, password)
+        return ok, ok and stored_hash.split("$", 1)[0] != self._method_tag()
+
+
+_hasher: Optional[PasswordHasher] = None
+
+
+def get_password_hasher() -> PasswordHasher:
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher()
+    return _hasher
+
+
+# ---------------------------------------------------------
+# Per-IP rate limiting
+# ---------------------------------------------------------
+def _parse_rate(spec: str) -> Tuple[float, float]:
+    attempts, _, seconds = spec.partition("/")
+    return float(attempts or 10), float(seconds or 60)
+
+
+class LoginRateLimiter:
+    """Token bucket per key: `attempts` per `seconds`, refilled continuously."""
+
+    def __init__(self, spec: str = AUTH_RATE_LIMIT, maxsize: int = 100000):
+        self.capacity, self.period = _parse_rate(spec)
+        self.rate = self.capacity / self.period
+        self._buckets = TTLCache(maxsize=maxsize, ttl=self.period)
+        self._lock = threading.Lock()
+
+    def check(self, key: str):
+        """Consume one attempt for `key` or raise RateLimited."""
+        if self.capacity <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets.set(key, (tokens, now))
+                raise RateLimited((1 - tokens) / self.rate)
+            self._buckets.set(key, (tokens - 1, now))
@@ -0,0 +1,192 @@
+"""
+Pre-fork production launcher (Unix only)
+The master process loads the embedding model (and a local vector index)
+once, binds the listening socket and forks N workers. The workers inherit the
+loaded model pages copy-on-write instead of each loading their own copy.
+
+ - compute threads are split so the workers' embedding threads plus Ollama's
+   LLM_NUM_THREAD do not oversubscribe the cores
+ - the master runs no inference: no torch OpenMP pool to break across fork,
+   and the ONNX session is created in each worker with its thread budget
+ - the master opens no network connections: Pinecone's HTTP pool and the
+   MongoDB client are not fork-safe, so each worker opens its own
+ - SIGHUP: graceful reload, i.e. a fresh set of workers is started and the
+   old ones finish their in-flight requests before exiting
+ - SIGTERM / SIGINT: graceful shutdown
+ - dead workers are respawned
+"""
+
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict
+
+
+PREFORK_GRACEFUL_TIMEOUT = float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", "60"))
+
+
+def compute_threads_per_worker(workers: int) -> int:
+    """Cores left after Ollama's threads, shared between the workers."""
+    cpus = os.cpu_count() or 1
+    llm_threads = int(os.getenv("LLM_NUM_THREAD", "4"))
+    return max(1, (cpus - llm_threads) // max(1, workers))
+
+
+def set_compute_threads(n: int):
+    """Cap BLAS/OpenMP/torch intra-op threads for this process."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "EMBED_NUM_THREADS"):
+        os.environ[var] = str(n)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        try:
+            torch.set_num_threads(n)
+        except Exception:
+            pass
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker(sock: socket.socket, host: str, port: int, threads: int):
+    """Child process body: serve requests on the shared socket until told to stop."""
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_compute_threads(threads)
+
+    from src.api.app import app
+    from src.api.warmup import warmup
+    # Models are already loaded (inherited); this creates the ONNX session and
+    # opens the per-worker connections (vector store, MongoDB, Ollama)
+    warmup.start()
+
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # Let in-flight requests finish on shutdown instead of being killed
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+        # Hard stop if in-flight requests (e.g. long streams) outlive the grace period
+        signal.signal(signal.SIGALRM, lambda *_: os._exit(0))
+        signal.alarm(max(1, int(PREFORK_GRACEFUL_TIMEOUT)))
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"👷 Worker {os.getpid()} ready ({threads} compute threads)")
+    server.serve_forever()
+    server.server_close()
+    os._exit(0)
+
+
+class PreforkServer:
+    def __init__(self, host: str = "0.0.0.0", port: int = 5000, workers: int = 2):
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.threads = compute_threads_per_worker(self.workers)
+        self.children: Dict[int, int] = {}  # pid -> generation
+        self.generation = 0
+        self._reload = False
+        self._stop = False
+
+    # ---------------------------------------------------------
+    # Master
+    # ---------------------------------------------------------
+    def preload(self):
+        """Import the app and load shared models before forking (no inference, no I/O)."""
+        os.environ["API_WARMUP_ON_IMPORT"] = "false"
+        # Single-threaded in the master: no OpenMP thread team survives the fork
+        set_compute_threads(1)
+        from src.api.app import app  # noqa: F401
+        from src.embed.embedder_cache import get_embedder
+        from src.vectorstore.pinecone_cache import get_pinecone_client, vector_store_is_fork_safe
+        get_embedder()
+        if vector_store_is_fork_safe():
+            get_pinecone_client()
+        # Move everything loaded so far out of the GC's reach, so collections
+        # in the workers don't write to (and un-share) those pages
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker(self.sock, self.host, self.port, self.threads)
+            finally:
+                os._exit(1)
+        self.children[pid] = self.generation
+
+    def _spawn_all(self):
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _signal_generation(self, sig, older_than=None):
+        for pid, gen in list(self.children.items()):
+            if older_than is None or gen < older_than:
+                try:
+                    os.kill(pid, sig)
+                except ProcessLookupError:
+                    pass
+
+    def serve_forever(self):
+        self.sock = _bind(self.host, self.port)
+        self.preload()
+
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "_reload", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "_stop", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "_stop", True))
+
+        print(f"🚀 Pre-fork master {os.getpid()}: {self.workers} workers on "
+              f"{self.host}:{self.port}, {self.threads} compute threads each")
+        self._spawn_all()
+
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                self.generation += 1
+                print("🔄 Reloading workers...")
+                self._spawn_all()
+                self._signal_generation(signal.SIGTERM, older_than=self.generation)
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid:
+                gen = self.children.pop(pid, None)
+                # Respawn crashed workers of the current generation
+                if gen == self.generation and not self._stop:
+                    print(f"⚠️ Worker {pid} exited (status {status}), respawning")
+                    self._spawn()
+                continue
+            time.sleep(0.2)
+
+        print("👋 Stopping workers...")
+        self._signal_generation(signal.SIGTERM)
+        deadline = time.time() + PREFORK_GRACEFUL_TIMEOUT + 5
+        while self.children and time.time() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.2)
+        self._signal_generation(signal.SIGKILL)
+        self.sock.close()
+
+
+def fork_supported() -> bool:
+    return hasattr(os, "fork")
@@ -0,0 +1,228 @@
+"""
+Server-Sent Events helpers for the chat streaming endpoint
+ - format_event: spec-compliant framing (multi-line data becomes several
+   `data:` lines, so newlines inside tokens no longer break frames)
+ - SSEWriter: coalesces LLM tokens over a small time/size window, numbers
+   every frame and emits `: ping` heartbeats while the stream is idle
+ - pump: reads a blocking iterator on a helper thread so the response
+   generator can keep writing (flushes, heartbeats) while the LLM is silent;
+   those writes are what reveal a disconnected client
+ - ReplayBuffer / stream registry: keep a stream's recent frames so a client
+   can reconnect with `Last-Event-ID` and receive what it missed; the
+   buffer also tracks whether anyone is reading, so a generation whose
+   client dropped can run on for SSE_RESUME_GRACE_SEC waiting for a resume
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+
+from src.main.ttl_cache import TTLCache
+
+
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "50"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+SSE_HEARTBEAT_SEC = float(os.getenv("SSE_HEARTBEAT_SEC", "5"))
+SSE_REPLAY_MAX_FRAMES = int(os.getenv("SSE_REPLAY_MAX_FRAMES", "2000"))
+SSE_REPLAY_TTL_SEC = float(os.getenv("SSE_REPLAY_TTL_SEC", "300"))
+SSE_RESUME_GRACE_SEC = float(os.getenv("SSE_RESUME_GRACE_SEC", "30"))
+
+HEARTBEAT = ": ping\n\n"
+
+
+def format_event(data, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Frame one SSE event. Any newline style in `data` is split into data lines."""
+    text = str(data).replace("\r\n", "\n").replace("\r", "\n")
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in text.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+class ReplayBuffer:
+    """Recent frames of one stream, addressable by sequence number."""
+
+    def __init__(self, stream_id: str, owner=None, max_frames: int = SSE_REPLAY_MAX_FRAMES):
+        self.stream_id = stream_id
+        self.owner = owner
+        self.finished = False
+        self.readers = 1  # the original response
+        self._unread_since = time.monotonic()
+        self._frames: deque = deque(maxlen=max_frames)  # (seq, frame)
+        self._cond = threading.Condition()
+
+    def append(self, seq: int, frame: str):
+        with self._cond:
+            self._frames.append((seq, frame))
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def detach(self):
+        """A reader (the original response or a resumed one) went away."""
+        with self._cond:
+            self.readers = max(0, self.readers - 1)
+            if not self.readers:
+                self._unread_since = time.monotonic()
+
+    def unread_for(self) -> float:
+        """Seconds since the last reader left (0 while someone is reading)."""
+        with self._cond:
+            return 0.0 if self.readers else time.monotonic() - self._unread_since
+
+    def _after(self, last_seq: int) -> List[Tuple[int, str]]:
+        return [(s, f) for s, f in self._frames if s > last_seq]
+
+    def since(self, last_seq: int) -> List[Tuple[int, str]]:
+        with self._cond:
+            return self._after(last_seq)
+
+    def follow(self, last_seq: int, heartbeat: float = SSE_HEARTBEAT_SEC) -> Iterator[str]:
+        """Replay frames after `last_seq`, then tail the live stream until it ends."""
+        with self._cond:
+            self.readers += 1
+        try:
+            while True:
+                with self._cond:
+                    frames = self._after(last_seq)
+                    if not frames and not self.finished:
+                        self._cond.wait(heartbeat)
+                        frames = self._after(last_seq)
+                    if not frames and self.finished:
+                        return
+                if not frames:
+                    yield HEARTBEAT
+                for seq, frame in frames:
+                    last_seq = seq
+                    yield frame
+        finally:
+            self.detach()
+
+
+_DONE = object()
+
+
+def pump(iterable, timeout: float) -> Iterator:
+    """
+    Consume `iterable` on a daemon thread. Yields its items, or None after
+    every `timeout` seconds without one. Errors are re-raised here.
+    """
+    q: "queue.Queue" = queue.Queue()
+
+    def run():
+        try:
+            for item in iterable:
+                q.put((item, None))
+        except BaseException as e:
+            q.put((_DONE, e))
+            return
+        q.put((_DONE, None))
+
+    threading.Thread(target=run, name="sse-pump", daemon=True).start()
+    while True:
+        try:
+            item, err = q.get(timeout=timeout)
+        except queue.Empty:
+            yield None
+            continue
+        if item is _DONE:
+            if err is not None:
+                raise err
+            return
+        yield item
+
+
+_streams = TTLCache(maxsize=1024, ttl=SSE_REPLAY_TTL_SEC)
+
+
+def new_stream(owner=None) -> ReplayBuffer:
+    buf = ReplayBuffer(uuid.uuid4().hex, owner=owner)
+    _streams.set(buf.stream_id, buf)
+    return buf
+
+
+def get_stream(stream_id: str) -> Optional[ReplayBuffer]:
+    return _streams.get(stream_id)
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """`<stream_id>:<seq>` -> (stream_id, seq)."""
+    if not value or ":" not in value:
+        return None, -1
+    stream_id, _, seq = value.strip().rpartition(":")
+    try:
+        return stream_id, int(seq)
+    except ValueError:
+        return stream_id, -1
+
+
+class SSEWriter:
+    """
+    Produces the frames of one stream. Methods return the text to yield
+    (or None when nothing is due yet) and record it in the replay buffer.
+    """
+
+    def __init__(self, replay: Optional[ReplayBuffer] = None, coalesce_ms: float = SSE_COALESCE_MS,
+                 coalesce_bytes: int = SSE_COALESCE_BYTES, heartbeat_sec: float = SSE_HEARTBEAT_SEC):
+        self.replay = replay
+        self.window = coalesce_ms / 1000.0
+        self.max_bytes = coalesce_bytes
+        self.heartbeat_sec = heartbeat_sec
+        self._seq = 0
+        self._pending: List[str] = []
+        self._pending_len = 0
+        self._last_flush = time.monotonic()
+        self._last_write = time.monotonic()
+
+    def _frame(self, data, event: Optional[str] = None) -> str:
+        self._seq += 1
+        event_id = f"{self.replay.stream_id}:{self._seq}" if self.replay else str(self._seq)
+        frame = format_event(data, event=event, event_id=event_id)
+        if self.replay is not None:
+            self.replay.append(self._seq, frame)
+        self._last_write = time.monotonic()
+        return frame
+
+    def token(self, text: str) -> Optional[str]:
+        """Buffer a token; return a coalesced data frame once the window is full."""
+        if not text:
+            return None
+        self._pending.append(text)
+        self._pending_len += len(text)
+        now = time.monotonic()
+        if self._pending_len >= self.max_bytes or now - self._last_flush >= self.window:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return None
+        data = "".join(self._pending)
+        self._pending, self._pending_len = [], 0
+        return self._frame(data)
+
+    def event(self, event: str, data) -> str:
+        """Named event; pending tokens are flushed ahead of it to keep order."""
+        pending = self.flush() or ""
+        return pending + self._frame(data, event=event)
+
+    def heartbeat(self) -> Optional[str]:
+        if time.monotonic() - self._last_write >= self.heartbeat_sec:
+            self._last_write = time.monotonic()
+            return HEARTBEAT
+        return None
+
+    def close(self):
+        if self.replay is not None:
+            self.replay.finish()
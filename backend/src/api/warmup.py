@@ -0,0 +1,94 @@
+"""
+Coordinated startup warmup
+One place that loads the models and opens connections, in order, so the API
+can report liveness immediately and readiness only once it can actually
+answer questions.
+
+Steps are registered by the app (embedder, vector store, MongoDB, Ollama);
+required steps gate readiness, optional ones are only reported.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class Warmup:
+    def __init__(self):
+        self._steps: List[tuple] = []  # (name, fn, required)
+        self._results: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add_step(self, name: str, fn: Callable[[], None], required: bool = True):
+        self._steps.append((name, fn, required))
+        self._results[name] = {'status': 'pending', 'required': required}
+
+    def run(self, only: Optional[Iterable[str]] = None) -> bool:
+        """Run the steps (or the named subset) in order. Returns readiness."""
+        only = set(only) if only is not None else None
+        self.started_at = self.started_at or time.time()
+        for name, fn, required in self._steps:
+            if only is not None and name not in only:
+                continue
+            self._results[name]['status'] = 'running'
+            t0 = time.time()
+            try:
+                fn()
+                self._results[name].update(status='ok', error=None)
+            except Exception as e:
+                self._results[name].update(status='failed', error=str(e))
+                print(f"⚠️ Warmup step '{name}' failed: {e}")
+            self._results[name]['seconds'] = round(time.time() - t0, 3)
+        if only is None:
+            self.finished_at = time.time()
+        return self.is_ready()
+
+    def start(self):
+        """Run all steps on a background thread (once per process)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def is_ready(self) -> bool:
+        return all(r['status'] == 'ok' for r in self._results.values() if r['required'])
+
+    def status(self) -> dict:
+        return {
+            'ready': self.is_ready(),
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'steps': {name: dict(r) for name, r in self._results.items()},
+        }
+
+
+warmup = Warmup()
+
+
+# Modules a worker must not import until warmup actually needs them
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "onnxruntime", "pinecone")
+
+
+def measure_import(module: str = "src.api.app") -> dict:
+    """
+    Import `module` in a fresh interpreter with warmup disabled.
+    Returns {"ms": import time, "heavy": HEAVY_MODULES it pulled in}.
+    """
+    code = ("import json, sys, time; t = time.perf_counter(); import " + module + "; "
+            "ms = round((time.perf_counter() - t) * 1000); "
+            f"print(json.dumps({{'ms': ms, 'heavy': [m for m in {list(HEAVY_MODULES)!r} if m in sys.modules]}}))")
+    env = dict(os.environ, API_WARMUP_ON_IMPORT="false")
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
@@ -0,0 +1,77 @@
+"""
+Cached chat ownership and user profiles
+Every chat endpoint checks that the chat belongs to the caller, and
+/api/auth/me loads the user document; both are read far more often than
+they change. This keeps positive answers in small per-process TTL caches.
+
+ - only "owned" results are cached; a miss always asks MongoDB, so a new
+   chat or a foreign chat id is never answered from stale state
+ - entries are dropped on rename, delete and retention trimming in the
+   process that made the change; other worker processes see the change
+   after CHAT_ACCESS_CACHE_TTL_SEC at the latest
+
+Ownership is deliberately not put into JWT claims: tokens outlive chat
+deletion and cannot list chats created after login.
+"""
+
+import os
+from typing import Iterable, Optional
+
+from src.main.ttl_cache import TTLCache
+
+
+CHAT_ACCESS_CACHE_TTL_SEC = float(os.getenv("CHAT_ACCESS_CACHE_TTL_SEC", "30"))
+CHAT_ACCESS_CACHE_SIZE = int(os.getenv("CHAT_ACCESS_CACHE_SIZE", "10000"))
+
+
+class ChatAccessCache:
+    def __init__(self, users_col, chats_col, ttl: float = CHAT_ACCESS_CACHE_TTL_SEC,
+                 maxsize: int = CHAT_ACCESS_CACHE_SIZE):
+        self.users_col = users_col
+        self.chats_col = chats_col
+        self._owners = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._profiles = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    # ---------------------------------------------------------
+    # Ownership
+    # ---------------------------------------------------------
+    def owns(self, user_id, chat_id) -> bool:
+        if user_id is None or chat_id is None:
+            return False
+        key = (str(user_id), str(chat_id))
+        if self._owners.get(key):
+            return True
+        found = self.chats_col.find_one({'_id': chat_id, 'user_id': user_id}, {'_id': 1}) is not None
+        if found:
+            self._owners.set(key, True)
+        return found
+
+    def is_cached(self, user_id, chat_id) -> bool:
+        return bool(self._owners.get((str(user_id), str(chat_id))))
+
+    def remember(self, user_id, chat_id):
+        self._owners.set((str(user_id), str(chat_id)), True)
+
+    def forget(self, user_id, chat_ids: Iterable):
+        for chat_id in chat_ids:
+            self._owners.pop((str(user_id), str(chat_id)))
+
+    # ---------------------------------------------------------
+    # Profiles (/api/auth/me)
+    # ---------------------------------------------------------
+    def profile(self, user_id) -> Optional[dict]:
+        if user_id is None:
+            return None
+        key = str(user_id)
+        cached = self._profiles.get(key)
+        if cached is not None:
+            return cached
+        u = self.users_col.find_one({'_id': user_id}, {'email': 1, 'name': 1})
+        if not u:
+            return None
+        profile = {'id': str(u['_id']), 'email': u['email'], 'name': u.get('name', '')}
+        self._profiles.set(key, profile)
+        return profile
+
+    def forget_user(self, user_id):
+        self._profiles.pop(str(user_id))
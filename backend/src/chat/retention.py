@@ -0,0 +1,213 @@
+"""
+Per-user chat retention
+Keeps at most CHAT_HISTORY_LIMIT chats per user without the
+count -> find -> delete dance on every chat creation.
+
+How it works:
+ - every user owns one "ring" document in `chat_rings` holding the ids of
+   their chats, oldest first
+ - a new chat is appended and the ring is sliced back to the limit in a
+   single atomic update (aggregation-pipeline update), which also reports
+   the ids that fell off the end
+ - evicted chats are tombstoned and removed with one delete_many; their
+   messages are left to a background sweeper that works through the
+   tombstones in batches (one process at a time, see OrphanMessageSweeper)
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "10"))
+CHAT_SWEEP_INTERVAL_SEC = float(os.getenv("CHAT_SWEEP_INTERVAL_SEC", "30"))
+CHAT_SWEEP_BATCH = int(os.getenv("CHAT_SWEEP_BATCH", "200"))
+
+
+class OrphanMessageSweeper:
+    """
+    Deletes the messages of removed chats in batches from a daemon thread.
+
+    Removed chat ids are written to `chat_tombstones` before the chats are
+    deleted, so a crash or restart loses nothing. A sweep reads at most a batch
+    of tombstones at least one interval old (in-flight requests have finished
+    with those chats by then) and deletes by the indexed messages.chat_id.
+    Only the process holding the "chat-sweeper" lease in `leases` sweeps, so
+    pre-fork workers and other hosts do not repeat the work.
+
+    The thread is started lazily (and restarted after a fork) so importing
+    this module never spawns threads.
+    """
+
+    LEASE_ID = "chat-sweeper"
+
+    def __init__(self, messages_col, chats_col, tombstones_col, leases_col,
+                 interval: float = CHAT_SWEEP_INTERVAL_SEC, batch_size: int = CHAT_SWEEP_BATCH):
+        self.messages_col = messages_col
+        self.chats_col = chats_col
+        self.tombstones_col = tombstones_col
+        self.leases_col = leases_col
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def enqueue(self, chat_ids):
+        """Record chats about to be deleted; call before deleting them."""
+        if not chat_ids:
+            return
+        now = datetime.utcnow()
+        self.tombstones_col.bulk_write(
+            [UpdateOne({'_id': cid}, {'$setOnInsert': {'removed_at': now}}, upsert=True) for cid in chat_ids],
+            ordered=False,
+        )
+        self._ensure_started()
+
+    def pending(self) -> int:
+        return self.tombstones_col.count_documents({})
+
+    def acquire_lease(self) -> bool:
+        """Take or renew the sweeper lease; False while another process holds it."""
+        now = datetime.utcnow()
+        holder = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            self.leases_col.find_one_and_update(
+                {'_id': self.LEASE_ID, '$or': [{'holder': holder}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'holder': holder, 'expires_at': now + timedelta(seconds=3 * self.interval)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease exists and is held by a live process: the upsert collided
+            return False
+
+    def flush(self) -> int:
+        """Delete the messages of every tombstoned chat due for sweeping. Returns chats processed."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.interval)
+        processed = 0
+        while True:
+            try:
+                batch = [d['_id'] for d in self.tombstones_col.find(
+                    {'removed_at': {'$lte': cutoff}}, {'_id': 1}
+                ).sort('removed_at', 1).limit(self.batch_size)]
+                if not batch:
+                    return processed
+                # A chat that still exists (its delete was refused or never ran) keeps its messages
+                live = {d['_id'] for d in self.chats_col.find({'_id': {'$in': batch}}, {'_id': 1})}
+                gone = [cid for cid in batch if cid not in live]
+                if gone:
+                    self.messages_col.delete_many({'chat_id': {'$in': gone}})
+                self.tombstones_col.delete_many({'_id': {'$in': batch}})
+                processed += len(gone)
+            except Exception as e:
+                # Tombstones stay until their messages are gone: the next sweep retries
+                print(f"⚠️ Orphan message sweep failed, will retry: {e}")
+                return processed
+            if len(batch) < self.batch_size:
+                return processed
+
+    def start(self):
+        """Start the sweeper thread (also picks up tombstones left by a previous run)."""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="chat-sweeper", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.acquire_lease():
+                    self.flush()
+            except Exception as e:
+                print(f"⚠️ Chat sweeper lease check failed: {e}")
+            time.sleep(self.interval)
+
+
+class ChatRetention:
+    """Atomic per-user chat ring backed by the `chat_rings` collection."""
+
+    def __init__(self, rings_col, chats_col, messages_col, tombstones_col, leases_col,
+                 limit: int = CHAT_HISTORY_LIMIT):
+        self.rings_col = rings_col
+        self.chats_col = chats_col
+        self.limit = max(1, limit)
+        self.sweeper = OrphanMessageSweeper(messages_col, chats_col, tombstones_col, leases_col)
+
+    # ---------------------------------------------------------
+    # Ring updates
+    # ---------------------------------------------------------
+    def _push_pipeline(self, chat_id, seed):
+        return [
+            {'$set': {'_all': {'$concatArrays': [{'$ifNull': ['$chat_ids', seed]}, [chat_id]]}}},
+            {'$set': {'chat_ids': {'$slice': ['$_all', -self.limit]}}},
+            {'$set': {'evicted': {'$setDifference': ['$_all', '$chat_ids']}}},
+            {'$unset': '_all'},
+        ]
+
+    def _seed(self, user_id, exclude_id) -> list:
+        """Existing chats of a user that has no ring yet (oldest first)."""
+        cursor = self.chats_col.find(
+            {'user_id': user_id, '_id': {'$ne': exclude_id}}, {'_id': 1}
+        ).sort('updated_at', 1)
+        return [c['_id'] for c in cursor]
+
+    def register(self, user_id, chat_id) -> list:
+        """
+        Append a freshly created chat to the user's ring and trim it.
+        Returns the ids of the chats that were evicted (already deleted).
+        """
+        ring = self.rings_col.find_one_and_update(
+            {'_id': user_id},
+            self._push_pipeline(chat_id, []),
+            return_document=ReturnDocument.AFTER,
+        )
+        if ring is None:
+            # First chat since retention was introduced: seed the ring once
+            # from the user's existing chats, then append atomically.
+            pipeline = self._push_pipeline(chat_id, self._seed(user_id, chat_id))
+            try:
+                ring = self.rings_col.find_one_and_update(
+                    {'_id': user_id}, pipeline, upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # A concurrent request created the ring first
+                ring = self.rings_col.find_one_and_update(
+                    {'_id': user_id}, pipeline,
+                    return_document=ReturnDocument.AFTER,
+                )
+
+        evicted = (ring or {}).get('evicted') or []
+        if evicted:
+            self.sweeper.enqueue(evicted)
+            self.chats_col.delete_many({'_id': {'$in': evicted}, 'user_id': user_id})
+        return evicted
+
+    def touch(self, user_id, chat_id):
+        """Move an active chat to the newest end of the ring."""
+        self.rings_col.update_one(
+            {'_id': user_id, 'chat_ids': chat_id},
+            [{'$set': {'chat_ids': {'$concatArrays': [
+                {'$filter': {'input': '$chat_ids', 'cond': {'$ne': ['$$this', chat_id]}}},
+                [chat_id],
+            ]}}}],
+        )
+
+    def forget(self, user_id, chat_id):
+        """Drop a deleted chat from the ring."""
+        self.rings_col.update_one({'_id': user_id}, {'$pull': {'chat_ids': chat_id}})
+
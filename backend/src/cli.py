@@ -1,6 +1,13 @@
 import click
-import time
-from src.rag.pipeline import run_rag_pipeline
+
+
+_STAGE_LABELS = {
+    "embed": "📌 Embedded your question",
+    "search": "📚 Retrieved relevant chunks",
+    "prompt": "🧠 Built RAG prompt",
+    "queue": "⏳ Waited for the local LLM",
+    "first_token": "🤖 First token from Ollama",
+}
 
 
 @click.group()
@@ -9,63 +16,313 @@ def cli():
     pass
 
 
+def _parse_filter(value):
+    """--filter '{"trimester": "third"}' → normalized metadata filter."""
+    import json
+    from src.vectorstore.filters import normalize_filter
+
+    if not value:
+        return None
+    try:
+        return normalize_filter(json.loads(value))
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--filter")
+
+
+def _ask(question, top_k, session_id=None, retrieval_query=None, verbose=True, filter=None):
+    """Run one question through the streaming pipeline, printing as it goes."""
+    from src.rag.pipeline import stream_rag_pipeline
+
+    retrieved = []
+    streaming = False
+    for ev in stream_rag_pipeline(question, top_k=top_k, retrieval_query=retrieval_query,
+                                  session_id=session_id, filter=filter):
+        kind = ev["type"]
+        if kind == "stage":
+            if verbose:
+                click.echo(f"{_STAGE_LABELS.get(ev['stage'], ev['stage'])} ({ev['ms']:.0f} ms)", err=True)
+        elif kind == "sources":
+            retrieved = ev["items"]
+            if ev.get("partial"):
+                click.echo("⚠️ Partial search: some vector shards did not answer", err=True)
+        elif kind == "token":
+            if not streaming:
+                click.echo("\n✅ ✅ ✅  ANSWER  ✅ ✅ ✅")
+                click.echo("---------------------------------------------\n")
+                streaming = True
+            click.echo(ev["text"], nl=False)
+        elif kind == "done":
+            if not streaming:
+                click.echo("\n✅ ✅ ✅  ANSWER  ✅ ✅ ✅")
+                click.echo("---------------------------------------------\n")
+                click.echo(ev["answer"], nl=False)
+            click.echo("\n")
+            if verbose:
+                click.echo(f"⏱️ Generation {ev['ms'] / 1000:.1f}s, total {ev['total_ms'] / 1000:.1f}s", err=True)
+
+    # ---------------------------------------------------------
+    # Output Sources
+    # ---------------------------------------------------------
+    click.echo("📎 Sources used:")
+    click.echo("---------------------------------------------")
+
+    if retrieved:
+        for i, item in enumerate(retrieved):
+            src = item.get("source_file") or "unknown_source"
+            score = round(item.get("score") or 0, 4)
+            click.echo(f"[{i+1}] {src}  (score={score})")
+    else:
+        click.echo("⚠️ No sources returned from Pinecone.")
+    return retrieved
+
+
 # ============================================================
 # Query Command
 # ============================================================
 @cli.command()
 @click.option("--q", "--question", type=str, help="Your medical question")
 @click.option("--top_k", default=4, help="Number of chunks to retrieve from Pinecone")
-def query(q, top_k):
+@click.option("--filter", "filter_json", default=None, help='Metadata filter as JSON, e.g. \'{"trimester": "third"}\'')
+def query(q, top_k, filter_json):
     """
     Ask a question to the RAG pipeline.
-    Shows progress messages and returns the answer + sources.
+    Shows real stage timings and streams the answer + sources.
     """
 
     # If question not provided → ask interactively
     if not q:
         q = click.prompt("\n❓ Enter your question")
 
-    click.echo("\n🔍 Processing your question...")
-    time.sleep(0.4)
+    flt = _parse_filter(filter_json)
+    click.echo("\n🔍 Processing your question...", err=True)
+    _ask(q, top_k, filter=flt)
+    click.echo("\n✅ Finished!\n")
 
-    click.echo("📌 Step 1/4: Embedding your question...")
-    time.sleep(0.4)
 
-    click.echo("📚 Step 2/4: Querying Pinecone for relevant chunks...")
-    time.sleep(0.4)
+# ============================================================
+# Interactive REPL
+# ============================================================
+@cli.command()
+@click.option("--top_k", default=4, help="Number of chunks to retrieve from Pinecone")
+@click.option("--quiet", is_flag=True, help="Hide stage timings")
+def repl(top_k, quiet):
+    """
+    Interactive session: models, index connection and the Ollama HTTP
+    session stay warm between questions, and follow-up questions are
+    answered in context. Type 'exit' or press Ctrl+D to leave.
+    """
+    import os
+    import uuid
+    from src.rag.condense import condense_query
+    from src.api.warmup import warmup
+    os.environ["API_WARMUP_ON_IMPORT"] = "false"
+    import src.api.app  # noqa: F401  registers the warmup steps
 
-    click.echo("🧠 Step 3/4: Building RAG prompt...")
-    time.sleep(0.4)
+    click.echo("🔧 Warming up (embedding model, vector store, Ollama)...")
+    warmup.run(only=["embedder", "vector_store", "ollama"])
+    session_id = f"cli-{uuid.uuid4().hex}"
+    topic = ""
+    while True:
+        try:
+            q = click.prompt("\n❓ You", prompt_suffix=" > ").strip()
+        except (EOFError, click.Abort):
+            click.echo()
+            break
+        if not q:
+            continue
+        if q.lower() in ("exit", "quit", ":q"):
+            break
+        try:
+            topic = condense_query(q, topic)
+            _ask(q, top_k, session_id=session_id, retrieval_query=topic, verbose=not quiet)
+        except KeyboardInterrupt:
+            click.echo("\n⏹️ Interrupted")
+        except Exception as e:
+            # One failed question (Ollama down, index unreachable...) must not end the session
+            click.echo(f"❌ {type(e).__name__}: {e}", err=True)
+    click.echo("👋 Bye!")
 
-    click.echo("🤖 Step 4/4: Contacting local Meditron (Ollama)...\n")
-    time.sleep(0.4)
 
-    # Run RAG pipeline
-    answer, retrieved = run_rag_pipeline(q, top_k=top_k)
+# ============================================================
+# Batch Command
+# ============================================================
+@cli.command()
+@click.argument("input_file", type=click.File("r", encoding="utf-8"))
+@click.option("--out", "output", type=click.File("w", encoding="utf-8"), default="-",
+              help="NDJSON output file (default: stdout)")
+@click.option("--top_k", default=4, help="Number of chunks to retrieve per question")
+@click.option("--llm-concurrency", default=None, type=int, help="Generations queued at once")
+@click.option("--filter", "filter_json", default=None, help="Metadata filter (JSON) applied to every question")
+def batch(input_file, output, top_k, llm_concurrency, filter_json):
+    """
+    Answer every question of a JSONL file, e.g. for FAQ review.
+    Each line is {"question": "...", "id": "..."} or a bare JSON string.
+    Results are written as NDJSON in completion order (see "index").
+    """
+    import json
+    from src.rag.batch import run_batch, BATCH_LLM_CONCURRENCY
 
-    # ---------------------------------------------------------
-    # Output Answer
-    # ---------------------------------------------------------
-    click.echo("\n✅ ✅ ✅  ANSWER  ✅ ✅ ✅")
-    click.echo("---------------------------------------------\n")
-    click.echo(answer)
-    click.echo("\n")
+    flt = _parse_filter(filter_json)
+    ids, questions = [], []
+    for n, line in enumerate(input_file, 1):
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        q = item.get("question") if isinstance(item, dict) else item
+        if not isinstance(q, str) or not q.strip():
+            raise click.ClickException(f"line {n}: missing question")
+        ids.append(item.get("id") if isinstance(item, dict) else None)
+        questions.append(q.strip())
 
-    # ---------------------------------------------------------
-    # Output Sources
-    # ---------------------------------------------------------
-    click.echo("📎 Sources used:")
-    click.echo("---------------------------------------------")
+    click.echo(f"📋 {len(questions)} questions", err=True)
+    for done, result in enumerate(run_batch(questions, top_k=top_k,
+                                            llm_concurrency=llm_concurrency or BATCH_LLM_CONCURRENCY,
+                                            filter=flt), 1):
+        result["id"] = ids[result["index"]]
+        output.write(json.dumps(result, default=str) + "\n")
+        output.flush()
+        click.echo(f"✅ {done}/{len(questions)}", err=True)
 
-    if retrieved:
-        for i, item in enumerate(retrieved):
-            src = item.get("source_file") or "unknown_source"
-            score = round(item.get("score", 0), 4)
-            click.echo(f"[{i+1}] {src}  (score={score})")
-    else:
-        click.echo("⚠️ No sources returned from Pinecone.")
 
-    click.echo("\n✅ Finished!\n")
+# ============================================================
+# Retrieval evaluation
+# ============================================================
+@cli.command()
+@click.argument("dataset", type=click.Path(exists=True, dir_okay=False))
+@click.option("--k", "ks", default="1,3,5,10", help="Comma-separated cut-offs")
+@click.option("--max-chars", default=250, help="Context characters per chunk (as in run_rag_pipeline)")
+@click.option("--json-out", type=click.Path(dir_okay=False), default=None, help="Write the full report (per query) as JSON")
+def evaluate(dataset, ks, max_chars, json_out):
+    """
+    Score retrieval on a labelled JSONL set: recall@k, MRR, nDCG, latency
+    and prompt size. Fully local with VECTOR_STORE=local (and optionally
+    EMBEDDING_BACKEND=hash).
+    """
+    import json
+    import os
+    # Questions run one at a time: skip the micro-batching window
+    os.environ.setdefault("EMBED_MICROBATCH", "false")
+    from src.eval.retrieval_eval import load_dataset, evaluate as run_eval, format_report
+
+    report = run_eval(load_dataset(dataset), ks=[int(k) for k in ks.split(",") if k.strip()],
+                      max_context_chars_per_item=max_chars)
+    click.echo("\n" + format_report(report) + "\n")
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        click.echo(f"📝 Report written to {json_out}")
+
+
+# ============================================================
+# Re-embedding migration
+# ============================================================
+@cli.command()
+@click.option("--batch-size", default=100, help="Chunks embedded and upserted per batch")
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation")
+def reembed(batch_size, yes):
+    """
+    Re-embed all processed chunks with the current model's passage
+    convention (e.g. e5 "passage: ") and overwrite them in the index.
+    Run this after changing EMBEDDING_MODEL or upgrading from raw embeddings.
+    """
+    from src.embed.embedder_cache import get_embedder
+    from src.vectorstore.pinecone_cache import get_pinecone_client
+
+    spec = get_embedder().spec
+    click.echo(f"🔁 Re-embedding chunks (convention: {spec.family}, "
+               f"query prefix {spec.query_prefix!r}, passage prefix {spec.passage_prefix!r})")
+    if not yes:
+        click.confirm("Overwrite the vectors in the index?", abort=True)
+    total = get_pinecone_client().upsert_all_chunks(batch_size=batch_size)
+    click.echo(f"✅ Re-embedded {total or 0} chunks")
+
+
+# ============================================================
+# Ingestion daemon
+# ============================================================
+@cli.command("ingest-watch")
+@click.option("--debounce", default=None, type=float, help="Seconds a file must stay unchanged before it is ingested")
+@click.option("--poll", "force_poll", is_flag=True, help="Poll the folder even if watchdog is installed")
+@click.option("--port", default=None, type=int, help="Status endpoint port (0 disables)")
+def ingest_watch(debounce, force_poll, port):
+    """
+    Watch data/ and ingest each new document (extract, chunk, embed,
+    upsert, archive) as soon as it is completely written.
+    """
+    import time
+    from src.ingest.watcher import IngestDaemon, INGEST_DEBOUNCE_SEC, INGEST_STATUS_PORT
+
+    daemon = IngestDaemon(debounce_sec=INGEST_DEBOUNCE_SEC if debounce is None else debounce,
+                          use_watchdog=not force_poll)
+    daemon.start(status_port=INGEST_STATUS_PORT if port is None else port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo("\n⏹️ Stopping...")
+    finally:
+        daemon.stop()
+
+
+# ============================================================
+# ONNX embedding backend
+# ============================================================
+@cli.command("onnx-export")
+@click.option("--out", "out_dir", default=None, help="Output directory (default: processed/onnx/<model>)")
+@click.option("--quantize/--no-quantize", default=True, help="Also write an int8 dynamically quantized model")
+def onnx_export(out_dir, quantize):
+    """Export EMBEDDING_MODEL to ONNX for EMBEDDING_BACKEND=onnx (needs torch)."""
+    from src.embed.onnx_engine import export_onnx
+    export_onnx(out_dir=out_dir, quantize=quantize)
+
+
+@cli.command("onnx-verify")
+@click.option("--dir", "model_dir", default=None, help="Export directory (default: processed/onnx/<model>)")
+@click.option("--quantized/--fp32", default=True, help="Check the int8 model (if present) or the fp32 one")
+@click.option("--min-cosine", default=None, type=float, help="Minimum per-text cosine agreement")
+def onnx_verify(model_dir, quantized, min_cosine):
+    """
+    Compare ONNX vectors with the torch SentenceTransformer ones.
+    Exits non-zero when agreement is too low to keep using the existing index.
+    """
+    from src.embed.onnx_engine import MIN_COSINE, verify_against_torch
+
+    result = verify_against_torch(model_dir, quantized=quantized)
+    if min_cosine is None:
+        min_cosine = MIN_COSINE[result["model_file"]]
+    ok = result["min_cosine"] >= min_cosine
+    click.echo(f"{'✅' if ok else '❌'} {result['model_file']}: min cosine {result['min_cosine']:.5f}, "
+               f"mean {result['mean_cosine']:.5f} (threshold {min_cosine})")
+    if not ok:
+        raise SystemExit(1)
+
+
+# ============================================================
+# Startup import budget
+# ============================================================
+@cli.command("startup-check")
+@click.option("--budget-ms", default=1000, help="Maximum allowed import time for the API module")
+def startup_check(budget_ms):
+    """
+    Measure how long a fresh interpreter takes to import the API app
+    (warmup disabled). Exits non-zero when over budget, so it can gate CI
+    (tests/test_startup.py asserts the same budget).
+    """
+    from src.api.warmup import measure_import
+
+    try:
+        result = measure_import("src.api.app")
+    except RuntimeError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+
+    elapsed = result["ms"]
+    ok = elapsed <= budget_ms
+    click.echo(f"{'✅' if ok else '❌'} src.api.app imported in {elapsed} ms (budget {budget_ms} ms)")
+    if result["heavy"]:
+        click.echo(f"⚠️ Heavy modules imported eagerly: {', '.join(result['heavy'])}")
+    if not ok:
+        raise SystemExit(1)
 
 
 # ============================================================
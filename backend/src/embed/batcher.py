@@ -0,0 +1,98 @@
+"""
+Micro-batching for concurrent query embeddings
+Concurrent requests each embedding one question run N single-item forward
+passes that compete for the same cores. The batcher gathers the questions
+that arrive within EMBED_BATCH_WINDOW_MS (or until EMBED_MAX_BATCH are
+waiting), runs one batched `embed_queries`, and resolves each caller's
+future with its own vector.
+
+Requests that arrive while a batch is being encoded simply form the next
+batch, so the window only needs to be a few milliseconds. The worker thread
+is started lazily and again after a fork.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Optional
+
+
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+
+
+class EmbeddingBatcher:
+    def __init__(self, embedder, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch: int = EMBED_MAX_BATCH):
+        self.embedder = embedder
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.items = 0
+        self._reset()
+
+    def _reset(self):
+        # Fresh primitives per process: a lock held by a thread at fork time
+        # would otherwise stay locked forever in the child
+        self._pid = os.getpid()
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue one question; the future resolves to its embedding (list)."""
+        if self._pid != os.getpid():
+            self._reset()
+        future: Future = Future()
+        with self._cond:
+            self._queue.append((text, future))
+            self._ensure_started()
+            self._cond.notify()
+        return future
+
+    def embed_query(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        return self.submit(text).result(timeout)
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(self.max_batch, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = [(t, f) for t, f in self._next_batch() if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                vectors = self.embedder.embed_queries([t for t, _ in batch])
+            except BaseException as e:
+                for _, f in batch:
+                    f.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, f), vec in zip(batch, vectors):
+                f.set_result(vec)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'pending': len(self._queue),
+        }
@@ -1,7 +1,12 @@
+import os
 import json
-import hashlib
 from pathlib import Path
+from typing import List
 from src.main.settings import EMBEDDING_MODEL, CHUNKS_DIR
+from src.embed.model_registry import get_model_spec
+
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
 
 
 class Embedder:
@@ -11,21 +16,41 @@ class Embedder:
     Design goals:
     - Try to use SentenceTransformer if available.
     - If heavy deps (torch / torchvision / transformers) are broken, fall back
-      to a lightweight deterministic hashing‑based embedder so the backend
-      still starts and responds instead of crashing.
+      to a lightweight feature-hashing embedder so the backend still starts
+      and retrieval still returns related chunks instead of crashing.
     """
 
     def __init__(self):
         self.model = None
         self.dim = 768  # safe default
+        self.backend = "hash"
+        self._fallback = None
+        # Query/passage prefixes expected by the model (e.g. e5)
+        self.spec = get_model_spec(EMBEDDING_MODEL)
+
+        # torch | onnx | auto (ONNX when an exported model exists, else torch)
+        # | hash (feature hashing only, e.g. for fast offline evaluation)
+        requested = os.getenv("EMBEDDING_BACKEND", "auto").lower()
+        if requested == "hash":
+            print("ℹ️ EMBEDDING_BACKEND=hash: using feature-hashing embeddings")
+            return
+        if requested in ("onnx", "auto") and self._load_onnx(required=requested == "onnx"):
+            return
 
         # Try to import SentenceTransformer lazily so import failures don't
         # crash the whole backend at startup.
         try:
             from sentence_transformers import SentenceTransformer  # type: ignore
 
+            # Respect the per-process compute thread budget (see src/api/prefork.py)
+            num_threads = os.getenv("EMBED_NUM_THREADS")
+            if num_threads:
+                import torch  # type: ignore
+                torch.set_num_threads(int(num_threads))
+
             print(f"🔧 Loading embedding model: {EMBEDDING_MODEL}")
             self.model = SentenceTransformer(EMBEDDING_MODEL)
+            self.backend = "torch"
 
             try:
                 self.dim = self.model.get_sentence_embedding_dimension()
@@ -41,15 +66,40 @@ class Embedder:
             # torchvision error). We log and continue with a hash-based embedder.
             print(
                 "⚠️ sentence-transformers could not be imported or initialized.\n"
-                f"   Falling back to lightweight hash-based embeddings. Error: {e}"
+                f"   Falling back to lightweight feature-hashing embeddings. Error: {e}"
             )
             self.model = None
 
+    def _load_onnx(self, required: bool) -> bool:
+        """Load the exported ONNX model (see src/embed/onnx_engine.py)."""
+        from src.embed.onnx_engine import OnnxEmbeddingEngine, default_onnx_dir, CONFIG_FILE
+
+        model_dir = default_onnx_dir()
+        if not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+            if required:
+                print(f"⚠️ EMBEDDING_BACKEND=onnx but no export in {model_dir}. "
+                      "Run: python -m src.cli onnx-export")
+            return False
+        try:
+            engine = OnnxEmbeddingEngine(model_dir)
+        except Exception as e:
+            print(f"⚠️ ONNX embedder could not be initialized, using torch. Error: {e}")
+            return False
+        if engine.config.get("model") != EMBEDDING_MODEL:
+            print(f"⚠️ ONNX export is for {engine.config.get('model')}, not {EMBEDDING_MODEL}; ignoring it.")
+            return False
+
+        self.model = engine
+        self.dim = engine.get_sentence_embedding_dimension()
+        self.backend = "onnx"
+        print(f"✅ ONNX embedder loaded ({engine.model_path.name}, dim {self.dim})")
+        return True
+
     # ---------------------------------------------------------
     # Single text embedding
     # ---------------------------------------------------------
     def embed_text(self, text: str):
-        """Return embedding as a Python list."""
+        """Return embedding as a Python list (raw text, no model prefix)."""
         if not text or not text.strip():
             # Return all-zeros vector to avoid pipeline failure
             return [0.0] * self.dim
@@ -63,48 +113,95 @@ class Embedder:
                 print(f"❌ Embedding failed for text chunk. Error: {e}")
                 return [0.0] * self.dim
 
-        # Fallback: deterministic hash-based embedding (no external deps)
-        h = hashlib.sha256(text.encode("utf-8")).digest()
-        # Repeat hash bytes to fill dim, map to small floats
-        vals = []
-        while len(vals) < self.dim:
-            for b in h:
-                vals.append((b - 128) / 128.0)
-                if len(vals) >= self.dim:
-                    break
-        return vals
+        return self._hash_embed(text)
+
+    def _hash_embed(self, text: str):
+        """Fallback: feature-hashing embedding (NumPy only, see hash_embedder.py)."""
+        return self._hasher().embed(text).tolist()
+
+    def _hasher(self):
+        if self._fallback is None:
+            from src.embed.hash_embedder import HashingEmbedder
+            self._fallback = HashingEmbedder(self.dim)
+        return self._fallback
+
+    # ---------------------------------------------------------
+    # Batched query / passage embedding
+    # ---------------------------------------------------------
+    def _encode_many(self, texts: List[str]) -> List[List[float]]:
+        """Encode non-empty texts in model batches; blanks become zero vectors."""
+        out: List[List[float]] = [[0.0] * self.dim for _ in texts]
+        idx = [i for i, t in enumerate(texts) if t and t.strip()]
+        if not idx:
+            return out
+
+        if self.model is not None:
+            try:
+                vecs = self.model.encode([texts[i] for i in idx], batch_size=EMBED_BATCH_SIZE,
+                                         convert_to_numpy=True)
+                for i, vec in zip(idx, vecs.tolist()):
+                    out[i] = vec
+            except Exception as e:
+                print(f"❌ Batch embedding failed for {len(idx)} texts. Error: {e}")
+            return out
+
+        vecs = self._hasher().embed_batch([texts[i] for i in idx]).tolist()
+        for i, vec in zip(idx, vecs):
+            out[i] = vec
+        return out
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed user questions with the model's query convention."""
+        fmt = self.spec.format_query if self.model is not None else str
+        return self._encode_many([fmt(t) if t and t.strip() else "" for t in texts])
+
+    def embed_passages(self, texts: List[str]) -> List[List[float]]:
+        """Embed document chunks with the model's passage convention."""
+        fmt = self.spec.format_passage if self.model is not None else str
+        return self._encode_many([fmt(t) if t and t.strip() else "" for t in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
 
     # ---------------------------------------------------------
     # Batch embedding for faster ingestion
     # ---------------------------------------------------------
     def embed_batch(self, texts):
         """Batch embed multiple chunks safely."""
-        return [self.embed_text(t or "") for t in texts]
+        return self.embed_passages([t or "" for t in texts])
 
     # ---------------------------------------------------------
     # Load pre-processed chunks for Pinecone ingestion
     # ---------------------------------------------------------
     def load_chunks(self):
         """Yield (chunk_id, text) pairs from chunk JSON files."""
-        chunk_files = list(Path(CHUNKS_DIR).glob("*.json"))
+        for data in self.load_chunk_records():
+            yield data["chunk_id"], data.get("text", "")
 
-        if not chunk_files:
-            print("⚠️ No chunks found in processed/chunks/. Run ingestion first.")
-            return
+    def load_chunk_records(self, chunk_ids=None):
+        """
+        Yield the full chunk JSON dicts (chunk_id, text, source_file(s), ...),
+        for every chunk or only for `chunk_ids`.
+        """
+        if chunk_ids is not None:
+            chunk_files = [Path(CHUNKS_DIR) / f"{cid}.json" for cid in chunk_ids]
+        else:
+            chunk_files = list(Path(CHUNKS_DIR).glob("*.json"))
+
+            if not chunk_files:
+                print("⚠️ No chunks found in processed/chunks/. Run ingestion first.")
+                return
 
-        print(f"📦 Found {len(chunk_files)} chunks.")
+            print(f"📦 Found {len(chunk_files)} chunks.")
 
         for file_path in chunk_files:
             try:
                 data = json.loads(file_path.read_text(encoding="utf-8"))
-                chunk_id = data.get("chunk_id")
-                text = data.get("text", "")
-
-                if not chunk_id:
+                if not data.get("chunk_id"):
                     print(f"⚠️ Missing chunk_id in {file_path.name}, skipping.")
                     continue
 
-                yield chunk_id, text
+                yield data
 
             except Exception as e:
                 print(f"❌ Failed to load chunk file {file_path.name}: {e}")
@@ -3,15 +3,37 @@ Singleton Embedder Cache
 Prevents reloading the embedding model on every request
 """
 
+import os
+import threading
+
 from src.embed.embedder import Embedder
 
 _embedder_instance = None
+_embedder_lock = threading.Lock()
+_batcher_instance = None
+_batcher_lock = threading.Lock()
 
 def get_embedder():
     """Get or create a singleton embedder instance"""
     global _embedder_instance
     if _embedder_instance is None:
-        print("🔧 Initializing embedder (first time only)...")
-        _embedder_instance = Embedder()
-        print("✅ Embedder cached and ready")
+        with _embedder_lock:
+            if _embedder_instance is None:
+                print("🔧 Initializing embedder (first time only)...")
+                _embedder_instance = Embedder()
+                print("✅ Embedder cached and ready")
     return _embedder_instance
+
+
+def get_embedding_batcher():
+    """Shared micro-batcher for query embeddings (None if EMBED_MICROBATCH=false)"""
+    global _batcher_instance
+    if os.getenv("EMBED_MICROBATCH", "true").lower() != "true":
+        return None
+    if _batcher_instance is None:
+        with _batcher_lock:
+            # Two first requests must not each get a batcher: their queries would not batch
+            if _batcher_instance is None:
+                from src.embed.batcher import EmbeddingBatcher
+                _batcher_instance = EmbeddingBatcher(get_embedder())
+    return _batcher_instance
@@ -0,0 +1,102 @@
+"""
+Feature-hashing fallback embedder
+Used when sentence-transformers / ONNX cannot be loaded. Texts sharing words
+and word fragments get similar vectors, so degraded mode still retrieves
+relevant chunks (unlike hashing the whole text, where only exact duplicates
+match).
+
+ - features: word unigrams + bigrams and character 3/4/5-grams (on the
+   lower-cased, whitespace-normalized text)
+ - signed hashing into `dim` buckets, sublinear TF (log1p), L2 normalization
+ - char n-grams of a whole batch are hashed in one NumPy pass; only the
+   word features are hashed per token
+
+Hashes are stable across processes and machines (no Python `hash()`).
+"""
+
+import re
+import zlib
+from typing import List, Sequence
+
+import numpy as np
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_FNV_OFFSET = 0xCBF29CE484222325
+_FNV_PRIME = np.uint64(0x100000001B3)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 768, word_ngrams: Sequence[int] = (1, 2),
+                 char_ngrams: Sequence[int] = (3, 4, 5), char_weight: float = 0.5):
+        self.dim = dim
+        self.word_ngrams = tuple(word_ngrams)
+        self.char_ngrams = tuple(char_ngrams)
+        self.char_weight = char_weight
+
+    # ---------------------------------------------------------
+    # Feature extraction -> (row ids, uint64 hashes, weights)
+    # ---------------------------------------------------------
+    def _word_features(self, tokens: List[List[str]]):
+        rows, hashes = [], []
+        for r, toks in enumerate(tokens):
+            for n in self.word_ngrams:
+                for i in range(len(toks) - n + 1):
+                    rows.append(r)
+                    hashes.append(zlib.crc32(" ".join(toks[i:i + n]).encode("utf-8")) | (n << 32))
+        return (np.asarray(rows, dtype=np.int64), np.asarray(hashes, dtype=np.uint64),
+                np.ones(len(rows), dtype=np.float64))
+
+    def _char_features(self, tokens: List[List[str]]):
+        encoded = [(" " + " ".join(toks) + " ").encode("utf-8") for toks in tokens]
+        buf = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        row = np.repeat(np.arange(len(encoded)), [len(e) for e in encoded])
+
+        rows, hashes = [], []
+        for n in self.char_ngrams:
+            m = len(buf) - n + 1
+            if m <= 0:
+                continue
+            # FNV-1a over the n bytes of every window at once
+            h = np.full(m, _FNV_OFFSET ^ n, dtype=np.uint64)
+            for j in range(n):
+                h = (h ^ buf[j:j + m]) * _FNV_PRIME
+            # Drop windows spanning two texts of the batch
+            same = row[:m] == row[n - 1:]
+            rows.append(row[:m][same])
+            hashes.append(h[same])
+        if not rows:
+            return np.zeros(0, np.int64), np.zeros(0, np.uint64), np.zeros(0)
+        rows, hashes = np.concatenate(rows), np.concatenate(hashes)
+        return rows, hashes, np.full(len(rows), self.char_weight)
+
+    # ---------------------------------------------------------
+    # Public API
+    # ---------------------------------------------------------
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 matrix; blank texts give zero rows."""
+        n_rows = len(texts)
+        if n_rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        tokens = [_WORD_RE.findall((t or "").lower()) for t in texts]
+
+        parts = [self._word_features(tokens), self._char_features(tokens)]
+        rows = np.concatenate([p[0] for p in parts])
+        hashes = np.concatenate([p[1] for p in parts])
+        weights = np.concatenate([p[2] for p in parts])
+
+        h = hashes * _MIX
+        bucket = ((h >> np.uint64(32)) % np.uint64(self.dim)).astype(np.int64)
+        sign = np.where((h >> np.uint64(63)) == 1, -1.0, 1.0)
+
+        mat = np.bincount(rows * self.dim + bucket, weights=sign * weights,
+                          minlength=n_rows * self.dim).reshape(n_rows, self.dim)
+        mat = np.sign(mat) * np.log1p(np.abs(mat))
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        mat = np.divide(mat, norms, out=np.zeros_like(mat), where=norms > 0)
+        return mat.astype(np.float32)
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_batch([text])[0]
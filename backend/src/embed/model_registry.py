@@ -0,0 +1,50 @@
+"""
+Embedding model conventions
+Some embedding models are trained with instruction prefixes and lose
+retrieval quality without them (e5 expects "query: " / "passage: ").
+The Embedder looks up EMBEDDING_MODEL here and applies the right prefix
+for questions vs. document chunks.
+
+Entries are matched on the model name (case-insensitive); the first
+matching pattern wins, unknown models get no prefixes.
+"""
+
+import fnmatch
+from typing import NamedTuple
+
+
+class ModelSpec(NamedTuple):
+    family: str
+    query_prefix: str = ""
+    passage_prefix: str = ""
+
+    def format_query(self, text: str) -> str:
+        return self.query_prefix + text
+
+    def format_passage(self, text: str) -> str:
+        return self.passage_prefix + text
+
+
+_BGE_EN_QUERY = "Represent this sentence for searching relevant passages: "
+
+# (pattern, spec) in priority order
+MODEL_REGISTRY = [
+    ("intfloat/*e5-*instruct*", ModelSpec("e5-instruct",
+                                          "Instruct: Given a question, retrieve passages that answer it\nQuery: ", "")),
+    ("intfloat/*e5-*", ModelSpec("e5", "query: ", "passage: ")),
+    ("baai/bge-*-zh*", ModelSpec("bge-zh", "为这个句子生成表示以用于检索相关文章：", "")),
+    ("baai/bge-m3", ModelSpec("bge-m3")),
+    ("baai/bge-*", ModelSpec("bge", _BGE_EN_QUERY, "")),
+    ("nomic-ai/nomic-embed-text*", ModelSpec("nomic", "search_query: ", "search_document: ")),
+    ("sentence-transformers/*", ModelSpec("sbert")),
+]
+
+_DEFAULT = ModelSpec("plain")
+
+
+def get_model_spec(model_name: str) -> ModelSpec:
+    name = (model_name or "").lower()
+    for pattern, spec in MODEL_REGISTRY:
+        if fnmatch.fnmatch(name, pattern):
+            return spec
+    return _DEFAULT
@@ -0,0 +1,233 @@
+"""
+ONNX Runtime embedding engine
+A torch-free CPU backend for the query embedder (EMBEDDING_BACKEND=onnx).
+
+ - export_onnx: one-off export of the SentenceTransformer model to ONNX
+   (needs torch + sentence-transformers, run offline), optionally with a
+   dynamically int8-quantized copy
+ - OnnxEmbeddingEngine: runs the exported model with onnxruntime and the
+   `tokenizers` library only, reproducing the SentenceTransformer pooling
+   and normalization so vectors match the existing index
+ - verify_against_torch: cosine agreement between both backends
+
+The engine exposes the subset of the SentenceTransformer API the Embedder
+uses (`encode`, `get_sentence_embedding_dimension`), so it is a drop-in.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.main.settings import EMBEDDING_MODEL, PROCESSED_DIR
+
+
+CONFIG_FILE = "embedding_config.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model.int8.onnx"
+
+# Minimum per-text cosine agreement with the torch model for the existing index to stay valid
+MIN_COSINE = {MODEL_FILE: 0.999, QUANTIZED_FILE: 0.98}
+
+_VERIFY_TEXTS = [
+    "query: What vitamins are recommended at 20 weeks of pregnancy?",
+    "query: Is it safe to eat sushi while pregnant?",
+    "passage: Folic acid before and early in pregnancy helps prevent neural tube defects.",
+    "passage: Persistent vomiting that prevents you from keeping down food or fluids "
+    "may be a sign of hyperemesis gravidarum and needs medical attention.",
+    "How much weight gain is normal in the third trimester?",
+]
+
+
+def default_onnx_dir(model_name: str = EMBEDDING_MODEL) -> str:
+    return os.getenv("ONNX_MODEL_DIR") or os.path.join(
+        PROCESSED_DIR, "onnx", model_name.replace("/", "__"))
+
+
+# ---------------------------------------------------------
+# Export (offline, needs torch)
+# ---------------------------------------------------------
+def export_onnx(model_name: str = EMBEDDING_MODEL, out_dir: Optional[str] = None,
+                quantize: bool = True, opset: int = 17) -> str:
+    """Export `model_name` to ONNX in `out_dir`. Returns the directory."""
+    import torch  # type: ignore
+    from sentence_transformers import SentenceTransformer  # type: ignore
+
+    out = Path(out_dir or default_onnx_dir(model_name))
+    out.mkdir(parents=True, exist_ok=True)
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    pooling = next((m for m in st if type(m).__name__ == "Pooling"), None)
+    pooling_mode = "cls" if pooling is not None and getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+    normalize = any(type(m).__name__ == "Normalize" for m in st)
+
+    sample = tokenizer(["hello world"], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: "batch", 1: "seq"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    model_path = out / MODEL_FILE
+    print(f"📦 Exporting {model_name} to {model_path} ...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(hf_model),
+            tuple(sample[k] for k in input_names),
+            str(model_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    tokenizer.save_pretrained(str(out))
+    config = {
+        "model": model_name,
+        "pooling": pooling_mode,
+        "normalize": normalize,
+        "dim": st.get_sentence_embedding_dimension(),
+        "max_seq_length": st.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    (out / CONFIG_FILE).write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType  # type: ignore
+        print("🗜️ Writing int8 dynamically quantized copy ...")
+        quantize_dynamic(str(model_path), str(out / QUANTIZED_FILE), weight_type=QuantType.QInt8)
+
+    print(f"✅ ONNX export ready in {out}")
+    return str(out)
+
+
+# ---------------------------------------------------------
+# Runtime (onnxruntime + tokenizers, no torch)
+# ---------------------------------------------------------
+class OnnxEmbeddingEngine:
+    def __init__(self, model_dir: Optional[str] = None, quantized: Optional[bool] = None,
+                 num_threads: Optional[int] = None):
+        import onnxruntime as ort  # type: ignore
+        from tokenizers import Tokenizer  # type: ignore
+
+        self.model_dir = Path(model_dir or default_onnx_dir())
+        self.config = json.loads((self.model_dir / CONFIG_FILE).read_text(encoding="utf-8"))
+
+        if quantized is None:
+            quantized = os.getenv("EMBED_ONNX_QUANTIZED", "true").lower() == "true"
+        model_path = self.model_dir / QUANTIZED_FILE
+        if not quantized or not model_path.exists():
+            model_path = self.model_dir / MODEL_FILE
+
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path} not found")
+        self.model_path = model_path
+        self._ort = ort
+        self._num_threads = num_threads
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self.input_names: List[str] = []
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(self.config.get("max_seq_length") or 512))
+        self.tokenizer.enable_padding(pad_id=int(self.config.get("pad_token_id") or 0),
+                                      pad_token=self.config.get("pad_token") or "[PAD]")
+
+    def _create_session(self):
+        num_threads = self._num_threads
+        if num_threads is None:
+            num_threads = int(os.getenv("EMBED_NUM_THREADS", "0")) or None
+        ort = self._ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.inter_op_num_threads = 1
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        return ort.InferenceSession(str(self.model_path), opts, providers=["CPUExecutionProvider"])
+
+    @property
+    def session(self):
+        """
+        This process's inference session, created on first use. Under the
+        pre-fork server that is in each worker, after set_compute_threads, so
+        the intra-op pool gets the worker's thread budget and is never
+        inherited across a fork.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = self._create_session()
+                    self.input_names = [i.name for i in session.get_inputs()]
+                    self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.config["dim"])
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        session = self.session
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        feeds = {k: v for k, v in feeds.items() if k in self.input_names}
+
+        hidden = session.run(None, feeds)[0]
+        if self.config.get("pooling") == "cls":
+            pooled = hidden[:, 0]
+        else:
+            m = mask[..., None].astype(hidden.dtype)
+            pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        if self.config.get("normalize"):
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        """SentenceTransformer-compatible encode (str -> 1-D, list -> 2-D)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Batch similar lengths together to minimise padding
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        return out[0] if single else out
+
+
+def verify_against_torch(model_dir: Optional[str] = None, texts: Optional[List[str]] = None,
+                         quantized: Optional[bool] = None) -> Dict[str, float]:
+    """Cosine similarity between ONNX and SentenceTransformer vectors."""
+    from sentence_transformers import SentenceTransformer  # type: ignore
+
+    engine = OnnxEmbeddingEngine(model_dir, quantized=quantized)
+    texts = texts or _VERIFY_TEXTS
+    ref = SentenceTransformer(engine.config["model"], device="cpu").encode(texts, convert_to_numpy=True)
+    got = engine.encode(texts)
+    ref = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    got = got / np.linalg.norm(got, axis=1, keepdims=True)
+    cos = (ref * got).sum(axis=1)
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean()),
+            "model_file": engine.model_path.name}
@@ -0,0 +1,136 @@
+"""
+Offline retrieval evaluation
+Scores retrieval on a labelled set so top_k, CHUNK_SIZE/CHUNK_OVERLAP and the
+embedding model can be tuned on numbers instead of impressions.
+
+Dataset: JSONL, one labelled question per line
+    {"question": "...", "relevant": ["<chunk_id>", ...]}
+Chunk ids are "<file name without extension>__chunk_<n>", the file names in
+processed/chunks (e.g. guide.pdf -> guide__chunk_3).
+`relevant_sources` (file names) may be given instead of chunk ids, which
+keeps a dataset valid across re-chunking. An optional "filter" (metadata,
+see src/vectorstore/filters.py) is applied to that question's retrieval.
+
+Retrieval goes through the pipeline's embed_query/search (same embedder,
+prefixes and vector store as run_rag_pipeline) and prompts through
+_build_context/build_prompt, so latency and prompt size are what a real
+request would see. For a fully local run: VECTOR_STORE=local and optionally
+EMBEDDING_BACKEND=hash.
+
+Every k is a separate search with top_k=k (the query is embedded once): MMR
+and neighbour merging do not return prefix-consistent lists, so the top 3
+of a depth-10 search is not what a top_k=3 request gets.
+
+Reported for every k: recall@k, MRR@k, nDCG@k (binary relevance) and the
+prompt size; plus per-query retrieval latency (mean / p50 / p95) at the
+deepest k.
+"""
+
+import json
+import math
+import time
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from src.rag.pipeline import retrieve, embed_query, search, _build_context, build_prompt
+
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("question") or not (item.get("relevant") or item.get("relevant_sources")):
+                raise ValueError(f"line {n}: needs 'question' and 'relevant' or 'relevant_sources'")
+            items.append(item)
+    return items
+
+
+def _hits(item: Dict[str, Any], retrieved: List[Dict[str, Any]]) -> List[bool]:
+    """Relevance flag per rank; each relevant target counts once."""
+    if item.get("relevant"):
+        targets, key = set(item["relevant"]), "id"
+    else:
+        targets, key = set(item["relevant_sources"]), "source_file"
+    seen, hits = set(), []
+    for r in retrieved:
+        # A merged item (neighbouring chunks) stands for all of its parts, and
+        # a collapsed duplicate for the chunk ids it replaced
+        if key == "id":
+            values = set(r.get("merged_ids") or []) | set(r.get("positions") or []) | {r.get(key)}
+        else:
+            # A collapsed duplicate stands for every source it was found in
+            values = set(r.get("source_files") or []) | {r.get(key)}
+        new = (values & targets) - seen
+        seen |= values
+        hits.append(bool(new))
+    return hits
+
+
+def score_ranking(hits: Sequence[bool], n_relevant: int, k: int) -> Dict[str, float]:
+    top = list(hits[:k])
+    recall = sum(top) / n_relevant if n_relevant else 0.0
+    first = next((i for i, h in enumerate(top) if h), None)
+    mrr = 1.0 / (first + 1) if first is not None else 0.0
+    dcg = sum(1.0 / math.log2(i + 2) for i, h in enumerate(top) if h)
+    idcg = sum(1.0 / math.log2(i + 2) for i in range(min(n_relevant, k)))
+    return {"recall": recall, "mrr": mrr, "ndcg": dcg / idcg if idcg else 0.0}
+
+
+def evaluate(items: List[Dict[str, Any]], ks: Sequence[int] = (1, 3, 5, 10),
+             max_context_chars_per_item: int = 250, warmup: bool = True) -> Dict[str, Any]:
+    ks = sorted(set(ks))
+    depth = ks[-1]
+    if warmup and items:
+        retrieve(items[0]["question"], top_k=1)  # load models outside the timings
+
+    per_k = {k: {"recall": [], "mrr": [], "ndcg": [], "prompt_chars": []} for k in ks}
+    latencies, queries = [], []
+    for item in items:
+        t0 = time.perf_counter()
+        qvec = embed_query(item["question"])
+        embed_ms = (time.perf_counter() - t0) * 1000
+        by_k = {}
+        for k in ks:
+            t1 = time.perf_counter()
+            by_k[k] = search(qvec, top_k=k, filter=item.get("filter"))
+            search_ms = (time.perf_counter() - t1) * 1000
+        latency_ms = embed_ms + search_ms  # what a top_k=depth request waits for
+        latencies.append(latency_ms)
+
+        n_rel = len(set(item.get("relevant") or item.get("relevant_sources")))
+        row = {"question": item["question"], "latency_ms": round(latency_ms, 2),
+               "retrieved": [r.get("id") for r in by_k[depth]]}
+        for k in ks:
+            scores = score_ranking(_hits(item, by_k[k]), n_rel, k)
+            system, prompt = build_prompt(
+                _build_context(by_k[k], max_chars_per_item=max_context_chars_per_item), item["question"])
+            scores["prompt_chars"] = len(system) + len(prompt)
+            for name, value in scores.items():
+                per_k[k][name].append(value)
+            row[f"@{k}"] = {name: round(v, 4) for name, v in scores.items()}
+        queries.append(row)
+
+    lat = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "n": len(items),
+        "metrics": {k: {name: round(float(np.mean(v)), 4) if v else 0.0 for name, v in m.items()}
+                    for k, m in per_k.items()},
+        "latency_ms": {"mean": round(float(lat.mean()), 2),
+                       "p50": round(float(np.percentile(lat, 50)), 2),
+                       "p95": round(float(np.percentile(lat, 95)), 2)},
+        "queries": queries,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"Queries: {report['n']}",
+             "Latency (ms): mean {mean}  p50 {p50}  p95 {p95}".format(**report["latency_ms"]),
+             "",
+             f"{'k':>4} {'recall':>8} {'MRR':>8} {'nDCG':>8} {'prompt chars':>13}"]
+    for k, m in report["metrics"].items():
+        lines.append(f"{k:>4} {m['recall']:>8.3f} {m['mrr']:>8.3f} {m['ndcg']:>8.3f} {m['prompt_chars']:>13.0f}")
+    return "\n".join(lines)
@@ -0,0 +1,129 @@
+"""
+Near-duplicate detection for ingested chunks (MinHash + LSH)
+Partner guidelines repeat whole sections word for word; without this every
+copy is embedded, stored and searched separately.
+
+ - a chunk's shingles are its word 5-grams (lower-cased), hashed to 32 bits
+ - MinHash with NUM_PERM multiply-shift hash functions (64-bit wrapping
+   multiply, top 32 bits kept), vectorized over all shingles of a chunk
+ - LSH banding (BANDS x ROWS) finds candidate pairs without comparing every
+   chunk with every other; candidates are confirmed on the estimated Jaccard
+   similarity (INGEST_DEDUP_THRESHOLD)
+ - signatures of already ingested chunks are cached in
+   processed/minhash_signatures.npz, so each run only hashes new chunks
+"""
+
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+
+# Bump when the signature function changes: cached signatures are then recomputed
+SIGNATURE_VERSION = 2
+
+_MAX_HASH = np.uint32(0xFFFFFFFF)
+_SHIFT = np.uint64(32)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_rng = np.random.RandomState(1_000_003)  # fixed: signatures must be stable across runs
+_A = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+
+def shingles(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    words = _WORD_RE.findall((text or "").lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    if len(words) <= k:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams),
+                                 dtype=np.uint64, count=len(grams)))
+
+
+def minhash(text: str) -> np.ndarray:
+    """NUM_PERM-value signature (uint32). Empty text gives all-max (matches nothing real)."""
+    sh = shingles(text)
+    if len(sh) == 0:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint32)
+    # (a * x + b) mod 2^64, high 32 bits, for every (permutation, shingle); a is odd
+    with np.errstate(over="ignore"):
+        hashed = (_A[:, None] * sh[None, :] + _B[:, None]) >> _SHIFT
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return float(np.mean(sig_a == sig_b))
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.85):
+        self.threshold = threshold
+        self.signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(BANDS)]
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _bands(self, sig: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for b in range(BANDS):
+            yield b, sig[b * ROWS:(b + 1) * ROWS].tobytes()
+
+    def add(self, key: str, sig: np.ndarray):
+        self.signatures[key] = sig
+        for b, band in self._bands(sig):
+            self._buckets[b].setdefault(band, []).append(key)
+
+    def remove(self, key: str):
+        sig = self.signatures.pop(key, None)
+        if sig is None:
+            return
+        for b, band in self._bands(sig):
+            keys = self._buckets[b].get(band)
+            if keys and key in keys:
+                keys.remove(key)
+                if not keys:
+                    del self._buckets[b][band]
+
+    def find(self, sig: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Most similar indexed key at or above the threshold, with its similarity."""
+        candidates = set()
+        for b, band in self._bands(sig):
+            candidates.update(self._buckets[b].get(band, ()))
+        best = None
+        for key in candidates:
+            sim = similarity(sig, self.signatures[key])
+            if sim >= self.threshold and (best is None or sim > best[1]):
+                best = (key, sim)
+        return best
+
+    # ---------------------------------------------------------
+    # Signature cache
+    # ---------------------------------------------------------
+    @staticmethod
+    def load_cache(path: Path) -> Dict[str, np.ndarray]:
+        if not path.exists():
+            return {}
+        try:
+            data = np.load(path, allow_pickle=False)
+            if "version" not in data or int(data["version"]) != SIGNATURE_VERSION:
+                return {}
+            return dict(zip(data["ids"].tolist(), data["sigs"]))
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable MinHash cache {path.name}: {e}")
+            return {}
+
+    def save_cache(self, path: Path):
+        ids = list(self.signatures)
+        sigs = np.stack([self.signatures[i] for i in ids]) if ids else np.zeros((0, NUM_PERM), np.uint32)
+        np.savez(path, ids=np.asarray(ids, dtype=str), sigs=sigs, version=np.asarray(SIGNATURE_VERSION))
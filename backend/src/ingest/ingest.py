@@ -2,15 +2,23 @@ import os
 import json
 import shutil
 from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
 from pypdf import PdfReader
 
 from src.main.settings import (
     DATA_DIR,
+    PROCESSED_DIR,
     CHUNKS_DIR,
     ARCHIVE_DIR,
     CHUNK_SIZE,
-    CHUNK_OVERLAP
+    CHUNK_OVERLAP,
+    INGEST_DEDUP,
+    INGEST_DEDUP_THRESHOLD
 )
+from src.ingest.dedup import NearDuplicateIndex, minhash
+from src.ingest.metadata import document_metadata, chunk_tags
+
+MINHASH_CACHE = Path(PROCESSED_DIR) / "minhash_signatures.npz"
 
 
 # ===============================================================
@@ -73,84 +81,289 @@ def chunk_text(text: str, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     return chunks
 
 
-def save_chunk(chunk_text: str, source: str, index: int):
+def save_chunk(chunk_text: str, source: str, index: int, metadata: Optional[dict] = None):
     """Save chunk into processed/chunks with RAG metadata."""
     chunk_id = f"{source}__chunk_{index}"
 
-    out_path = Path(CHUNKS_DIR) / f"{chunk_id}.json"
-
     data = {
         "chunk_id": chunk_id,
         "source_file": source,
+        "source_files": [source],
+        "positions": [chunk_id],           # where this text sits in each source (see add_duplicate_source)
         "text": chunk_text,
-        "text_snippet": chunk_text[:300]   # ✅ Used by RAG pipeline
+        "text_snippet": chunk_text[:300],  # ✅ Used by RAG pipeline
+        "metadata": metadata or {}         # filterable fields (src/ingest/metadata.py)
     }
+    write_chunk(data)
+    return chunk_id
+
 
+def read_chunk(chunk_id: str) -> Optional[dict]:
     try:
-        out_path.write_text(
+        return json.loads((Path(CHUNKS_DIR) / f"{chunk_id}.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Failed reading chunk {chunk_id}: {e}")
+        return None
+
+
+def write_chunk(data: dict):
+    try:
+        (Path(CHUNKS_DIR) / f"{data['chunk_id']}.json").write_text(
             json.dumps(data, ensure_ascii=False, indent=2),
             encoding="utf-8"
         )
     except Exception as e:
-        print(f"❌ Failed saving chunk {chunk_id}: {e}")
+        print(f"❌ Failed saving chunk {data['chunk_id']}: {e}")
+
+
+def chunk_positions(data: dict) -> list:
+    """Ids this chunk stands for, one per (source, chunk number); chunks saved before positions existed only know their own."""
+    return list(data.get("positions") or [data["chunk_id"]])
+
+
+def load_dedup_index() -> NearDuplicateIndex:
+    """MinHash/LSH index over the chunks already in processed/chunks."""
+    index = NearDuplicateIndex(threshold=INGEST_DEDUP_THRESHOLD)
+    cached = NearDuplicateIndex.load_cache(MINHASH_CACHE)
+    for path in Path(CHUNKS_DIR).glob("*.json"):
+        chunk_id = path.stem
+        sig = cached.get(chunk_id)
+        if sig is None:
+            try:
+                sig = minhash(json.loads(path.read_text(encoding="utf-8")).get("text", ""))
+            except Exception as e:
+                print(f"⚠️ Could not read chunk {path.name} for dedup: {e}")
+                continue
+        index.add(chunk_id, sig)
+    return index
+
+
+def add_duplicate_source(chunk_id: str, source: str, index: int):
+    """Record `source` (its chunk number `index`) on an existing chunk instead of saving a copy."""
+    data = read_chunk(chunk_id)
+    if data is None:
+        return
+    sources = data.get("source_files") or [data.get("source_file")]
+    positions = chunk_positions(data)
+    position = f"{source}__chunk_{index}"
+    if source in sources and position in positions:
+        return
+    if source not in sources:
+        data["source_files"] = sources + [source]
+    if position not in positions:
+        data["positions"] = positions + [position]
+    write_chunk(data)
 
-    return chunk_id
+
+def load_source_refs() -> Dict[str, Set[str]]:
+    """source -> ids of the chunks listing it in source_files (own and collapsed copies)."""
+    refs: Dict[str, Set[str]] = {}
+    for path in Path(CHUNKS_DIR).glob("*.json"):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"⚠️ Could not read chunk {path.name}: {e}")
+            continue
+        for source in data.get("source_files") or [data.get("source_file") or path.stem.split("__")[0]]:
+            refs.setdefault(source, set()).add(path.stem)
+    return refs
+
+
+def remove_chunk(chunk_id: str):
+    try:
+        (Path(CHUNKS_DIR) / f"{chunk_id}.json").unlink()
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Failed removing stale chunk {chunk_id}: {e}")
+
+
+def release_source(source: str, refs: Dict[str, Set[str]],
+                   dedup: Optional[NearDuplicateIndex] = None) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Detach `source` from every chunk that lists it, before it is re-ingested.
+    Returns (chunk ids only `source` used, ids rewritten for the sources left,
+    old ids of chunks moved to another owner).
+
+    A chunk other sources still reference is kept: `source` is dropped from its
+    source_files and positions, and if `source` owned it, it moves to the next
+    source, under the id it would have had there. Chunks only `source` used are
+    taken out of the dedup index, so the new text is not matched against its
+    own old copy; they are overwritten or deleted by the caller.
+    """
+    exclusive, updated, moved = [], [], []
+    prefix = f"{source}__chunk_"
+    for chunk_id in sorted(refs.get(source, ())):
+        data = read_chunk(chunk_id)
+        if data is None:
+            continue
+        others = [s for s in (data.get("source_files") or [data.get("source_file")]) if s != source]
+        if not others:
+            exclusive.append(chunk_id)
+            if dedup is not None:
+                dedup.remove(chunk_id)
+            continue
+        positions = [p for p in chunk_positions(data) if not p.startswith(prefix)]
+        data["source_files"], data["positions"] = others, positions
+        if data.get("source_file") == source:
+            owner = others[0]
+            new_id = next((p for p in positions if p.startswith(f"{owner}__chunk_")),
+                          f"{chunk_id}__{owner}")  # owner's position unknown (chunk predates positions)
+            data["chunk_id"], data["source_file"] = new_id, owner
+            write_chunk(data)
+            remove_chunk(chunk_id)
+            if dedup is not None and chunk_id in dedup.signatures:
+                dedup.add(new_id, dedup.signatures[chunk_id])
+                dedup.remove(chunk_id)
+            for s in others:
+                refs.setdefault(s, set()).discard(chunk_id)
+                refs[s].add(new_id)
+            moved.append(chunk_id)
+            updated.append(new_id)
+        else:
+            write_chunk(data)
+            updated.append(chunk_id)
+    refs[source] = set()
+    return exclusive, updated, moved
 
 
 # ===============================================================
 # Main Ingestion Function
 # ===============================================================
 
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".csv", ".pdf")
+
+
+def ingest_file(file: Path, dedup: Optional[NearDuplicateIndex] = None,
+                refs: Optional[Dict[str, Set[str]]] = None):
+    """
+    Extract, chunk and save one file.
+    Returns (chunk ids written or updated, near-duplicates skipped, chunk ids
+    removed), or None when the file is unsupported or has no text.
+    A re-ingested file replaces its previous chunks (see release_source);
+    chunks other files were collapsed into survive it. `refs`
+    (load_source_refs) is updated in place; pass it to avoid re-reading every
+    chunk when ingesting several files.
+    """
+    ext = file.suffix.lower()
+
+    # -----------------------------------
+    # Step 1: Extract text
+    # -----------------------------------
+    if ext in [".txt", ".md", ".csv"]:
+        text = read_txt(file)
+    elif ext == ".pdf":
+        text = read_pdf(file)
+    else:
+        print(f"⚠️ Unsupported file type: {file.name}, skipping.\n")
+        return None
+
+    # -----------------------------------
+    # Step 2: Chunk
+    # -----------------------------------
+    chunks = chunk_text(text)
+
+    if not chunks:
+        print(f"⚠️ No extractable text found in {file.name}, skipping.\n")
+        return None
+
+    print(f"✅ Extracted {len(chunks)} chunks.")
+    doc_meta = document_metadata(text, file.name)
+
+    # -----------------------------------
+    # Step 3: Save chunks
+    # -----------------------------------
+    if refs is None:
+        refs = load_source_refs()
+    exclusive, touched, removed = release_source(file.stem, refs, dedup)
+
+    skipped = 0
+    for i, chunk in enumerate(chunks):
+        metadata = {**doc_meta, **chunk_tags(chunk)}
+        if dedup is None:
+            chunk_id = save_chunk(chunk, file.stem, i, metadata)
+        else:
+            sig = minhash(chunk)
+            match = dedup.find(sig)
+            if match is not None:
+                # Collapsed: one chunk, several source_files references
+                add_duplicate_source(match[0], file.stem, i)
+                chunk_id = match[0]
+                skipped += 1
+            else:
+                chunk_id = save_chunk(chunk, file.stem, i, metadata)
+                dedup.add(chunk_id, sig)
+        refs[file.stem].add(chunk_id)
+        if chunk_id not in touched:
+            touched.append(chunk_id)
+
+    # Chunks of the previous version that were not rewritten
+    kept = set(touched)
+    stale = [chunk_id for chunk_id in exclusive if chunk_id not in kept]
+    for chunk_id in stale:
+        remove_chunk(chunk_id)
+    if stale:
+        print(f"🧹 Removed {len(stale)} stale chunk(s) of the previous version.")
+
+    # An id the new version reused is live again: its vector must not be deleted
+    return touched, skipped, [chunk_id for chunk_id in removed + stale if chunk_id not in kept]
+
+
+def archive_file(file: Path):
+    """Move an ingested original to the archive folder."""
+    try:
+        shutil.move(str(file), Path(ARCHIVE_DIR) / file.name)
+        print(f"📦 Archived original file: {file.name}\n")
+    except Exception as e:
+        print(f"⚠️ Failed to archive {file.name}: {e}\n")
+
+
+def save_dedup_index(dedup: NearDuplicateIndex):
+    try:
+        dedup.save_cache(MINHASH_CACHE)
+    except Exception as e:
+        print(f"⚠️ Failed saving MinHash cache: {e}")
+
+
 def ingest_files():
-    """Main function: read → chunk → save → archive."""
+    """
+    Main function: read → chunk → save → archive.
+    Returns the ids of chunks removed (or moved to another id) by
+    re-ingested files, so the caller can delete their vectors.
+    """
     data_path = Path(DATA_DIR)
     files = list(data_path.glob("*"))
 
     if not files:
         print("✅ No files in /data folder — add PDFs or TXT files to ingest.")
-        return
+        return []
 
     print(f"📥 Found {len(files)} file(s). Starting ingestion...\n")
 
+    dedup = load_dedup_index() if INGEST_DEDUP else None
+    refs = load_source_refs()
+    skipped = 0
+    removed = []
+
     for file in files:
-        ext = file.suffix.lower()
         print(f"🔍 Processing: {file.name}")
-
-        # -----------------------------------
-        # Step 1: Extract text
-        # -----------------------------------
-        if ext in [".txt", ".md", ".csv"]:
-            text = read_txt(file)
-        elif ext == ".pdf":
-            text = read_pdf(file)
-        else:
-            print(f"⚠️ Unsupported file type: {file.name}, skipping.\n")
+        result = ingest_file(file, dedup, refs)
+        if result is None:
             continue
-
-        # -----------------------------------
-        # Step 2: Chunk
-        # -----------------------------------
-        chunks = chunk_text(text)
-
-        if not chunks:
-            print(f"⚠️ No extractable text found in {file.name}, skipping.\n")
-            continue
-
-        print(f"✅ Extracted {len(chunks)} chunks.")
-
-        # -----------------------------------
-        # Step 3: Save chunks
-        # -----------------------------------
-        for i, chunk in enumerate(chunks):
-            save_chunk(chunk, file.stem, i)
+        skipped += result[1]
+        removed += result[2]
 
         # -----------------------------------
         # Step 4: Archive original file
         # -----------------------------------
-        try:
-            shutil.move(str(file), Path(ARCHIVE_DIR) / file.name)
-            print(f"📦 Archived original file: {file.name}\n")
-        except Exception as e:
-            print(f"⚠️ Failed to archive {file.name}: {e}\n")
+        archive_file(file)
+
+    if dedup is not None:
+        save_dedup_index(dedup)
+        print(f"🧬 Skipped {skipped} near-duplicate chunk(s) "
+              f"(threshold {INGEST_DEDUP_THRESHOLD}).")
 
     print("🎉 Ingestion complete! All files processed.\n")
+    return removed
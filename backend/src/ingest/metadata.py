@@ -0,0 +1,128 @@
+"""
+Metadata extracted at ingestion, used to filter retrieval
+(see src/vectorstore/filters.py)
+
+Document level (once per file):
+ - doc_type: guideline | faq | leaflet | research | other
+ - language: ISO 639-1 code from script / stop words, "unknown" if unsure
+ - year: publication year, when the document states one
+Chunk level:
+ - trimester: preconception | first | second | third | postpartum
+ - topics: nutrition, exercise, mental_health, ... (TOPIC_PATTERNS)
+
+Plain keyword rules: cheap enough to run on every chunk, and predictable
+for the people writing filters.
+"""
+
+import datetime
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+DOC_TYPE_PATTERNS = [
+    ("faq", re.compile(r"\bfaqs?\b|frequently asked|questions? (and|&) answers?", re.I)),
+    ("guideline", re.compile(r"guideline|recommendations?\b|protocol|standard of care|clinical practice", re.I)),
+    ("research", re.compile(r"\babstract\b|\bdoi\b|et al\.|\bmethods\b.*\bresults\b|randomi[sz]ed", re.I | re.S)),
+    ("leaflet", re.compile(r"leaflet|brochure|patient information|fact ?sheet|handout", re.I)),
+]
+
+TRIMESTER_PATTERNS = {
+    "preconception": re.compile(r"pre-?conception|trying to conceive|before (you get )?pregnan", re.I),
+    "first": re.compile(r"first trimester|\b1st trimester|early pregnancy|\bweeks? ([1-9]|1[0-3])\b", re.I),
+    "second": re.compile(r"second trimester|\b2nd trimester|\bweeks? (1[4-9]|2[0-7])\b|anomaly scan", re.I),
+    "third": re.compile(r"third trimester|\b3rd trimester|late pregnancy|\bweeks? (2[89]|3\d|4[0-2])\b|full[- ]term", re.I),
+    "postpartum": re.compile(r"post-?partum|post-?natal|after (the )?(birth|delivery)|puerperi|newborn", re.I),
+}
+
+TOPIC_PATTERNS = {
+    "nutrition": re.compile(r"nutrition|diet|food|folic|iron\b|vitamin|calcium|protein|caffeine", re.I),
+    "exercise": re.compile(r"exercise|physical activity|yoga|walking|pelvic floor", re.I),
+    "mental_health": re.compile(r"depress|anxiety|mental health|mood|stress|baby blues", re.I),
+    "labour": re.compile(r"labou?r\b|contraction|delivery|c-?section|caesarean|cesarean|epidural", re.I),
+    "breastfeeding": re.compile(r"breast ?feed|lactation|latch|breast milk|nursing", re.I),
+    "medication": re.compile(r"medication|medicine|drug|paracetamol|ibuprofen|antibiotic|dose", re.I),
+    "complications": re.compile(r"pre-?eclampsia|gestational diabetes|bleeding|miscarriage|ectopic|"
+                                r"anaemia|anemia|hypertension|placenta", re.I),
+    "vaccination": re.compile(r"vaccin|immuni[sz]|flu jab|tdap|whooping cough", re.I),
+    "sleep": re.compile(r"\bsleep|insomnia|fatigue|tired", re.I),
+    "symptoms": re.compile(r"nausea|morning sickness|heartburn|back ?pain|swelling|cramp|constipation", re.I),
+}
+
+_STOPWORDS = {
+    "en": {"the", "and", "of", "to", "is", "in", "you", "your", "with", "for", "that", "are"},
+    "es": {"el", "la", "de", "que", "y", "en", "los", "las", "por", "con", "para", "embarazo"},
+    "fr": {"le", "la", "les", "de", "et", "des", "est", "vous", "pour", "dans", "une", "grossesse"},
+    "de": {"der", "die", "das", "und", "ist", "sie", "nicht", "mit", "ein", "eine", "schwangerschaft"},
+    "pt": {"o", "a", "os", "de", "que", "e", "do", "da", "em", "para", "com", "gravidez"},
+}
+
+_SCRIPTS = [
+    ("hi", re.compile(r"[ऀ-ॿ]")),
+    ("te", re.compile(r"[ఀ-౿]")),
+    ("ta", re.compile(r"[஀-௿]")),
+    ("kn", re.compile(r"[ಀ-೿]")),
+    ("ml", re.compile(r"[ഀ-ൿ]")),
+    ("bn", re.compile(r"[ঀ-৿]")),
+    ("ar", re.compile(r"[؀-ۿ]")),
+    ("zh", re.compile(r"[一-鿿]")),
+]
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+_YEAR_RE = re.compile(r"\b(19[5-9]\d|20\d\d)\b")
+_DATED_YEAR_RE = re.compile(r"(?:published|publication|copyright|©|\(c\)|revised|updated|issued|edition)"
+                            r"[^\n]{0,40}?\b(19[5-9]\d|20\d\d)\b", re.I)
+
+
+def detect_doc_type(text: str, source: str = "") -> str:
+    head = f"{Path(source).stem.replace('_', ' ').replace('-', ' ')}\n{text[:3000]}"
+    for doc_type, pattern in DOC_TYPE_PATTERNS:
+        if pattern.search(head):
+            return doc_type
+    return "other"
+
+
+def detect_language(text: str) -> str:
+    sample = text[:5000]
+    letters = max(1, len(_WORD_RE.findall(sample)))
+    for lang, pattern in _SCRIPTS:
+        if len(pattern.findall(sample)) >= 20 or len(pattern.findall(sample)) > letters:
+            return lang
+    words = [w.lower() for w in _WORD_RE.findall(sample)]
+    if not words:
+        return "unknown"
+    scores = {lang: sum(w in stop for w in words) for lang, stop in _STOPWORDS.items()}
+    lang, best = max(scores.items(), key=lambda kv: kv[1])
+    return lang if best >= max(3, 0.05 * len(words)) else "unknown"
+
+
+def detect_year(text: str) -> Optional[int]:
+    """Publication year: an explicitly dated mention first, else the latest year in the front matter."""
+    this_year = datetime.date.today().year
+    head = text[:4000]
+    dated = [int(y) for y in _DATED_YEAR_RE.findall(head) if int(y) <= this_year]
+    if dated:
+        return max(dated)
+    years = [int(y) for y in _YEAR_RE.findall(head) if int(y) <= this_year]
+    return max(years) if years else None
+
+
+def _tags(text: str, patterns) -> List[str]:
+    return [name for name, pattern in patterns.items() if pattern.search(text)]
+
+
+def document_metadata(text: str, source: str = "") -> Dict[str, Any]:
+    meta = {"doc_type": detect_doc_type(text, source), "language": detect_language(text)}
+    year = detect_year(text)
+    if year is not None:
+        meta["year"] = year
+    return meta
+
+
+def chunk_tags(text: str) -> Dict[str, List[str]]:
+    return {"trimester": _tags(text, TRIMESTER_PATTERNS), "topics": _tags(text, TOPIC_PATTERNS)}
+
+
+def extract_metadata(text: str, source: str = "") -> Dict[str, Any]:
+    """Both levels from one text (chunks ingested before metadata existed)."""
+    return {**document_metadata(text, source), **chunk_tags(text)}
@@ -0,0 +1,306 @@
+"""
+Watch-folder ingestion daemon (`python -m src.cli ingest-watch`)
+Instead of running ingest_documents.py by hand over the whole data/ folder,
+every file dropped into DATA_DIR goes through extract → chunk → embed →
+upsert → archive as its own small job, so it is searchable seconds later.
+
+ - file events come from watchdog (inotify on Linux) when it is installed,
+   otherwise DATA_DIR is polled every INGEST_POLL_SEC
+ - a file is only picked up once its size and mtime have not changed for
+   INGEST_DEBOUNCE_SEC (copies and downloads still being written are left alone)
+ - one worker processes files in arrival order; a file that fails (including
+   one whose chunks did not all reach the vector store, e.g. Pinecone is not
+   configured) stays in DATA_DIR and is not retried until it changes
+ - GET /status on INGEST_STATUS_PORT reports queue depth, the active job and
+   per-file latency (detected → searchable)
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from src.main.settings import DATA_DIR, INGEST_DEDUP
+
+
+INGEST_DEBOUNCE_SEC = float(os.getenv("INGEST_DEBOUNCE_SEC", "2"))
+INGEST_POLL_SEC = float(os.getenv("INGEST_POLL_SEC", "1"))
+INGEST_STATUS_HOST = os.getenv("INGEST_STATUS_HOST", "127.0.0.1")
+INGEST_STATUS_PORT = int(os.getenv("INGEST_STATUS_PORT", "8765"))  # 0 disables
+INGEST_HISTORY = int(os.getenv("INGEST_HISTORY", "200"))
+
+_TEMP_SUFFIXES = (".part", ".tmp", ".crdownload", ".swp")
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class IngestDaemon:
+    def __init__(self, data_dir: str = DATA_DIR, debounce_sec: float = INGEST_DEBOUNCE_SEC,
+                 poll_sec: float = INGEST_POLL_SEC, use_watchdog: bool = True):
+        self.data_dir = Path(data_dir)
+        self.debounce_sec = debounce_sec
+        self.poll_sec = poll_sec
+        self.use_watchdog = use_watchdog
+        self.mode = "polling"
+
+        self._lock = threading.Lock()
+        # path -> (size, mtime, last change (monotonic), detected (monotonic))
+        self._pending: Dict[str, Tuple[int, float, float, float]] = {}
+        self._queue: "queue.Queue[Tuple[str, float]]" = queue.Queue()
+        self._queued = set()
+        self._failed: Dict[str, Tuple[int, float]] = {}
+        self._active: Optional[Dict[str, Any]] = None
+        self._history: deque = deque(maxlen=INGEST_HISTORY)
+        self._processed = 0
+        self._errors = 0
+        self._started = time.time()
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+        self._server = None
+        self._dedup = None
+        self._refs = None
+        self._store = None
+
+    # ---------------------------------------------------------
+    # Detection + debounce
+    # ---------------------------------------------------------
+    def notify(self, path: str):
+        """A file was created/modified/moved in (or found by a scan of) DATA_DIR."""
+        p = Path(path)
+        if p.parent != self.data_dir or p.name.startswith(".") or p.suffix.lower() in _TEMP_SUFFIXES:
+            return
+        try:
+            st = p.stat()
+        except OSError:
+            return
+        if not p.is_file():
+            return
+        now = time.monotonic()
+        with self._lock:
+            if path in self._queued or self._failed.get(path) == (st.st_size, st.st_mtime):
+                return
+            prev = self._pending.get(path)
+            if prev is None:
+                self._pending[path] = (st.st_size, st.st_mtime, now, now)
+            elif (prev[0], prev[1]) != (st.st_size, st.st_mtime):
+                self._pending[path] = (st.st_size, st.st_mtime, now, prev[3])
+
+    def scan(self):
+        try:
+            entries = list(self.data_dir.iterdir())
+        except OSError as e:
+            print(f"⚠️ Cannot list {self.data_dir}: {e}")
+            return
+        for p in entries:
+            self.notify(str(p))
+
+    def _settle(self):
+        """Move files whose size/mtime stayed put for debounce_sec to the job queue."""
+        now = time.monotonic()
+        with self._lock:
+            pending = list(self._pending.items())
+        for path, (size, mtime, changed, detected) in pending:
+            try:
+                st = os.stat(path)
+            except OSError:
+                with self._lock:
+                    self._pending.pop(path, None)
+                continue
+            with self._lock:
+                if (st.st_size, st.st_mtime) != (size, mtime):
+                    self._pending[path] = (st.st_size, st.st_mtime, now, detected)
+                elif now - changed >= self.debounce_sec and st.st_size > 0:
+                    self._pending.pop(path, None)
+                    self._queued.add(path)
+                    self._queue.put((path, detected))
+
+    def _tick_loop(self):
+        while not self._stop.wait(min(self.poll_sec, self.debounce_sec / 2 or self.poll_sec)):
+            if self.mode == "polling":
+                self.scan()
+            self._settle()
+
+    # ---------------------------------------------------------
+    # Jobs
+    # ---------------------------------------------------------
+    def _process(self, path: str, detected: float) -> Dict[str, Any]:
+        from src.ingest.ingest import (ingest_file, archive_file, load_dedup_index, load_source_refs,
+                                       save_dedup_index)
+        from src.vectorstore.pinecone_cache import get_pinecone_client
+
+        file = Path(path)
+        job = {"file": file.name, "status": "running",
+               "wait_ms": round((time.monotonic() - detected) * 1000, 1)}
+        with self._lock:
+            self._active = job
+        t0 = time.perf_counter()
+        try:
+            if self._store is None:
+                self._store = get_pinecone_client()
+            if INGEST_DEDUP and self._dedup is None:
+                self._dedup = load_dedup_index()
+            if self._refs is None:
+                self._refs = load_source_refs()
+
+            print(f"🔍 Processing: {file.name}")
+            result = ingest_file(file, self._dedup, self._refs)
+            if result is None:
+                raise ValueError("unsupported file type or no extractable text")
+            chunk_ids, skipped, removed = result
+            t1 = time.perf_counter()
+            upserted = self._store.upsert_chunks(chunk_ids)
+            if upserted < len(chunk_ids):
+                # e.g. vector store disabled: the file stays in DATA_DIR, not archived
+                raise RuntimeError(f"only {upserted} of {len(chunk_ids)} chunks reached the vector store")
+            self._store.delete_chunks(removed)
+            t2 = time.perf_counter()
+            archive_file(file)
+            if self._dedup is not None:
+                save_dedup_index(self._dedup)
+            job.update(status="done", chunks=len(chunk_ids), duplicates=skipped, upserted=upserted,
+                       removed=len(removed),
+                       chunk_ms=round((t1 - t0) * 1000, 1), embed_ms=round((t2 - t1) * 1000, 1))
+        except Exception as e:
+            print(f"❌ Ingestion of {file.name} failed: {e}")
+            job.update(status="error", error=str(e))
+            # The job may have stopped half way: re-read the chunks next time
+            self._refs = None
+            try:
+                st = file.stat()
+                with self._lock:
+                    self._failed[path] = (st.st_size, st.st_mtime)
+            except OSError:
+                pass
+        job["process_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        job["latency_ms"] = round((time.monotonic() - detected) * 1000, 1)
+        job["finished_at"] = time.time()
+        return job
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                path, detected = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            job = self._process(path, detected)
+            with self._lock:
+                self._queued.discard(path)
+                self._active = None
+                self._history.append(job)
+                if job["status"] == "done":
+                    self._processed += 1
+                else:
+                    self._errors += 1
+            if job["status"] == "done":
+                print(f"✅ {job['file']} searchable after {job['latency_ms'] / 1000:.1f}s "
+                      f"({job['chunks']} chunks, {job['duplicates']} duplicates)")
+
+    # ---------------------------------------------------------
+    # Status
+    # ---------------------------------------------------------
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            history = list(self._history)
+            done = [j["latency_ms"] for j in history if j["status"] == "done"]
+            return {
+                "mode": self.mode,
+                "watching": str(self.data_dir),
+                "uptime_sec": round(time.time() - self._started, 1),
+                "pending": len(self._pending),
+                "queue_depth": self._queue.qsize(),
+                "active": dict(self._active) if self._active else None,
+                "processed": self._processed,
+                "errors": self._errors,
+                "latency_ms": {"p50": _percentile(done, 0.5), "p95": _percentile(done, 0.95),
+                               "max": max(done) if done else None},
+                "recent": history[-20:][::-1],
+            }
+
+    def _serve_status(self, host: str, port: int):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("/status", ""):
+                    self.send_error(404)
+                    return
+                body = json.dumps(daemon.status(), default=str).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="ingest-status", daemon=True).start()
+        print(f"📊 Status: http://{host}:{port}/status")
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    def _start_watchdog(self) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+
+        daemon = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    daemon.notify(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    daemon.notify(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    daemon.notify(event.dest_path)
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(self.data_dir), recursive=False)
+        self._observer.start()
+        return True
+
+    def start(self, status_host: str = INGEST_STATUS_HOST, status_port: int = INGEST_STATUS_PORT):
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        if self.use_watchdog and self._start_watchdog():
+            self.mode = "inotify" if "inotify" in type(self._observer).__module__ else "watchdog"
+        print(f"👀 Watching {self.data_dir} ({self.mode}, debounce {self.debounce_sec}s)")
+        self.scan()  # files dropped while the daemon was down
+        for target, name in ((self._tick_loop, "ingest-tick"), (self._worker_loop, "ingest-worker")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        if status_port:
+            self._serve_status(status_host, status_port)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+        if self._server is not None:
+            self._server.shutdown()
+        for t in self._threads:
+            t.join(timeout=5)
@@ -1,52 +1,145 @@
+"""
+Ollama LLM client
+ - generate_llm_response: blocking, returns the full answer
+ - generate_llm_stream: yields text chunks as they arrive
+ - LLMStream: the same, but cancellable from another thread (closing the
+   HTTP response makes Ollama stop generating)
+
+Prefix caching (LLM_PREFIX_CACHE=true, default):
+ - `keep_alive` keeps the model resident between requests
+ - the static persona is sent as Ollama's `system` field, so every request
+   starts with the same token prefix and the KV cache can be reused
+ - LLM_CONTEXT_REUSE=true (off by default): with a `session_id` (the chat
+   id), the `context` tokens Ollama returns are fed back on the next turn,
+   so only the new tokens need prefill. Those tokens hold every earlier
+   turn's RAG passages and answer, so they crowd num_ctx and can steer the
+   answer with stale sources; the system prompt prefix alone is reused
+   without them
+
+Requests are routed through the endpoint pool (OLLAMA_URLS); a connection
+error fails over to the next endpoint as long as nothing was streamed yet.
+"""
+
 import os
+import json
+import threading
+from contextlib import contextmanager
+
 import requests
 
-def generate_llm_response(prompt: str) -> str:
-    url = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434") + "/api/generate"
+from src.llm.ollama_pool import get_ollama_pool
+from src.main.ttl_cache import TTLCache
+
+
+# session_id -> (endpoint url, context tokens returned by the previous generation)
+_session_contexts = TTLCache(
+    maxsize=int(os.getenv("LLM_CONTEXT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("LLM_CONTEXT_CACHE_TTL_SEC", "1800")),
+)
+
+
+def _prefix_cache_enabled() -> bool:
+    return os.getenv("LLM_PREFIX_CACHE", "true").lower() == "true"
+
+
+def _context_reuse_enabled() -> bool:
+    return _prefix_cache_enabled() and os.getenv("LLM_CONTEXT_REUSE", "false").lower() == "true"
 
-    model = os.getenv("LLM_MODEL", "phi3:mini")
-    num_predict = int(os.getenv("LLM_NUM_PREDICT", "450"))
-    temperature = float(os.getenv("LLM_TEMPERATURE", "0.25"))
-    top_k = int(os.getenv("LLM_TOP_K", "30"))
-    top_p = float(os.getenv("LLM_TOP_P", "0.9"))
-    num_ctx = int(os.getenv("LLM_NUM_CTX", "2048"))
-    num_thread = int(os.getenv("LLM_NUM_THREAD", "4"))
-    repeat_penalty = float(os.getenv("LLM_REPEAT_PENALTY", "1.15"))
 
+def _options() -> dict:
+    return {
+        "num_predict": int(os.getenv("LLM_NUM_PREDICT", "450")),
+        "temperature": float(os.getenv("LLM_TEMPERATURE", "0.25")),
+        "top_k": int(os.getenv("LLM_TOP_K", "30")),
+        "top_p": float(os.getenv("LLM_TOP_P", "0.9")),
+        "num_ctx": int(os.getenv("LLM_NUM_CTX", "2048")),
+        "num_thread": int(os.getenv("LLM_NUM_THREAD", "4")),
+        "repeat_penalty": float(os.getenv("LLM_REPEAT_PENALTY", "1.15")),
+    }
+
+
+def _build_payload(prompt: str, stream: bool, system: str = None, session_id: str = None,
+                   base_url: str = None) -> dict:
+    options = _options()
     payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "num_predict": num_predict,
-            "temperature": temperature,
-            "top_k": top_k,
-            "top_p": top_p,
-            "num_ctx": num_ctx,
-            "num_thread": num_thread,
-            "repeat_penalty": repeat_penalty
-        }
+        "model": os.getenv("LLM_MODEL", "phi3:mini"),
+        "stream": stream,
+        "options": options,
     }
 
-    try:
-        response = requests.post(url, json=payload, timeout=120)
-        response.raise_for_status()
+    if not _prefix_cache_enabled():
+        payload["prompt"] = (system or "") + prompt
+        return payload
+
+    payload["keep_alive"] = os.getenv("LLM_KEEP_ALIVE", "30m")
+    payload["prompt"] = prompt
 
-        # Ollama sometimes returns NDJSON even when stream=False
-        text = response.text.strip()
+    cached = _session_contexts.get(session_id) if session_id and _context_reuse_enabled() else None
+    # Context tokens only mean something to the process that produced them
+    context = cached[1] if cached and cached[0] == base_url else None
+    # Rough budget check (~4 chars per token); start over when the carried
+    # context would push the request past num_ctx.
+    if context and len(context) + len(prompt) // 4 + options["num_predict"] < options["num_ctx"]:
+        # The system prompt is already part of the cached context tokens
+        payload["context"] = context
+    elif system:
+        payload["system"] = system
+    return payload
 
-        # Split possible NDJSON lines
-        if "\n" in text:
+
+def _remember_context(session_id: str, base_url: str, obj: dict):
+    if session_id and _context_reuse_enabled() and obj.get("context"):
+        _session_contexts.set(session_id, (base_url, obj["context"]))
+
+
+@contextmanager
+def _generate_request(prompt: str, stream: bool, system: str, session_id: str):
+    """
+    POST /api/generate to the best pool endpoint, failing over on connection
+    errors. Yields (endpoint, response); the endpoint lease (its outstanding
+    count) is held until the `with` body is done reading the response.
+    """
+    pool = get_ollama_pool()
+    tried = set()
+    while True:
+        with pool.lease(session_id, exclude=tried) as ep:
+            payload = _build_payload(prompt, stream=stream, system=system,
+                                     session_id=session_id, base_url=ep.url)
             try:
-                import json
-                last = json.loads(text.splitlines()[-1])
-                return last.get("response", "").strip()
-            except:
-                pass
+                r = ep.session.post(ep.url + "/api/generate", json=payload, stream=stream, timeout=120)
+            except requests.exceptions.ConnectionError as e:
+                pool.mark_down(ep, e)
+                tried.add(ep.url)
+                if len(tried) >= len(pool):
+                    raise
+                continue
+            pool.mark_up(ep)
+            with r:
+                yield ep, r
+            return
 
-        # Normal JSON case
-        data = response.json()
-        return data.get("response", "").strip()
+
+def generate_llm_response(prompt: str, system: str = None, session_id: str = None) -> str:
+    try:
+        with _generate_request(prompt, False, system, session_id) as (ep, response):
+            response.raise_for_status()
+
+            # Ollama sometimes returns NDJSON even when stream=False
+            text = response.text.strip()
+
+            # Split possible NDJSON lines
+            if "\n" in text:
+                try:
+                    last = json.loads(text.splitlines()[-1])
+                    _remember_context(session_id, ep.url, last)
+                    return last.get("response", "").strip()
+                except:
+                    pass
+
+            # Normal JSON case
+            data = response.json()
+            _remember_context(session_id, ep.url, data)
+            return data.get("response", "").strip()
 
     except requests.exceptions.Timeout:
         return ("I apologize, but I'm taking longer than expected to respond. "
@@ -60,47 +153,62 @@ def generate_llm_response(prompt: str) -> str:
         return f"I encountered an unexpected error: {str(e)}. Please try again or contact support."
 
 
-def generate_llm_stream(prompt: str):
+class LLMStream:
+    """
+    Iterable of assistant text chunks. cancel() may be called from any thread:
+    it closes the upstream response, which makes Ollama abort the generation
+    and frees the endpoint for the next request.
+    """
+
+    def __init__(self, prompt: str, system: str = None, session_id: str = None):
+        self.prompt = prompt
+        self.system = system
+        self.session_id = session_id
+        self._response = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        r = self._response
+        if r is not None:
+            try:
+                r.close()
+            except Exception:
+                pass
+
+    def __iter__(self):
+        try:
+            with _generate_request(self.prompt, True, self.system, self.session_id) as (ep, r):
+                self._response = r
+                if self.cancelled:
+                    return
+                r.raise_for_status()
+                for line in r.iter_lines(decode_unicode=True):
+                    if self.cancelled:
+                        return
+                    if not line:
+                        continue
+                    # Ollama streams NDJSON lines
+                    try:
+                        obj = json.loads(line)
+                        if 'response' in obj and obj['response']:
+                            yield obj['response']
+                        if obj.get('done'):
+                            _remember_context(self.session_id, ep.url, obj)
+                            break
+                    except Exception:
+                        # ignore malformed line
+                        continue
+        except Exception as e:
+            if self.cancelled:
+                return
+            yield f"[stream-error] {str(e)}"
+
+
+def generate_llm_stream(prompt: str, system: str = None, session_id: str = None):
     """Yield assistant text chunks from Ollama as they arrive."""
-    url = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434") + "/api/generate"
-    model = os.getenv("LLM_MODEL", "phi3:mini")
-    num_predict = int(os.getenv("LLM_NUM_PREDICT", "450"))
-    temperature = float(os.getenv("LLM_TEMPERATURE", "0.25"))
-    top_k = int(os.getenv("LLM_TOP_K", "30"))
-    top_p = float(os.getenv("LLM_TOP_P", "0.9"))
-    num_ctx = int(os.getenv("LLM_NUM_CTX", "2048"))
-    num_thread = int(os.getenv("LLM_NUM_THREAD", "4"))
-    repeat_penalty = float(os.getenv("LLM_REPEAT_PENALTY", "1.15"))
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": True,
-        "options": {
-            "num_predict": num_predict,
-            "temperature": temperature,
-            "top_k": top_k,
-            "top_p": top_p,
-            "num_ctx": num_ctx,
-            "num_thread": num_thread,
-            "repeat_penalty": repeat_penalty
-        }
-    }
-    try:
-        with requests.post(url, json=payload, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            for line in r.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                # Ollama streams NDJSON lines
-                try:
-                    import json
-                    obj = json.loads(line)
-                    if 'response' in obj and obj['response']:
-                        yield obj['response']
-                    if obj.get('done'):
-                        break
-                except Exception:
-                    # ignore malformed line
-                    continue
-    except Exception as e:
-        yield f"[stream-error] {str(e)}"
+    yield from LLMStream(prompt, system=system, session_id=session_id)
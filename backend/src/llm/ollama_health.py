@@ -1,7 +1,11 @@
 """
 Ollama Health Check
 Verifies Ollama is responsive before sending queries.
-Respects OLLAMA_URL env so backend + llm client stay in sync.
+Respects OLLAMA_URL / OLLAMA_URLS env so backend + llm client stay in sync.
+
+Request handlers get the endpoint pool's recorded state (ollama_pool.py),
+which generations and background re-probes keep current, so a chat turn
+never waits on HTTP probes; only a `base_url` check goes to the network.
 """
 
 import os
@@ -12,13 +16,29 @@ def _base_url() -> str:
     return os.getenv("OLLAMA_URL", "http://127.0.0.1:11434").rstrip("/")
 
 
-def check_ollama_health(timeout=5):
+def get_ollama_urls():
+    """
+    All configured Ollama base URLs.
+    OLLAMA_URLS is a comma-separated pool; falls back to the single OLLAMA_URL.
+    """
+    urls = [u.strip().rstrip("/") for u in os.getenv("OLLAMA_URLS", "").split(",") if u.strip()]
+    return urls or [_base_url()]
+
+
+def check_ollama_health(timeout=5, base_url=None):
     """
     Check if Ollama is running and responsive.
+    Without `base_url`, answers from the endpoint pool's state: healthy if
+    any configured endpoint is (no probe on the caller's thread).
+    With `base_url`, probes that endpoint.
     Returns: (is_healthy: bool, message: str)
     """
+    if base_url is None:
+        from src.llm.ollama_pool import get_ollama_pool
+        return get_ollama_pool().health()
+
     try:
-        url = f"{_base_url()}/api/tags"
+        url = f"{base_url}/api/tags"
         response = requests.get(url, timeout=timeout)
         if response.status_code == 200:
             return True, "Ollama is running"
@@ -32,13 +52,13 @@ def check_ollama_health(timeout=5):
         return False, f"Ollama health check failed: {str(e)}"
 
 
-def get_loaded_models(timeout=5):
+def get_loaded_models(timeout=5, base_url=None):
     """
     Get list of loaded models from Ollama.
     Returns: list of model names or empty list.
     """
     try:
-        url = f"{_base_url()}/api/tags"
+        url = f"{base_url or get_ollama_urls()[0]}/api/tags"
         response = requests.get(url, timeout=timeout)
         if response.status_code == 200:
             data = response.json()
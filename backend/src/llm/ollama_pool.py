@@ -0,0 +1,192 @@
+"""
+Ollama endpoint pool
+Spreads generations over several local Ollama processes (OLLAMA_URLS).
+
+ - least-outstanding-requests routing among healthy endpoints
+ - sticky routing per chat (session_id) so the endpoint that holds the
+   chat's KV cache / context tokens serves the next turn as well
+ - an endpoint that refuses a connection is marked down and re-probed
+   with check_ollama_health every OLLAMA_RETRY_SEC by one background thread
+   per process (started on the first failure), never on a request thread
+ - health() answers from this state for request handlers, and probe_all()
+   checks every endpoint at startup
+ - each endpoint keeps its own requests.Session (warm keep-alive sockets)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+import requests
+
+from src.llm.ollama_health import check_ollama_health, get_ollama_urls
+from src.main.ttl_cache import TTLCache
+
+
+OLLAMA_RETRY_SEC = float(os.getenv("OLLAMA_RETRY_SEC", "15"))
+
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.down_since = 0.0
+        self.failures = 0
+        self.served = 0
+        self.last_error = None
+        self.session = requests.Session()
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "failures": self.failures,
+        }
+
+
+class OllamaPool:
+    def __init__(self, urls: Optional[List[str]] = None, retry_after: float = OLLAMA_RETRY_SEC):
+        self.endpoints = [Endpoint(u) for u in (urls or get_ollama_urls())]
+        self.retry_after = retry_after
+        self._sticky = TTLCache(maxsize=4096, ttl=float(os.getenv("LLM_CONTEXT_CACHE_TTL_SEC", "1800")))
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+        self._prober_pid = None
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    # ---------------------------------------------------------
+    # Health tracking
+    # ---------------------------------------------------------
+    def _probe_due(self) -> List[Endpoint]:
+        now = time.monotonic()
+        return [e for e in self.endpoints
+                if not e.healthy and now - e.down_since >= self.retry_after]
+
+    def _reprobe(self):
+        """Re-check endpoints that have been down long enough (outside the lock)."""
+        with self._lock:
+            due = self._probe_due()
+            for e in due:
+                e.down_since = time.monotonic()  # next probe one interval from now
+        for e in due:
+            ok, _ = check_ollama_health(timeout=2, base_url=e.url)
+            if ok:
+                self.mark_up(e)
+
+    def _ensure_prober(self):
+        """Start the re-probe thread (again after a fork); call with the lock held."""
+        if self._prober is not None and self._prober.is_alive() and self._prober_pid == os.getpid():
+            return
+        self._prober_pid = os.getpid()
+        self._prober = threading.Thread(target=self._probe_loop, name="ollama-reprobe", daemon=True)
+        self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(max(0.05, self.retry_after / 4))
+            try:
+                self._reprobe()
+            except Exception as e:
+                print(f"⚠️ Ollama re-probe failed: {e}")
+
+    def probe_all(self, timeout: float = 2):
+        """Probe every endpoint now and record the result (startup warmup)."""
+        for e in self.endpoints:
+            ok, msg = check_ollama_health(timeout=timeout, base_url=e.url)
+            if ok:
+                self.mark_up(e)
+            else:
+                self.mark_down(e, msg)
+
+    def healthy_count(self) -> int:
+        with self._lock:
+            return sum(1 for e in self.endpoints if e.healthy)
+
+    def health(self):
+        """(is_healthy, message) from the recorded endpoint state."""
+        with self._lock:
+            healthy = sum(1 for e in self.endpoints if e.healthy)
+            error = next((e.last_error for e in self.endpoints if e.last_error), None)
+        if healthy == len(self.endpoints) == 1:
+            return True, "Ollama is running"
+        if healthy:
+            return True, f"Ollama is running ({healthy}/{len(self.endpoints)} endpoints healthy)"
+        return False, error or "Cannot connect to Ollama. Please start it with: ollama serve"
+
+    def mark_down(self, endpoint: Endpoint, error=None):
+        with self._lock:
+            if endpoint.healthy:
+                print(f"⚠️ Ollama endpoint {endpoint.url} marked down: {error}")
+            endpoint.last_error = str(error) if error else None
+            endpoint.healthy = False
+            endpoint.down_since = time.monotonic()
+            endpoint.failures += 1
+            self._ensure_prober()
+
+    def mark_up(self, endpoint: Endpoint):
+        with self._lock:
+            if not endpoint.healthy:
+                print(f"✅ Ollama endpoint {endpoint.url} is back")
+            endpoint.healthy = True
+            endpoint.last_error = None
+
+    # ---------------------------------------------------------
+    # Routing
+    # ---------------------------------------------------------
+    def _pick(self, session_id: Optional[str], exclude: Iterable[str]) -> Optional[Endpoint]:
+        candidates = [e for e in self.endpoints if e.url not in exclude]
+        if not candidates:
+            return None
+        healthy = [e for e in candidates if e.healthy]
+
+        if session_id:
+            url = self._sticky.get(session_id)
+            for e in healthy:
+                if e.url == url:
+                    return e
+
+        # Nothing known to be healthy: try anyway, the caller fails over
+        pool = healthy or candidates
+        return min(pool, key=lambda e: (e.outstanding, e.served))
+
+    @contextmanager
+    def lease(self, session_id: Optional[str] = None, exclude: Iterable[str] = ()):
+        """Reserve the best endpoint for one request."""
+        with self._lock:
+            endpoint = self._pick(session_id, set(exclude))
+            if endpoint is None:
+                raise requests.exceptions.ConnectionError("No Ollama endpoints left to try")
+            endpoint.outstanding += 1
+            endpoint.served += 1
+        if session_id:
+            self._sticky.set(session_id, endpoint.url)
+        try:
+            yield endpoint
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [e.as_dict() for e in self.endpoints]
+
+
+_pool_instance = None
+_pool_lock = threading.Lock()
+
+
+def get_ollama_pool() -> OllamaPool:
+    """Get or create the process-wide endpoint pool."""
+    global _pool_instance
+    if _pool_instance is None:
+        with _pool_lock:
+            if _pool_instance is None:
+                _pool_instance = OllamaPool()
+    return _pool_instance
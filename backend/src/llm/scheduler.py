@@ -0,0 +1,193 @@
+"""
+LLM request scheduler
+Ollama on a CPU box serves one or two generations efficiently; everything
+beyond that only slows every request down until they all time out.
+
+ - at most LLM_MAX_CONCURRENCY generations run at once per process; by
+   default (0) that is the number of healthy Ollama endpoints, one
+   generation each. Under the pre-fork server every worker has its own
+   scheduler, so the box-wide cap is API_WORKERS x this
+ - up to LLM_MAX_QUEUE requests wait in a priority queue (FIFO within a
+   priority); anything beyond that is rejected immediately (HTTP 429)
+ - a request that waits longer than LLM_QUEUE_TIMEOUT_SEC gives up (HTTP 503)
+ - waiters can observe their queue position, e.g. to forward it over SSE
+"""
+
+import bisect
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))  # 0 = healthy endpoints
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+LLM_QUEUE_TIMEOUT_SEC = float(os.getenv("LLM_QUEUE_TIMEOUT_SEC", "90"))
+
+
+class SchedulerRejected(Exception):
+    """Base class for requests the scheduler refuses to run."""
+    status_code = 503
+    retry_after = 5
+
+
+class QueueFullError(SchedulerRejected):
+    status_code = 429
+
+
+class QueueTimeoutError(SchedulerRejected):
+    status_code = 503
+
+
+class Ticket:
+    """A queued or running LLM request."""
+
+    __slots__ = ("priority", "seq", "granted", "done")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.done = False
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SEC):
+        self.max_concurrent = max(0, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._waiting = []  # sorted list of Tickets
+        self._active = 0
+        self._seq = itertools.count()
+
+    def _limit(self) -> int:
+        if self.max_concurrent:
+            return self.max_concurrent
+        from src.llm.ollama_pool import get_ollama_pool
+        return max(1, get_ollama_pool().healthy_count())
+
+    # ---------------------------------------------------------
+    # Queue management
+    # ---------------------------------------------------------
+    def enqueue(self, priority: int = PRIORITY_INTERACTIVE) -> Ticket:
+        """Admit a request or raise QueueFullError straight away."""
+        with self._cond:
+            ticket = Ticket(priority, next(self._seq))
+            if self._active < self._limit() and not self._waiting:
+                ticket.granted = True
+                self._active += 1
+                return ticket
+            if len(self._waiting) >= self.max_queue:
+                raise QueueFullError("The assistant is busy right now. Please try again in a moment.")
+            bisect.insort(self._waiting, ticket)
+            return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """0 once the ticket may run, otherwise its 1-based queue position."""
+        with self._cond:
+            return self._position(ticket)
+
+    def _position(self, ticket: Ticket) -> int:
+        if ticket.granted or ticket.done:
+            return 0
+        return bisect.bisect_left(self._waiting, ticket) + 1
+
+    def wait(self, ticket: Ticket, timeout: Optional[float] = None,
+             poll: Optional[float] = None) -> Iterator[int]:
+        """
+        Block until `ticket` may run, yielding its queue position whenever it
+        changes (and every `poll` seconds, so callers can send heartbeats).
+        Raises QueueTimeoutError, dropping the ticket, when `timeout` expires.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        last = None
+        while True:
+            with self._cond:
+                if not ticket.granted and self._active < self._limit():
+                    self._dispatch()  # the cap grew (an endpoint came back)
+                if ticket.granted:
+                    return
+                pos = self._position(ticket)
+                if pos == last:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._drop(ticket)
+                        raise QueueTimeoutError("Timed out waiting for the assistant. Please try again.")
+                    self._cond.wait(remaining if poll is None else min(remaining, poll))
+                    if ticket.granted:
+                        return
+                    pos = self._position(ticket)
+                    if pos == last and poll is None:
+                        continue
+            last = pos
+            yield pos
+
+    def release(self, ticket: Ticket):
+        """Free a running slot or leave the queue. Safe to call twice."""
+        with self._cond:
+            self._drop(ticket)
+
+    def _drop(self, ticket: Ticket):
+        if ticket.done:
+            return
+        ticket.done = True
+        if ticket.granted:
+            self._active -= 1
+        else:
+            i = bisect.bisect_left(self._waiting, ticket)
+            if i < len(self._waiting) and self._waiting[i] is ticket:
+                del self._waiting[i]
+        self._dispatch()
+
+    def _dispatch(self):
+        limit = self._limit()
+        while self._waiting and self._active < limit:
+            nxt = self._waiting.pop(0)
+            nxt.granted = True
+            self._active += 1
+        self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        """Blocking helper: hold a generation slot for the `with` body."""
+        ticket = self.enqueue(priority)
+        try:
+            for _ in self.wait(ticket, timeout=timeout):
+                pass
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": len(self._waiting),
+                "max_concurrent": self._limit(),
+                "max_queue": self.max_queue,
+            }
+
+
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get or create the process-wide scheduler."""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        with _scheduler_lock:
+            if _scheduler_instance is None:
+                _scheduler_instance = LLMScheduler()
+    return _scheduler_instance
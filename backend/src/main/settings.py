@@ -31,6 +31,10 @@ LLM_MODEL = os.getenv("LLM_MODEL", "phi3:mini")             # Consistent with RE
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
 
+# Near-duplicate chunks across the corpus are collapsed at ingestion
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "true").lower() == "true"
+INGEST_DEDUP_THRESHOLD = float(os.getenv("INGEST_DEDUP_THRESHOLD", "0.85"))
+
 # ================================
 # PATH SETTINGS
 # ================================
@@ -73,4 +77,6 @@ __all__ = [
     "LLM_MODEL",
     "CHUNK_SIZE",
     "CHUNK_OVERLAP",
+    "INGEST_DEDUP",
+    "INGEST_DEDUP_THRESHOLD",
 ]
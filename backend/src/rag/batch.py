@@ -0,0 +1,99 @@
+"""
+Batch question answering for bulk / offline workloads
+(/api/query/batch and `python -m src.cli batch`)
+
+ - all questions are embedded in one batched call
+ - vector searches run concurrently (BATCH_SEARCH_WORKERS)
+ - at most BATCH_LLM_CONCURRENCY generations are queued at a time, at batch
+   priority, so interactive chat requests always go first; a full LLM queue
+   is retried after its Retry-After instead of failing the item
+ - results are yielded as each answer completes (not in input order); every
+   result carries the `index` of its question
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List
+
+from src.embed.embedder_cache import get_embedder
+from src.llm.llm_ollama import generate_llm_response
+from src.llm.scheduler import get_llm_scheduler, PRIORITY_BATCH, QueueFullError
+from src.rag.pipeline import search, _build_context, build_prompt, NO_CONTEXT_ANSWER
+
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_SEARCH_WORKERS = int(os.getenv("BATCH_SEARCH_WORKERS", "8"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "1"))
+# Batch items may wait behind interactive traffic for a long time
+BATCH_QUEUE_TIMEOUT_SEC = float(os.getenv("BATCH_QUEUE_TIMEOUT_SEC", "3600"))
+
+
+def _generate(prompt: str, system: str) -> str:
+    scheduler = get_llm_scheduler()
+    while True:
+        try:
+            with scheduler.slot(priority=PRIORITY_BATCH, timeout=BATCH_QUEUE_TIMEOUT_SEC):
+                return generate_llm_response(prompt, system=system)
+        except QueueFullError as e:
+            time.sleep(e.retry_after)
+
+
+def _answer(item: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        if item.get("error"):
+            return item
+        if not item["sources"]:
+            item["answer"] = NO_CONTEXT_ANSWER
+        else:
+            context = _build_context(item["sources"], max_chars_per_item=max_chars)
+            system, prompt = build_prompt(context, item["question"])
+            item["answer"] = _generate(prompt, system)
+    except Exception as e:
+        item["answer"], item["error"] = None, f"generation failed: {e}"
+    item["timings"]["generate_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return item
+
+
+def run_batch(questions: List[str], top_k: int = 4, max_context_chars_per_item: int = 250,
+              llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+              filter: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Answer `questions`, yielding one result dict per question as it finishes.
+    `filter` (metadata, see src/vectorstore/filters.py) applies to every question.
+    """
+    t0 = time.perf_counter()
+    vectors = get_embedder().embed_queries(questions)
+    embed_ms = round((time.perf_counter() - t0) * 1000 / max(1, len(questions)), 2)
+
+    def retrieve_one(i: int) -> Dict[str, Any]:
+        item = {"index": i, "question": questions[i], "sources": [],
+                "timings": {"embed_ms": embed_ms}}
+        t = time.perf_counter()
+        try:
+            item["sources"] = search(vectors[i], top_k=top_k, filter=filter)
+            item["partial"] = item["sources"].partial
+        except Exception as e:
+            item["answer"], item["error"] = None, f"retrieval failed: {e}"
+        item["timings"]["search_ms"] = round((time.perf_counter() - t) * 1000, 1)
+        return item
+
+    searches = ThreadPoolExecutor(max_workers=max(1, BATCH_SEARCH_WORKERS), thread_name_prefix="batch-search")
+    llm = ThreadPoolExecutor(max_workers=max(1, llm_concurrency), thread_name_prefix="batch-llm")
+    try:
+        # One wait loop over both stages: a generation is queued as soon as its
+        # search returns, and an answer is yielded while other searches still run
+        search_index = {searches.submit(retrieve_one, i): i for i in range(len(questions))}
+        pending = set(search_index)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f in search_index:
+                    pending.add(llm.submit(_answer, f.result(), max_context_chars_per_item))
+                else:
+                    yield f.result()
+    finally:
+        # Consumer gone (e.g. client disconnected): drop the work not yet started
+        searches.shutdown(wait=False, cancel_futures=True)
+        llm.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,122 @@
+"""
+Conversation-aware query condensation
+Turns follow-up questions ("what about in the third trimester?") into a
+standalone retrieval query using the recent user turns of the chat.
+
+ - no LLM call: follow-ups are detected heuristically and expanded with the
+   previous condensed query, so retrieval stays a single embed per turn
+ - the last condensed query and recent turns are cached per chat; on a cache
+   miss the history is fetched with one indexed, projected Mongo query
+ - the LLM still sees the user's original wording; only retrieval changes
+"""
+
+import os
+import re
+from typing import List, Optional
+
+from src.main.ttl_cache import TTLCache
+
+
+CONDENSE_HISTORY_TURNS = int(os.getenv("CONDENSE_HISTORY_TURNS", "3"))
+CONDENSE_MAX_CHARS = int(os.getenv("CONDENSE_MAX_CHARS", "400"))
+CONDENSE_CACHE_TTL_SEC = float(os.getenv("CONDENSE_CACHE_TTL_SEC", "1800"))
+
+_FOLLOW_UP_PREFIXES = (
+    "what about", "how about", "and ", "also", "what if", "but ", "same ",
+    "then ", "so ",
+)
+_ANAPHORA = {
+    "it", "its", "that", "this", "these", "those", "they", "them", "their",
+    "there", "same", "such", "else", "more", "one",
+}
+# Words that carry no topic: a short question made only of these ("why?",
+# "how much?", "and after?") needs the conversation to mean anything
+_NON_TOPIC = {
+    "what", "why", "how", "when", "where", "which", "who", "much", "many", "long",
+    "often", "is", "are", "was", "were", "be", "can", "could", "should", "would",
+    "will", "do", "does", "did", "i", "we", "you", "a", "an", "the", "to", "of",
+    "in", "on", "for", "about", "and", "or", "but", "so", "then", "ok", "okay",
+    "yes", "no", "please", "too", "also", "after", "before", "during", "now",
+    "still", "really", "else", "more", "normal", "safe", "bad", "fine",
+}
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def is_follow_up(question: str) -> bool:
+    """
+    Heuristic: questions leaning on earlier turns ("what about ...", "is it
+    safe?") or too short to have a topic of their own ("why?", "how much?").
+    A short question that names something ("iron supplements?") stands alone.
+    """
+    q = (question or "").strip().lower()
+    if not q:
+        return False
+    if q.startswith(_FOLLOW_UP_PREFIXES):
+        return True
+    words = _WORD_RE.findall(q)
+    if len(words) <= 10 and any(w in _ANAPHORA for w in words):
+        return True
+    return len(words) <= 4 and all(w in _NON_TOPIC for w in words)
+
+
+def condense_query(question: str, context: str, max_chars: int = CONDENSE_MAX_CHARS) -> str:
+    """
+    Prefix a follow-up question with the earlier conversation context.
+    The question is always kept whole; only the context is cut to fit
+    `max_chars`, keeping its most recent words.
+    """
+    question = (question or "").strip()
+    if not context or not is_follow_up(question):
+        return question
+    room = max_chars - len(question) - 1
+    context = context.strip()
+    if room <= 0:
+        return question
+    if len(context) > room:
+        tail = context[-room:]
+        # drop the word the cut went through
+        context = tail.split(" ", 1)[1] if " " in tail else ""
+    return f"{context} {question}".strip()
+
+
+class ConversationCondenser:
+    """Per-chat condensation state backed by the messages collection."""
+
+    def __init__(self, messages_col, turns: int = CONDENSE_HISTORY_TURNS,
+                 ttl: float = CONDENSE_CACHE_TTL_SEC):
+        self.messages_col = messages_col
+        self.turns = max(1, turns)
+        # chat_id -> last condensed query (the running retrieval topic)
+        self._cache = TTLCache(maxsize=4096, ttl=ttl)
+
+    def _history(self, chat_id, before=None) -> List[str]:
+        """Last user turns of the chat, oldest first (single indexed query)."""
+        filt = {'chat_id': chat_id, 'role': 'user'}
+        if before is not None:
+            filt['created_at'] = {'$lt': before}
+        cursor = (self.messages_col
+                  .find(filt, {'content': 1, '_id': 0})
+                  .sort('created_at', -1)
+                  .limit(self.turns))
+        return [m.get('content') or '' for m in cursor][::-1]
+
+    def condense(self, chat_id, question: str, before=None) -> str:
+        """
+        Build the retrieval query for `question` and remember it for the
+        next turn. `before` bounds the history fetch (the current message's
+        timestamp) so the question itself is never counted twice.
+        """
+        key = str(chat_id)
+        context: Optional[str] = self._cache.get(key)
+        if context is None and is_follow_up(question):
+            try:
+                context = " ".join(self._history(chat_id, before))
+            except Exception as e:
+                print(f"⚠️ Could not load chat history for condensation: {e}")
+                context = ""
+        query = condense_query(question, context or "")
+        self._cache.set(key, query)
+        return query
+
+    def forget(self, chat_id):
+        self._cache.pop(str(chat_id))
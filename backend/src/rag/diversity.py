@@ -0,0 +1,183 @@
+"""
+Diversity stage for retrieved chunks
+Overlapping chunking (CHUNK_OVERLAP) and documents that repeat each other
+make the plain top-k full of near-identical snippets, which wastes prompt
+budget and LLM prefill time.
+
+ - mmr_select: maximal marginal relevance over the candidate vectors
+   (one similarity matrix, greedy selection vectorized over candidates);
+   candidates almost identical to an already selected chunk are dropped
+ - merge_adjacent: consecutive chunks of the same source collapse into one
+   context item, with the overlapping text stitched out; chunk positions
+   come from the chunks' "positions", so collapsed near-duplicates (stored
+   under another source's id) do not break a run
+ - expand_neighbours: widen each item with the chunks around it (read from
+   the local text store, so no extra index round trip)
+"""
+
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+_CHUNK_ID_RE = re.compile(r"^(?P<source>.*)__chunk_(?P<n>\d+)$")
+
+
+def mmr_select(query_vector, candidate_vectors, k: int, lambda_mult: float = 0.7,
+               dup_threshold: float = 0.95) -> List[int]:
+    """Indices of up to `k` candidates, in selection order."""
+    cands = np.asarray(candidate_vectors, dtype=np.float32)
+    if cands.ndim != 2 or len(cands) == 0 or k <= 0:
+        return []
+    q = np.asarray(query_vector, dtype=np.float32)
+    cands = cands / np.clip(np.linalg.norm(cands, axis=1, keepdims=True), 1e-12, None)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+    relevance = cands @ q
+    pairwise = cands @ cands.T
+    n = len(cands)
+    selected: List[int] = []
+    available = np.ones(n, dtype=bool)
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        score = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, pairwise[best])
+        # Near-duplicates of what we already have are never worth a slot
+        available &= max_sim < dup_threshold
+    return selected
+
+
+def _chunk_positions(item: Dict[str, Any]) -> List[Tuple[str, int]]:
+    """
+    (source, chunk number) of every place the item's text sits. A chunk that
+    near-duplicates were collapsed into (src/ingest/dedup.py) lists one
+    position per source in "positions"; otherwise the id is the position.
+    """
+    out = []
+    for cid in item.get("positions") or [item.get("id")]:
+        m = _CHUNK_ID_RE.match(str(cid or ""))
+        if m:
+            out.append((m.group("source"), int(m.group("n"))))
+    return out
+
+
+def _stitch(a: str, b: str, max_overlap: int) -> str:
+    """Join two consecutive chunk texts, removing the text they share."""
+    for size in range(min(len(a), len(b), max_overlap), 7, -1):
+        if a.endswith(b[:size]):
+            return a + b[size:]
+    return f"{a} … {b}"
+
+
+def merge_adjacent(items: List[Dict[str, Any]], max_overlap: int = 200) -> List[Dict[str, Any]]:
+    """
+    Collapse selected chunks that are neighbours in the same source.
+    Positions rather than ids decide adjacency, so a chunk stored under
+    another source's id still joins its neighbours. The merged item keeps the
+    position of its best-ranked part.
+    """
+    by_source: Dict[str, List[Tuple[int, int]]] = {}
+    for i, it in enumerate(items):
+        for source, n in _chunk_positions(it):
+            by_source.setdefault(source, []).append((n, i))
+
+    used = set()  # items already in a merged run (each is merged once)
+    absorbed = set()
+    merged: Dict[int, Dict[str, Any]] = {}
+    for source, entries in by_source.items():
+        if len(entries) < 2:
+            continue
+        run: List[Tuple[int, int]] = []
+        for n, i in sorted(set(entries)) + [(None, None)]:
+            if (i is not None and i not in used and run and n == run[-1][0] + 1
+                    and all(i != j for _, j in run)):
+                run.append((n, i))
+                continue
+            if len(run) > 1:
+                parts = [j for _, j in run]
+                head = min(parts)  # best-ranked part
+                text = items[parts[0]].get("text_snippet") or ""
+                for j in parts[1:]:
+                    text = _stitch(text, items[j].get("text_snippet") or "", max_overlap)
+                item = dict(items[head])
+                item["text_snippet"] = text
+                item["score"] = max(items[j].get("score") or 0 for j in parts)
+                item["merged_ids"] = [items[j].get("id") for j in parts]
+                item["positions"] = [f"{source}__chunk_{k}" for k, _ in run]
+                merged[head] = item
+                used.update(parts)
+                absorbed.update(j for j in parts if j != head)
+            run = [(n, i)] if i is not None and i not in used else []
+
+    return [merged.get(i, it) for i, it in enumerate(items) if i not in absorbed]
+
+
+def expand_neighbours(items: List[Dict[str, Any]], fetch: Callable[[Iterable[str]], Dict[str, Dict[str, Any]]],
+                      n: int = 1, max_overlap: int = 200) -> List[Dict[str, Any]]:
+    """
+    Add up to `n` chunks before and after every item (skipping chunks already
+    in the list). `fetch(ids)` returns {id: {"text": ...}} for known ids.
+    """
+    if n <= 0 or not items:
+        return items
+    present = set()
+    for it in items:
+        present.update(it.get("merged_ids") or [it.get("id")])
+        present.update(it.get("positions") or [])
+    wanted = {}
+    for i, it in enumerate(items):
+        parts = _chunk_positions(it)
+        if not parts:
+            continue
+        source = parts[0][0]
+        numbers = [n for s, n in parts if s == source]
+        first, last = min(numbers), max(numbers)
+        before = [f"{source}__chunk_{k}" for k in range(max(0, first - n), first)]
+        after = [f"{source}__chunk_{k}" for k in range(last + 1, last + n + 1)]
+        wanted[i] = ([c for c in before if c not in present], [c for c in after if c not in present])
+        present.update(wanted[i][0] + wanted[i][1])
+    texts = fetch([c for b, a in wanted.values() for c in b + a])
+
+    out = []
+    for i, it in enumerate(items):
+        if i not in wanted:
+            out.append(it)
+            continue
+        before = [c for c in wanted[i][0] if c in texts]
+        after = [c for c in wanted[i][1] if c in texts]
+        if not before and not after:
+            out.append(it)
+            continue
+        text = ""
+        for cid in before:
+            text = _stitch(text, texts[cid]["text"], max_overlap) if text else texts[cid]["text"]
+        text = _stitch(text, it.get("text_snippet") or "", max_overlap) if text else it.get("text_snippet") or ""
+        for cid in after:
+            text = _stitch(text, texts[cid]["text"], max_overlap)
+        item = dict(it)
+        item["text_snippet"] = text
+        item["neighbour_ids"] = before + after
+        out.append(item)
+    return out
+
+
+def diversify(query_vector, candidates: List[Dict[str, Any]], top_k: int,
+              lambda_mult: float = 0.7, dup_threshold: float = 0.95,
+              max_overlap: Optional[int] = None) -> List[Dict[str, Any]]:
+    """MMR over candidates that carry "values", then merge neighbours."""
+    with_values = [c for c in candidates if c.get("values")]
+    if len(with_values) == len(candidates) and candidates:
+        order = mmr_select(query_vector, [c["values"] for c in candidates], top_k,
+                           lambda_mult=lambda_mult, dup_threshold=dup_threshold)
+        chosen = [candidates[i] for i in order]
+    else:
+        chosen = candidates[:top_k]
+    chosen = [{k: v for k, v in c.items() if k != "values"} for c in chosen]
+    return merge_adjacent(chosen, max_overlap=max_overlap or 200)
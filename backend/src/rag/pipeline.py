@@ -8,14 +8,42 @@ This version:
  - handles missing metadata and LLM/timeout errors gracefully
 """
 
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Iterator
 import json
+import os
 import time
 
 # Use the local Ollama LLM adapter
-from src.llm.llm_ollama import generate_llm_response
-from src.embed.embedder_cache import get_embedder
+from src.llm.llm_ollama import generate_llm_response, LLMStream
+from src.llm.scheduler import get_llm_scheduler, SchedulerRejected
+from src.embed.embedder_cache import get_embedder, get_embedding_batcher
 from src.vectorstore.pinecone_cache import get_pinecone_client
+from src.rag.diversity import diversify, expand_neighbours
+from src.vectorstore.filters import normalize_filter
+
+
+# Diversity stage: fetch RAG_MMR_FETCH_FACTOR x top_k candidates, keep top_k by
+# maximal marginal relevance, then merge neighbouring chunks of one source
+RAG_MMR = os.getenv("RAG_MMR", "true").lower() == "true"
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_MMR_FETCH_FACTOR = int(os.getenv("RAG_MMR_FETCH_FACTOR", "3"))
+RAG_DUP_THRESHOLD = float(os.getenv("RAG_DUP_THRESHOLD", "0.95"))
+
+# Chunk text comes from the local text store (src/vectorstore/text_store.py):
+# the index returns ids + scores only. RAG_NEIGHBOUR_CHUNKS widens every
+# retrieved chunk with that many chunks on each side.
+RAG_TEXT_STORE = os.getenv("RAG_TEXT_STORE", "true").lower() == "true"
+RAG_NEIGHBOUR_CHUNKS = int(os.getenv("RAG_NEIGHBOUR_CHUNKS", "0"))
+
+
+class SearchResults(list):
+    """
+    search() results: a plain list of items, plus `partial` (True when some
+    vector shards timed out or failed, see src/vectorstore/sharded.py) and
+    the per-shard report.
+    """
+    partial = False
+    shards = None
 
 
 def _normalize_query_vector(vec: Any) -> List[float]:
@@ -65,6 +93,13 @@ def _parse_pinecone_response(resp: Any) -> List[Dict[str, Any]]:
                             or "",
             "metadata": meta
         })
+        if meta.get("source_files"):
+            # Near-duplicate chunks collapsed at ingestion (src/ingest/dedup.py)
+            results[-1]["source_files"] = list(meta["source_files"])
+        if meta.get("positions"):
+            results[-1]["positions"] = list(meta["positions"])
+        if m.get("values"):
+            results[-1]["values"] = m["values"]
 
     return results
 
@@ -86,14 +121,109 @@ def _build_context(retrieved: List[Dict[str, Any]], max_chars_per_item=800) -> s
                       or item.get("metadata", {}).get("text") \
                       or ""
 
-        snippet = (snippet or "")[:max_chars_per_item].strip()
+        # Merged / expanded neighbours (see rag/diversity.py) keep the budget of each part
+        parts = (len(item.get("merged_ids") or []) or 1) + len(item.get("neighbour_ids") or [])
+        snippet = (snippet or "")[:max_chars_per_item * parts].strip()
 
         ctx.append(f"[{idx}] Source: {src}\n{snippet}")
 
     return "\n\n---\n\n".join(ctx)
 
 
-PROMPT_TEMPLATE = """
+def _text_store():
+    if not RAG_TEXT_STORE:
+        return None
+    from src.vectorstore.text_store import get_text_store
+    store = get_text_store()
+    return store if len(store) else None
+
+
+def _hydrate(results: List[Dict[str, Any]], store, pine) -> List[Dict[str, Any]]:
+    """
+    Fill text, sources and metadata of id-only matches from the text store.
+    Matches whose text cannot be found anywhere are dropped (with a warning)
+    rather than passed on as empty context.
+    """
+    records = store.get_many(r["id"] for r in results)
+    missing = [r["id"] for r in results if r["id"] not in records]
+    if missing:
+        # Not in the local store (e.g. indexed elsewhere): ask the index itself
+        fallback = pine.fetch_metadata(missing)
+        parsed = {p["id"]: p for p in _parse_pinecone_response(
+            {"matches": [{"id": i, "metadata": m} for i, m in fallback.items()]})}
+    hydrated, lost = [], []
+    for r in results:
+        rec = records.get(r["id"])
+        if rec is not None:
+            r["source_file"] = rec.get("source_file") or r["source_file"]
+            r["text_snippet"] = rec.get("text") or ""
+            r["metadata"] = rec.get("metadata") or {}
+            if len(rec.get("source_files") or []) > 1:
+                r["source_files"] = list(rec["source_files"])
+            if len(rec.get("positions") or []) > 1:
+                r["positions"] = list(rec["positions"])
+        elif missing and r["id"] in parsed:
+            r.update({k: v for k, v in parsed[r["id"]].items() if k not in ("id", "score")})
+        if r.get("text_snippet"):
+            hydrated.append(r)
+        else:
+            lost.append(r["id"])
+    if lost:
+        print(f"⚠️ No text for {len(lost)} match(es) {lost[:5]}: the text store is missing them "
+              f"and vector metadata has no snippet. Rebuild it with: python -m src.cli reembed")
+    return hydrated
+
+
+def retrieve(query: str, top_k: int = 4, filter: Dict[str, Any] = None) -> "SearchResults":
+    """Embed `query` and return the parsed Pinecone matches."""
+    return search(embed_query(query), top_k=top_k, filter=filter)
+
+
+def embed_query(query: str) -> List[float]:
+    # Concurrent requests share one batched encode (see src/embed/batcher.py)
+    batcher = get_embedding_batcher()
+    return batcher.embed_query(query) if batcher is not None else get_embedder().embed_query(query)
+
+
+def search(query_vector: Any, top_k: int = 4, filter: Dict[str, Any] = None) -> "SearchResults":
+    """
+    Vector search for an already embedded query.
+    `filter` restricts matches by chunk metadata (see src/vectorstore/filters.py).
+    The result is marked `partial` when a sharded store answered without all shards.
+    """
+    qvec = _normalize_query_vector(query_vector)
+    pine = get_pinecone_client()
+    flt = normalize_filter(filter)
+    kwargs = {"filter": flt} if flt else {}
+    store = _text_store()
+    if store is not None:
+        kwargs["include_metadata"] = False
+    if RAG_MMR:
+        raw = pine.query(qvec, top_k=top_k * max(1, RAG_MMR_FETCH_FACTOR), include_values=True, **kwargs)
+    else:
+        raw = pine.query(qvec, top_k=top_k, **kwargs)
+
+    # Ensure dict format (pinecone_client should already do this)
+    if hasattr(raw, "to_dict"):
+        raw = raw.to_dict()
+
+    results = _parse_pinecone_response(raw)
+    if store is not None:
+        results = _hydrate(results, store, pine)
+    if RAG_MMR:
+        results = diversify(qvec, results, top_k, lambda_mult=RAG_MMR_LAMBDA,
+                            dup_threshold=RAG_DUP_THRESHOLD)
+    if store is not None and RAG_NEIGHBOUR_CHUNKS > 0:
+        results = expand_neighbours(results, store.get_many, n=RAG_NEIGHBOUR_CHUNKS)
+    out = SearchResults(results)
+    if isinstance(raw, dict) and raw.get("partial"):
+        out.partial, out.shards = True, raw.get("shards")
+    return out
+
+
+# Static persona/style instructions. Kept byte-identical across requests and
+# sent as Ollama's `system` field so the model's KV cache can reuse it.
+SYSTEM_PROMPT = """
 You are a warm, compassionate, and highly knowledgeable maternal health assistant.
 Your goal is to provide supportive, evidence-based guidance to expectant and new mothers.
 Always address the user with care and empathy, making them feel heard and understood.
@@ -109,7 +239,10 @@ Style and requirements:
 - **No Inline Citations**: Do NOT include [1], [2] etc. in your text. Sources are shown separately.
 - **Conciseness**: Keep it to 4-6 key points + summary.
 - **Closing**: End with a supportive check-in question (e.g., "How does that sound to you?" or "Is there anything else on your mind?").
+"""  # noqa: E501
 
+# Volatile per-request part: always appended after the static prefix.
+USER_PROMPT_TEMPLATE = """
 CONTEXT:
 {context}
 
@@ -117,17 +250,31 @@ QUESTION:
 {question}
 
 Answer now (warm, concise, no inline citations):
-"""  # noqa: E501
+"""
+
+NO_CONTEXT_ANSWER = ("I couldn't find relevant information in the knowledge base. "
+                     "Please try a different question or add more documents to the dataset.")
+
+# Single-string layout, for callers that don't use a system prompt
+PROMPT_TEMPLATE = SYSTEM_PROMPT + USER_PROMPT_TEMPLATE
 
 
-def run_rag_pipeline(question: str, top_k: int = 2, max_context_chars_per_item: int = 250
-                     ) -> Tuple[str, List[Dict[str, Any]]]:
+def build_prompt(context: str, question: str) -> Tuple[str, str]:
+    """Return (system, prompt) for the LLM; system is the stable prefix."""
+    return SYSTEM_PROMPT, USER_PROMPT_TEMPLATE.format(context=context, question=question)
+
+
+def run_rag_pipeline(question: str, top_k: int = 2, max_context_chars_per_item: int = 250,
+                     retrieval_query: str = None, session_id: str = None,
+                     filter: Dict[str, Any] = None) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Run the full RAG pipeline:
-     - embed the question
+     - embed the question (or `retrieval_query`, e.g. a condensed follow-up)
      - query Pinecone
      - build context and prompt
-     - call local Ollama (Meditron) via generate_llm_response
+     - call local Ollama (Meditron) via generate_llm_response; `session_id`
+       (e.g. the chat id) lets Ollama reuse the previous turn's KV context
+    `filter` restricts retrieval by chunk metadata, e.g. {"trimester": "third"}.
     Returns:
       - answer (str)
       - retrieved list (list of dicts)
@@ -138,31 +285,20 @@ def run_rag_pipeline(question: str, top_k: int = 2, max_context_chars_per_item:
         print("\n🔍 Processing your question...")
         print("📌 Step 1/4: Embedding your question...")
 
-        embedder = get_embedder()
-        qvec_raw = embedder.embed_text(question)
-        qvec = _normalize_query_vector(qvec_raw)
-
         print("📚 Step 2/4: Querying Pinecone for relevant chunks...")
-        pine = get_pinecone_client()
-        raw = pine.query(qvec, top_k=top_k)
-
-        # Ensure dict format (pinecone_client should already do this)
-        if hasattr(raw, "to_dict"):
-            raw = raw.to_dict()
-
-        retrieved = _parse_pinecone_response(raw)
+        retrieved = retrieve(retrieval_query or question, top_k=top_k, filter=filter)
 
         if not retrieved:
             print("⚠️ No sources returned from Pinecone.")
-            return ("I couldn't find relevant information in the knowledge base. "
-                    "Please try a different question or add more documents to the dataset."), []
+            return NO_CONTEXT_ANSWER, retrieved  # may still be marked partial
 
         print("🧠 Step 3/4: Building RAG prompt...")
         context = _build_context(retrieved, max_chars_per_item=max_context_chars_per_item)
-        prompt = PROMPT_TEMPLATE.format(context=context, question=question)
+        system, prompt = build_prompt(context, question)
 
         print("🤖 Step 4/4: Contacting local Ollama (Meditron) LLM...")
-        answer = generate_llm_response(prompt)
+        with get_llm_scheduler().slot():
+            answer = generate_llm_response(prompt, system=system, session_id=session_id)
 
         # If the LLM adapter returns an explicit error string, forward it cleanly
         if isinstance(answer, str) and answer.strip().startswith("❌"):
@@ -171,11 +307,14 @@ def run_rag_pipeline(question: str, top_k: int = 2, max_context_chars_per_item:
 
         elapsed = time.time() - start
         print(f"[RAG] Retrieved: {len(retrieved)} chunks")
-        print(f"[RAG] Prompt length: {len(prompt)} chars")
+        print(f"[RAG] Prompt length: {len(system) + len(prompt)} chars")
         print(f"[RAG] Time: {elapsed:.2f}s\n")
 
         return answer, retrieved
 
+    except SchedulerRejected:
+        # Let the API turn admission-control rejections into 429/503
+        raise
     except Exception as exc:
         # Final catch-all so CLI doesn't crash; return a helpful message
         err = f"❌ RAG pipeline error: {str(exc)}"
@@ -183,6 +322,61 @@ def run_rag_pipeline(question: str, top_k: int = 2, max_context_chars_per_item:
         return err, []
 
 
+def stream_rag_pipeline(question: str, top_k: int = 4, max_context_chars_per_item: int = 250,
+                        retrieval_query: str = None, session_id: str = None,
+                        filter: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+    """
+    The steps of run_rag_pipeline as a stream of events, for interactive
+    clients that show real progress and print the answer as it is generated:
+      {"type": "stage", "stage": "embed" | "search" | "prompt" | "queue" | "first_token", "ms": ...}
+      {"type": "sources", "items": [...], "partial": bool}
+      {"type": "token", "text": "..."}
+      {"type": "done", "answer": "...", "ms": <generation ms>, "total_ms": ...}
+    Closing the generator early cancels the generation.
+    """
+    start = time.perf_counter()
+
+    def stage(name, t0):
+        return {"type": "stage", "stage": name, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+    t0 = time.perf_counter()
+    qvec = embed_query(retrieval_query or question)
+    yield stage("embed", t0)
+
+    t0 = time.perf_counter()
+    retrieved = search(qvec, top_k=top_k, filter=filter)
+    yield stage("search", t0)
+    yield {"type": "sources", "items": retrieved, "partial": retrieved.partial}
+
+    if not retrieved:
+        yield {"type": "done", "answer": NO_CONTEXT_ANSWER, "ms": 0.0,
+               "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+        return
+
+    t0 = time.perf_counter()
+    context = _build_context(retrieved, max_chars_per_item=max_context_chars_per_item)
+    system, prompt = build_prompt(context, question)
+    yield stage("prompt", t0)
+
+    t0 = time.perf_counter()
+    with get_llm_scheduler().slot():
+        yield stage("queue", t0)
+        t0 = time.perf_counter()
+        stream = LLMStream(prompt, system=system, session_id=session_id)
+        parts: List[str] = []
+        try:
+            for text in stream:
+                if not parts:
+                    yield stage("first_token", t0)
+                parts.append(text)
+                yield {"type": "token", "text": text}
+        finally:
+            stream.cancel()
+    yield {"type": "done", "answer": "".join(parts),
+           "ms": round((time.perf_counter() - t0) * 1000, 1),
+           "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
 # -------------------------
 # Small test harness for quick CLI testing
 # -------------------------
@@ -0,0 +1,91 @@
+"""
+Metadata filters for retrieval
+Requests use a small subset of Pinecone's filter language, so the same
+filter is passed to Pinecone as is and evaluated by the local index with
+its bitmap indexes:
+
+  {"doc_type": "guideline"}                      equality
+  {"trimester": ["second", "third"]}             any of (list fields match on any element)
+  {"year": {"$gte": 2015}, "language": {"$ne": "es"}}
+  supported operators: $eq $ne $in $nin $gt $gte $lt $lte; fields are ANDed
+"""
+
+from typing import Any, Dict, Optional
+
+
+FILTER_FIELDS = ("doc_type", "language", "year", "trimester", "topics", "source_file")
+OPERATORS = ("$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte")
+
+_SCALAR = (str, int, float, bool)
+
+
+def normalize_filter(spec: Any) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Validate a request filter and return it in Pinecone's explicit form
+    ({field: {op: value}}), or None for no filter. Raises ValueError.
+    """
+    if spec in (None, {}):
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError("filter must be an object")
+    out: Dict[str, Dict[str, Any]] = {}
+    for field, cond in spec.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"unknown filter field {field!r} (allowed: {', '.join(FILTER_FIELDS)})")
+        if isinstance(cond, dict):
+            ops = cond
+        elif isinstance(cond, list):
+            ops = {"$in": cond}
+        else:
+            ops = {"$eq": cond}
+        for op, value in ops.items():
+            if op not in OPERATORS:
+                raise ValueError(f"unsupported operator {op!r} on {field!r}")
+            if op in ("$in", "$nin"):
+                if not isinstance(value, list) or not value or not all(isinstance(v, _SCALAR) for v in value):
+                    raise ValueError(f"{field}.{op} needs a non-empty list of values")
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"{field}.{op} needs a number")
+            elif not isinstance(value, _SCALAR):
+                raise ValueError(f"{field}.{op} needs a single value")
+        out[field] = dict(ops)
+    return out or None
+
+
+def value_matches(op: str, value: Any, target: Any) -> bool:
+    """Whether one metadata value satisfies `op target`."""
+    if op == "$eq":
+        return value == target
+    if op == "$ne":
+        return value != target
+    if op == "$in":
+        return value in target
+    if op == "$nin":
+        return value not in target
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    if op == "$gt":
+        return value > target
+    if op == "$gte":
+        return value >= target
+    if op == "$lt":
+        return value < target
+    return value <= target  # $lte
+
+
+def matches(metadata: Dict[str, Any], flt: Optional[Dict[str, Dict[str, Any]]]) -> bool:
+    """Reference (row-by-row) evaluation of a normalized filter."""
+    if not flt:
+        return True
+    for field, ops in flt.items():
+        raw = metadata.get(field)
+        values = raw if isinstance(raw, list) else ([] if raw is None else [raw])
+        for op, target in ops.items():
+            if op in ("$ne", "$nin"):
+                bad = target if op == "$nin" else [target]
+                if any(v in bad for v in values):
+                    return False
+            elif not any(value_matches(op, v, target) for v in values):
+                return False
+    return True
@@ -0,0 +1,339 @@
+"""
+Local vector index (VECTOR_STORE=local)
+An in-process, exact cosine-similarity index kept in NumPy and persisted
+under processed/local_index/. No network or API key needed, which makes it
+the store for offline evaluation (src/eval) and for development.
+
+LocalVectorStore has the same interface as PineconeClient
+(`embedding_dim`, `upsert_all_chunks`, `query`), so the pipeline does not
+know which one it talks to.
+
+Metadata filters (src/vectorstore/filters.py) use one packed bitmap per
+(field, value), built when the index is loaded and updated in place by
+upserts (capacity grows by doubling), so queries never build them. A filter
+is reduced to one row mask with bitwise AND/OR before any scoring, so a
+selective filter scores only the rows it keeps.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.main.settings import PROCESSED_DIR
+from src.vectorstore.filters import FILTER_FIELDS, value_matches
+from src.vectorstore.pinecone_client import PineconeClient
+
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR") or os.path.join(PROCESSED_DIR, "local_index")
+# How often a running process checks whether another one (e.g. the ingest daemon) saved the index
+LOCAL_INDEX_RELOAD_SEC = float(os.getenv("LOCAL_INDEX_RELOAD_SEC", "2"))
+
+# Above this share of kept rows a filtered query scores every row, then picks
+_DENSE_FILTER_FRACTION = 0.2
+
+
+class LocalIndex:
+    """Vectors (L2-normalized float32 rows) + ids + metadata, on disk as .npy + JSONL."""
+
+    def __init__(self, path: str = LOCAL_INDEX_DIR, dim: Optional[int] = None):
+        self.path = Path(path)
+        self.dim = dim
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._pos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.loaded_mtime = 0.0
+        # {field: {value: packed row bitmap}}, all _bitmap_bytes long
+        self._bitmaps: Dict[str, Dict[Any, np.ndarray]] = {f: {} for f in FILTER_FIELDS}
+        self._bitmap_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---------------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------------
+    def load(self) -> "LocalIndex":
+        vec_file, meta_file = self.path / "vectors.npy", self.path / "items.jsonl"
+        if not vec_file.exists() or not meta_file.exists():
+            return self
+        self.loaded_mtime = meta_file.stat().st_mtime
+        vectors = np.load(vec_file)
+        items = [json.loads(line) for line in meta_file.read_text(encoding="utf-8").splitlines() if line]
+        if len(items) != vectors.shape[0]:
+            print(f"⚠️ Local index at {self.path} is inconsistent "
+                  f"({vectors.shape[0]} vectors, {len(items)} items); ignoring it")
+            return self
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            print(f"⚠️ Local index dimension {vectors.shape[1]} != embedder dimension {self.dim}; "
+                  "ignoring it (rebuild with: python -m src.cli reembed)")
+            return self
+        self.vectors = vectors.astype(np.float32, copy=False)
+        self.ids = [it["id"] for it in items]
+        self.metadata = [it.get("metadata") or {} for it in items]
+        self._pos = {cid: i for i, cid in enumerate(self.ids)}
+        self.dim = self.vectors.shape[1]
+        self._rebuild_bitmaps()
+        return self
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            vectors = self.vectors
+            lines = [json.dumps({"id": cid, "metadata": meta}, ensure_ascii=False)
+                     for cid, meta in zip(self.ids, self.metadata)]
+        # Write-then-rename, items last: readers in other processes reload on its mtime
+        with open(self.path / "vectors.npy.tmp", "wb") as f:
+            np.save(f, vectors)
+        (self.path / "items.jsonl.tmp").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(self.path / "vectors.npy.tmp", self.path / "vectors.npy")
+        os.replace(self.path / "items.jsonl.tmp", self.path / "items.jsonl")
+        self.loaded_mtime = (self.path / "items.jsonl").stat().st_mtime
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return (self.path / "items.jsonl").stat().st_mtime > self.loaded_mtime
+        except OSError:
+            return False
+
+    # ---------------------------------------------------------
+    # Writes
+    # ---------------------------------------------------------
+    def upsert(self, vectors: Iterable[Dict[str, Any]]):
+        """Pinecone-style items: {"id", "values", "metadata"}; existing ids are replaced."""
+        items = list(vectors)
+        if not items:
+            return
+        mat = np.asarray([it["values"] for it in items], dtype=np.float32)
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        mat = np.divide(mat, norms, out=np.zeros_like(mat), where=norms > 0)
+        with self._lock:
+            if self.dim is None or len(self.ids) == 0:
+                self.dim = mat.shape[1]
+                self.vectors = self.vectors.reshape(0, self.dim)
+            vectors = self.vectors.copy()
+            new_rows = []
+            self._reserve_bitmaps(len(self.ids) + len(items))
+            for row, it in zip(mat, items):
+                meta = it.get("metadata") or {}
+                i = self._pos.get(it["id"])
+                if i is None:
+                    i = self._pos[it["id"]] = len(self.ids)
+                    self.ids.append(it["id"])
+                    self.metadata.append(meta)
+                    new_rows.append(row)
+                else:
+                    if i < len(vectors):
+                        vectors[i] = row
+                    else:  # repeated id within this batch
+                        new_rows[i - len(vectors)] = row
+                    self._set_row_bits(i, self.metadata[i], on=False)
+                    self.metadata[i] = meta
+                self._set_row_bits(i, meta)
+            if new_rows:
+                vectors = np.vstack([vectors, np.asarray(new_rows, dtype=np.float32)])
+            # Readers keep using the old array until this swap
+            self.vectors = vectors
+
+    def delete(self, ids: Iterable[str]) -> int:
+        drop = set(ids)
+        with self._lock:
+            keep = [i for i, cid in enumerate(self.ids) if cid not in drop]
+            removed = len(self.ids) - len(keep)
+            if not removed:
+                return 0
+            self.vectors = self.vectors[keep]
+            self.ids = [self.ids[i] for i in keep]
+            self.metadata = [self.metadata[i] for i in keep]
+            self._pos = {cid: i for i, cid in enumerate(self.ids)}
+            self._rebuild_bitmaps()
+        return removed
+
+    # ---------------------------------------------------------
+    # Filter bitmaps
+    # ---------------------------------------------------------
+    @staticmethod
+    def _filter_values(meta: Dict[str, Any]):
+        for field in FILTER_FIELDS:
+            raw = meta.get(field)
+            for v in (raw if isinstance(raw, list) else [raw]):
+                if v is not None:
+                    yield field, v
+
+    def _rebuild_bitmaps(self):
+        """Build every bitmap from the metadata (load, delete)."""
+        n = len(self.metadata)
+        rows: Dict[str, Dict[Any, List[int]]] = {f: {} for f in FILTER_FIELDS}
+        for i, meta in enumerate(self.metadata):
+            for field, v in self._filter_values(meta):
+                rows[field].setdefault(v, []).append(i)
+        bitmaps: Dict[str, Dict[Any, np.ndarray]] = {}
+        for field, by_value in rows.items():
+            bitmaps[field] = {}
+            for v, idx in by_value.items():
+                mask = np.zeros(n, dtype=bool)
+                mask[idx] = True
+                bitmaps[field][v] = np.packbits(mask)
+        self._bitmaps, self._bitmap_bytes = bitmaps, (n + 7) // 8
+
+    def _reserve_bitmaps(self, rows: int):
+        """Make every bitmap long enough for `rows` rows (capacity doubles)."""
+        need = (rows + 7) // 8
+        if need <= self._bitmap_bytes:
+            return
+        size = max(need, 2 * self._bitmap_bytes, 64)
+        grown: Dict[str, Dict[Any, np.ndarray]] = {}
+        for field, by_value in self._bitmaps.items():
+            grown[field] = {}
+            for v, bits in by_value.items():
+                wider = np.zeros(size, dtype=np.uint8)
+                wider[:len(bits)] = bits
+                grown[field][v] = wider
+        self._bitmaps, self._bitmap_bytes = grown, size
+
+    def _set_row_bits(self, i: int, meta: Dict[str, Any], on: bool = True):
+        byte, bit = i >> 3, np.uint8(0x80 >> (i & 7))  # np.packbits order
+        for field, v in self._filter_values(meta):
+            by_value = self._bitmaps[field]
+            bits = by_value.get(v)
+            if bits is None:
+                if not on:
+                    continue
+                bits = by_value[v] = np.zeros(self._bitmap_bytes, dtype=np.uint8)
+            if on:
+                bits[byte] |= bit
+            else:
+                bits[byte] &= ~bit
+
+    def filter_rows(self, flt: Dict[str, Dict[str, Any]], n: int) -> np.ndarray:
+        """Row indices (< n) that satisfy a normalized filter."""
+        bitmaps = self._bitmaps
+        nbytes = (n + 7) // 8
+        keep = np.full(nbytes, 0xFF, dtype=np.uint8)
+        for field, ops in flt.items():
+            by_value = bitmaps.get(field, {})
+            for op, target in ops.items():
+                negate = op in ("$ne", "$nin")
+                positive = {"$ne": "$eq", "$nin": "$in"}.get(op, op)
+                hit = np.zeros(nbytes, dtype=np.uint8)
+                for v, bits in by_value.items():
+                    if value_matches(positive, v, target):
+                        hit |= bits[:nbytes]
+                keep &= ~hit if negate else hit
+        return np.flatnonzero(np.unpackbits(keep, count=n))
+
+    # ---------------------------------------------------------
+    # Reads
+    # ---------------------------------------------------------
+    def get_metadata(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Metadata of the given ids; unknown ids are left out."""
+        pos, metadata = self._pos, self.metadata
+        return {cid: metadata[pos[cid]] for cid in ids if cid in pos}
+
+    def query(self, vector, top_k: int = 4, include_metadata: bool = True,
+              include_values: bool = False, filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        vectors, ids, metadata = self.vectors, self.ids, self.metadata
+        n = min(len(ids), vectors.shape[0])
+        if n == 0 or top_k <= 0:
+            return {"matches": []}
+        q = np.asarray(vector, dtype=np.float32)
+        qn = np.linalg.norm(q)
+        if qn == 0:
+            return {"matches": []}
+        if filter:
+            rows = self.filter_rows(filter, n)
+            if len(rows) == 0:
+                return {"matches": []}
+            if len(rows) < _DENSE_FILTER_FRACTION * n:
+                scores = vectors[rows] @ (q / qn)
+            else:
+                # Copying most of the matrix costs more than scoring all of it
+                scores = (vectors[:n] @ (q / qn))[rows]
+        else:
+            rows = None
+            scores = vectors[:n] @ (q / qn)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        matches = []
+        for j in top:
+            i = rows[j] if rows is not None else j
+            m = {"id": ids[i], "score": float(scores[j])}
+            if include_metadata:
+                m["metadata"] = metadata[i]
+            if include_values:
+                m["values"] = vectors[i].tolist()
+            matches.append(m)
+        return {"matches": matches}
+
+
+class LocalVectorStore(PineconeClient):
+    """Drop-in replacement for PineconeClient backed by a LocalIndex."""
+
+    def __init__(self, path: str = LOCAL_INDEX_DIR):
+        print("🔗 Initializing vector store (local index)...")
+        from src.embed.embedder_cache import get_embedder
+
+        self.embedder = get_embedder()
+        self.embedding_dim = self.embedder.dim
+        self.path = path
+        self.index = LocalIndex(path, dim=self.embedding_dim).load()
+        self._enabled = True
+        self._checked_at = time.monotonic()
+        print(f"✅ Local index loaded: {len(self.index)} vectors from {path}")
+
+    def upsert_all_chunks(self, batch_size: int = 100):
+        total = super().upsert_all_chunks(batch_size=batch_size)
+        self.persist()
+        return total
+
+    def upsert_chunks(self, chunk_ids, batch_size: int = 100):
+        total = super().upsert_chunks(chunk_ids, batch_size=batch_size)
+        if total:
+            self.persist()
+        return total
+
+    def delete_chunks(self, chunk_ids):
+        total = super().delete_chunks(chunk_ids)
+        if total:
+            self.persist()
+        return total
+
+    def persist(self):
+        self.index.save()
+
+    def _push(self, ids, vectors, metadata):
+        self.index.upsert({"id": i, "values": v, "metadata": m} for i, v, m in zip(ids, vectors, metadata))
+
+    def _delete(self, ids):
+        self.index.delete(ids)
+
+    def _maybe_reload(self):
+        """Pick up chunks another process (the ingest daemon) has saved since."""
+        now = time.monotonic()
+        if now - self._checked_at < LOCAL_INDEX_RELOAD_SEC:
+            return
+        self._checked_at = now
+        if self.index.changed_on_disk():
+            fresh = LocalIndex(self.path, dim=self.embedding_dim).load()
+            if len(fresh):
+                self.index = fresh
+                print(f"🔄 Local index reloaded: {len(fresh)} vectors")
+
+    def query(self, query_vector, top_k=4, include_values=False, filter=None, include_metadata=True):
+        self._maybe_reload()
+        try:
+            return self.index.query(query_vector, top_k=top_k, include_metadata=include_metadata,
+                                    include_values=include_values, filter=filter)
+        except Exception as e:
+            print(f"❌ Local index query failed: {str(e)}")
+            return {"matches": [], "error": str(e)}
+
+    def fetch_metadata(self, ids):
+        return self.index.get_metadata(ids)
@@ -1,17 +1,42 @@
 """
 Singleton Pinecone Client Cache
 Prevents reconnecting to Pinecone on every request
+
+VECTOR_STORE=local swaps in the on-disk LocalVectorStore (same interface);
+VECTOR_SHARDS spreads the corpus over several stores (see sharded.py).
 """
 
-from src.vectorstore.pinecone_client import PineconeClient
+import os
 
 _pinecone_instance = None
+_pinecone_pid = None
+
+
+def vector_store_is_fork_safe() -> bool:
+    """True when the configured store is local indexes only (no network connections)."""
+    shards = os.getenv("VECTOR_SHARDS")
+    if shards:
+        return all(e.strip().partition(":")[0].lower() == "local" for e in shards.split(",") if e.strip())
+    return os.getenv("VECTOR_STORE", "pinecone").lower() == "local"
+
 
 def get_pinecone_client():
-    """Get or create a singleton Pinecone client instance"""
-    global _pinecone_instance
+    """Get or create a singleton vector store client (Pinecone by default)"""
+    global _pinecone_instance, _pinecone_pid
+    # A Pinecone client's HTTP connection pool must not be reused by a forked child
+    if _pinecone_instance is not None and _pinecone_pid != os.getpid() and not vector_store_is_fork_safe():
+        _pinecone_instance = None
     if _pinecone_instance is None:
-        print("🔗 Initializing Pinecone connection (first time only)...")
-        _pinecone_instance = PineconeClient()
-        print("✅ Pinecone client cached and ready")
+        _pinecone_pid = os.getpid()
+        if os.getenv("VECTOR_SHARDS"):
+            from src.vectorstore.sharded import get_sharded_store
+            _pinecone_instance = get_sharded_store()
+        elif os.getenv("VECTOR_STORE", "pinecone").lower() == "local":
+            from src.vectorstore.local_index import LocalVectorStore
+            _pinecone_instance = LocalVectorStore()
+        else:
+            from src.vectorstore.pinecone_client import PineconeClient
+            print("🔗 Initializing Pinecone connection (first time only)...")
+            _pinecone_instance = PineconeClient()
+            print("✅ Pinecone client cached and ready")
     return _pinecone_instance
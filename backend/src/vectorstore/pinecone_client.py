@@ -7,7 +7,9 @@ This version is defensive:
   and simply returns no matches, instead of crashing the whole backend.
 """
 
-from typing import Any, Dict, List
+import copy
+import os
+from typing import Any, Dict, Iterable, List
 
 from tqdm import tqdm
 
@@ -16,15 +18,25 @@ from src.main.settings import (
     PINECONE_ENV,
     PINECONE_INDEX,
 )
-from src.embed.embedder import Embedder
+from src.embed.embedder_cache import get_embedder
+from src.ingest.metadata import extract_metadata
+from src.vectorstore.text_store import build_text_store, remove_from_text_store
+
+# Chunk text is served from the local text store (text_store.py); set to
+# true to also keep a 300-char snippet in every vector's metadata
+VECTOR_METADATA_SNIPPETS = os.getenv("VECTOR_METADATA_SNIPPETS", "false").lower() == "true"
 
 
 class PineconeClient:
+    # Pinecone namespace used for upserts and queries (None = default namespace)
+    namespace = None
+
     def __init__(self):
         print("🔗 Initializing vector store (Pinecone)...")
 
         # Load embedder FIRST to auto-detect embedding dimension
-        self.embedder = Embedder()
+        # (shared singleton, so the model is only held in memory once)
+        self.embedder = get_embedder()
         self.embedding_dim = self.embedder.dim
         print(f"✅ Embedding dimension detected: {self.embedding_dim}")
 
@@ -68,47 +80,93 @@ class PineconeClient:
         # Connect to index
         self.index = self.pc.Index(self.index_name)
 
+    def for_namespace(self, namespace: str) -> "PineconeClient":
+        """Same connection, scoped to one namespace (a shard, see sharded.py)."""
+        client = copy.copy(self)
+        client.namespace = namespace or None
+        return client
+
+    def persist(self):
+        """Make upserted vectors durable (Pinecone writes are, already)."""
+
     # ----------------------------------------------------
     # UPSERT ALL CHUNKS
     # ----------------------------------------------------
-    def upsert_all_chunks(self):
+    def upsert_all_chunks(self, batch_size: int = 100):
+        """
+        Embed every chunk with the passage convention and upsert it.
+        Ids are stable, so re-running this re-embeds the index in place
+        (used by `python -m src.cli reembed`).
+        """
         if not getattr(self, "_enabled", False):
             print(
                 "⚠️ Pinecone is disabled (missing API key/env). "
                 "Skipping upsert."
             )
-            return
+            return 0
 
         print("\n🚀 Starting full embedding + upsert...\n")
+        print(f"📝 Text store rebuilt: {build_text_store()} chunks")
+
+        total = self._upsert_records(
+            tqdm(self.embedder.load_chunk_records(), desc="Embedding chunks"),
+            batch_size=batch_size,
+        )
 
-        batch_ids: List[str] = []
-        batch_vectors: List[List[float]] = []
-        batch_metadata: List[Dict[str, Any]] = []
-
-        for chunk_id, text in tqdm(
-            self.embedder.load_chunks(), desc="Embedding chunks"
-        ):
-            vec = self.embedder.embed_text(text)
-
-            batch_ids.append(chunk_id)
-            batch_vectors.append(vec)
-            batch_metadata.append(
-                {
-                    "source_file": chunk_id.split("__")[0],
-                    "text_snippet": text[:300],  # trimmed for safety
+        print(f"\n✅ {total} embeddings successfully uploaded to Pinecone!\n")
+        return total
+
+    def upsert_chunks(self, chunk_ids: Iterable[str], batch_size: int = 100):
+        """Embed and upsert only the given chunks (incremental ingestion)."""
+        if not getattr(self, "_enabled", False):
+            return 0
+        chunk_ids = list(chunk_ids)
+        build_text_store(chunk_ids)
+        return self._upsert_records(
+            self.embedder.load_chunk_records(chunk_ids), batch_size=batch_size
+        )
+
+    def _upsert_records(self, records: Iterable[dict], batch_size: int = 100):
+        convention = self.embedder.spec.family
+        batch: List[dict] = []
+        total = 0
+
+        def flush():
+            ids = [rec["chunk_id"] for rec in batch]
+            texts = [rec.get("text", "") for rec in batch]
+            vectors = self.embedder.embed_passages(texts)
+            metadata = []
+            for rec, text in zip(batch, texts):
+                meta = {
+                    "source_file": rec.get("source_file") or rec["chunk_id"].split("__")[0],
+                    "embed_convention": convention,
                 }
-            )
+                if VECTOR_METADATA_SNIPPETS:
+                    meta["text_snippet"] = text[:300]  # trimmed for safety
+                # Near-duplicate copies collapsed into this chunk at ingestion
+                if len(rec.get("source_files") or []) > 1:
+                    meta["source_files"] = rec["source_files"]
+                if len(rec.get("positions") or []) > 1:
+                    meta["positions"] = rec["positions"]
+                # Filterable fields; chunks saved before they existed get them derived here
+                extra = rec.get("metadata") or extract_metadata(text, meta["source_file"])
+                meta.update({k: v for k, v in extra.items() if v not in (None, [])})
+                metadata.append(meta)
+            self._push(ids, vectors, metadata)
 
-            # Push every 100 items
-            if len(batch_ids) >= 100:
-                self._push(batch_ids, batch_vectors, batch_metadata)
-                batch_ids, batch_vectors, batch_metadata = [], [], []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush()
+                total += len(batch)
+                batch = []
 
         # Final batch
-        if batch_ids:
-            self._push(batch_ids, batch_vectors, batch_metadata)
+        if batch:
+            flush()
+            total += len(batch)
 
-        print("\n✅ All embeddings successfully uploaded to Pinecone!\n")
+        return total
 
     # ----------------------------------------------------
     # PUSH BATCH
@@ -126,21 +184,55 @@ class PineconeClient:
             for i in range(len(ids))
         ]
 
-        self.index.upsert(vectors=items)
+        if self.namespace:
+            self.index.upsert(vectors=items, namespace=self.namespace)
+        else:
+            self.index.upsert(vectors=items)
+
+    # ----------------------------------------------------
+    # DELETE
+    # ----------------------------------------------------
+    def delete_chunks(self, chunk_ids: Iterable[str]):
+        """Remove chunks from the index and the text store (stale chunks of a re-ingested file)."""
+        chunk_ids = list(chunk_ids)
+        if not getattr(self, "_enabled", False) or not chunk_ids:
+            return 0
+        remove_from_text_store(chunk_ids)
+        self._delete(chunk_ids)
+        return len(chunk_ids)
+
+    def _delete(self, ids):
+        if self.index is None:
+            return
+        kwargs = {"namespace": self.namespace} if self.namespace else {}
+        for start in range(0, len(ids), 1000):  # Pinecone's per-request id limit
+            self.index.delete(ids=ids[start:start + 1000], **kwargs)
 
     # ----------------------------------------------------
     # QUERY
     # ----------------------------------------------------
-    def query(self, query_vector, top_k=4):
+    def query(self, query_vector, top_k=4, include_values=False, filter=None, include_metadata=True):
+        """
+        `filter`: normalized metadata filter (see src/vectorstore/filters.py).
+        With include_metadata=False matches carry only ids and scores (and
+        values if asked); the text comes from the local text store.
+        On failure the matches are empty and "error" says why (a sharded
+        store reports the shard as failed).
+        """
         if not getattr(self, "_enabled", False) or self.index is None:
             # Safe fallback: behave like an empty index
-            return {"matches": []}
+            return {"matches": [], "error": "vector store disabled"}
 
         try:
+            kwargs = {"filter": filter} if filter else {}
+            if self.namespace:
+                kwargs["namespace"] = self.namespace
             resp = self.index.query(
                 vector=query_vector,
                 top_k=top_k,
-                include_metadata=True,
+                include_metadata=include_metadata,
+                include_values=include_values,
+                **kwargs,
             )
 
             # Pinecone's response object → convert to pure dict
@@ -151,4 +243,21 @@ class PineconeClient:
 
         except Exception as e:
             print(f"❌ Pinecone query failed: {str(e)}")
-            return {"matches": []}
+            return {"matches": [], "error": str(e)}
+
+    # ----------------------------------------------------
+    # FETCH METADATA
+    # ----------------------------------------------------
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Metadata of stored vectors by id (fallback for ids missing from the text store)."""
+        if not getattr(self, "_enabled", False) or self.index is None or not ids:
+            return {}
+        try:
+            kwargs = {"namespace": self.namespace} if self.namespace else {}
+            resp = self.index.fetch(ids=list(ids), **kwargs)
+            if hasattr(resp, "to_dict"):
+                resp = resp.to_dict()
+            return {vid: (v.get("metadata") or {}) for vid, v in (resp.get("vectors") or {}).items()}
+        except Exception as e:
+            print(f"❌ Pinecone fetch failed: {str(e)}")
+            return {}
@@ -0,0 +1,214 @@
+"""
+Sharded vector store (VECTOR_SHARDS)
+Splits the corpus over N shards so no single index has to hold all of it.
+Shards can be local index directories, Pinecone namespaces, or a mix:
+
+    VECTOR_SHARDS=local,local,local                       → LOCAL_INDEX_DIR/shard-0..2
+    VECTOR_SHARDS=local:/data/idx-a,local:/data/idx-b
+    VECTOR_SHARDS=pinecone:guidelines,pinecone:leaflets,local
+
+ - writes: every chunk of a source file goes to the same shard
+   (crc32(source_file) % N), so neighbouring chunks stay together for
+   merge_adjacent; changing the shard list needs a `reembed` into empty shards
+ - queries: fanned out to all shards at once on a thread pool; each shard
+   returns its own top-k, and a k-way merge by score keeps the global top-k
+ - a shard that does not answer within VECTOR_SHARD_TIMEOUT_SEC, or fails, is
+   left out: the response is marked "partial" instead of failing the request
+ - a timed-out call cannot be interrupted and keeps its pool thread until it
+   returns; once a shard has VECTOR_SHARD_MAX_STUCK such calls in flight it is
+   skipped (also "partial") until one finishes, and the pool is sized with
+   room for them, so a hung shard cannot starve the others
+"""
+
+import heapq
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from src.vectorstore.pinecone_client import PineconeClient
+
+
+VECTOR_SHARD_TIMEOUT_SEC = float(os.getenv("VECTOR_SHARD_TIMEOUT_SEC", "2"))
+VECTOR_SHARD_WORKERS = int(os.getenv("VECTOR_SHARD_WORKERS", "0"))  # 0 = 4 per shard + stuck calls
+VECTOR_SHARD_MAX_STUCK = int(os.getenv("VECTOR_SHARD_MAX_STUCK", "2"))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _shard_pool(size: int) -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                workers = VECTOR_SHARD_WORKERS or max(4, 4 * size) + size * VECTOR_SHARD_MAX_STUCK
+                _pool = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="vector-shard")
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def shard_for(source_file: str, n: int) -> int:
+    return zlib.crc32((source_file or "").encode("utf-8")) % n
+
+
+def build_shards(spec: str) -> List[PineconeClient]:
+    """Instantiate the stores listed in a VECTOR_SHARDS value."""
+    from src.vectorstore.local_index import LocalVectorStore, LOCAL_INDEX_DIR
+
+    shards: List[PineconeClient] = []
+    pinecone = None
+    for i, entry in enumerate(e.strip() for e in spec.split(",") if e.strip()):
+        kind, _, arg = entry.partition(":")
+        kind = kind.lower()
+        if kind == "local":
+            shards.append(LocalVectorStore(arg or os.path.join(LOCAL_INDEX_DIR, f"shard-{i}")))
+        elif kind == "pinecone":
+            if pinecone is None:
+                pinecone = PineconeClient()  # one connection shared by all namespaces
+            shards.append(pinecone.for_namespace(arg))
+        else:
+            raise ValueError(f"VECTOR_SHARDS: unknown shard type {kind!r} in {entry!r}")
+    if not shards:
+        raise ValueError("VECTOR_SHARDS is empty")
+    return shards
+
+
+class ShardedVectorStore(PineconeClient):
+    """Same interface as PineconeClient, over several shard stores."""
+
+    def __init__(self, shards: List[PineconeClient], timeout: float = VECTOR_SHARD_TIMEOUT_SEC):
+        dims = {s.embedding_dim for s in shards}
+        if len(dims) != 1:
+            raise ValueError(f"Shards disagree on the embedding dimension: {sorted(dims)}")
+        self.shards = shards
+        self.timeout = timeout
+        self.embedder = shards[0].embedder
+        self.embedding_dim = shards[0].embedding_dim
+        self._enabled = any(getattr(s, "_enabled", False) for s in shards)
+        self.index = None
+        self._stuck = [0] * len(shards)  # timed-out calls still running, per shard
+        self._stuck_lock = threading.Lock()
+        print(f"✅ Sharded vector store ready: {len(shards)} shards")
+
+    # ----------------------------------------------------
+    # Writes
+    # ----------------------------------------------------
+    def upsert_all_chunks(self, batch_size: int = 100):
+        total = super().upsert_all_chunks(batch_size=batch_size)
+        self.persist()
+        return total
+
+    def upsert_chunks(self, chunk_ids, batch_size: int = 100):
+        total = super().upsert_chunks(chunk_ids, batch_size=batch_size)
+        if total:
+            self.persist()
+        return total
+
+    def delete_chunks(self, chunk_ids):
+        total = super().delete_chunks(chunk_ids)
+        if total:
+            self.persist()
+        return total
+
+    def persist(self):
+        for shard in self.shards:
+            shard.persist()
+
+    def _push(self, ids, vectors, metadata):
+        groups: Dict[int, List[int]] = {}
+        for i, meta in enumerate(metadata):
+            groups.setdefault(shard_for(meta.get("source_file"), len(self.shards)), []).append(i)
+        for s, rows in groups.items():
+            self.shards[s]._push([ids[i] for i in rows], [vectors[i] for i in rows],
+                                 [metadata[i] for i in rows])
+
+    def _delete(self, ids):
+        for shard in self.shards:
+            if getattr(shard, "_enabled", False):
+                shard._delete(ids)
+
+    # ----------------------------------------------------
+    # Fan-out query
+    # ----------------------------------------------------
+    def query(self, query_vector, top_k=4, include_values=False, filter=None, include_metadata=True):
+        kwargs = {"filter": filter} if filter else {}
+        if not include_metadata:
+            kwargs["include_metadata"] = False
+        pool = _shard_pool(len(self.shards))
+        t0 = time.perf_counter()
+        skipped = [i for i, n in enumerate(self._stuck) if n >= VECTOR_SHARD_MAX_STUCK]
+        futures = {pool.submit(shard.query, query_vector, top_k=top_k,
+                               include_values=include_values, **kwargs): i
+                   for i, shard in enumerate(self.shards) if i not in skipped}
+        done, not_done = wait(futures, timeout=self.timeout) if futures else (set(), set())
+        for f in not_done:
+            if not f.cancel():
+                self._track_stuck(f, futures[f])
+
+        per_shard: List[List[Dict[str, Any]]] = []
+        failed: List[int] = []
+        for f in done:
+            try:
+                resp = f.result()
+                if hasattr(resp, "to_dict"):
+                    resp = resp.to_dict()
+                if (resp or {}).get("error"):
+                    # Shard stores catch their own errors and return an empty result
+                    raise RuntimeError(resp["error"])
+                matches = list((resp or {}).get("matches") or [])
+            except Exception as e:
+                print(f"❌ Shard {futures[f]} query failed: {e}")
+                failed.append(futures[f])
+                continue
+            matches.sort(key=lambda m: -(m.get("score") or 0.0))
+            per_shard.append(matches)
+
+        timed_out = sorted(futures[f] for f in not_done)
+        if timed_out or failed or skipped:
+            print(f"⚠️ Partial vector search: shards timed out {timed_out}, failed {sorted(failed)}, "
+                  f"skipped {skipped} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+
+        merged: List[Dict[str, Any]] = []
+        seen = set()
+        for m in heapq.merge(*per_shard, key=lambda m: -(m.get("score") or 0.0)):
+            if m.get("id") in seen:
+                continue
+            seen.add(m.get("id"))
+            merged.append(m)
+            if len(merged) >= top_k:
+                break
+        return {
+            "matches": merged,
+            "partial": bool(timed_out or failed or skipped),
+            "shards": {"total": len(self.shards), "timed_out": timed_out, "failed": sorted(failed),
+                       "skipped": skipped},
+        }
+
+    def _track_stuck(self, future, shard: int):
+        """Count a timed-out call against its shard until it actually returns."""
+        with self._stuck_lock:
+            self._stuck[shard] += 1
+
+        def release(_):
+            with self._stuck_lock:
+                self._stuck[shard] -= 1
+
+        future.add_done_callback(release)
+
+    def fetch_metadata(self, ids):
+        found: Dict[str, Dict[str, Any]] = {}
+        for shard in self.shards:
+            missing = [i for i in ids if i not in found]
+            if not missing:
+                break
+            found.update(shard.fetch_metadata(missing))
+        return found
+
+
+def get_sharded_store(spec: Optional[str] = None) -> ShardedVectorStore:
+    return ShardedVectorStore(build_shards(spec or os.getenv("VECTOR_SHARDS", "")))
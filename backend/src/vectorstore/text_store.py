@@ -0,0 +1,243 @@
+"""
+Local id-addressed chunk text store
+Vector metadata only needs what filters use; chunk text lives here instead,
+so queries return ids + scores and the text of the winners is read in one
+bulk, local lookup (full chunks, and neighbouring chunks when wanted).
+
+On disk (TEXT_STORE_DIR, default processed/text_store/):
+ - texts-<generation>.bin: one JSON record per chunk
+   ({"text", "source_file", "source_files", "metadata", "positions"}), back to back
+ - table.npz: ids + byte offsets + lengths, and the name of the data file
+Readers mmap the data file. Writers append records and rewrite the table
+(write-then-rename); a full rebuild starts a new data file, so a reader in
+another process keeps a valid mapping until it reloads on the table's mtime.
+"""
+
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.main.settings import PROCESSED_DIR, CHUNKS_DIR
+
+
+TEXT_STORE_DIR = os.getenv("TEXT_STORE_DIR") or os.path.join(PROCESSED_DIR, "text_store")
+TEXT_STORE_RELOAD_SEC = float(os.getenv("TEXT_STORE_RELOAD_SEC", "2"))
+
+
+def chunk_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """What the store keeps for one chunk JSON (see src/ingest/ingest.py)."""
+    source = data.get("source_file") or data["chunk_id"].split("__")[0]
+    return {
+        "text": data.get("text", ""),
+        "source_file": source,
+        "source_files": data.get("source_files") or [source],
+        "metadata": data.get("metadata") or {},
+        "positions": data.get("positions") or [data["chunk_id"]],
+    }
+
+
+def _read_chunks(chunk_ids: Optional[Iterable[str]] = None):
+    if chunk_ids is None:
+        paths = sorted(Path(CHUNKS_DIR).glob("*.json"))
+    else:
+        paths = [Path(CHUNKS_DIR) / f"{cid}.json" for cid in chunk_ids]
+    for path in paths:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"⚠️ Text store: cannot read {path.name}: {e}")
+            continue
+        if data.get("chunk_id"):
+            yield data["chunk_id"], chunk_record(data)
+
+
+class TextStore:
+    def __init__(self, path: str = TEXT_STORE_DIR):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._pos: Dict[str, int] = {}
+        self._offsets = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._data_file: Optional[str] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._loaded_mtime = 0.0
+        self._checked_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._pos
+
+    # ---------------------------------------------------------
+    # Reading
+    # ---------------------------------------------------------
+    def load(self) -> "TextStore":
+        table = self.path / "table.npz"
+        if not table.exists():
+            return self
+        mtime = table.stat().st_mtime
+        with np.load(table, allow_pickle=False) as data:
+            ids = data["ids"].tolist()
+            offsets, lengths = data["offsets"], data["lengths"]
+            data_file = str(data["data_file"])
+        mm = None
+        try:
+            size = (self.path / data_file).stat().st_size
+        except OSError:
+            print(f"⚠️ Text store data file {data_file} is missing; rebuild with: python -m src.cli reembed")
+            return self
+        if size:
+            with open(self.path / data_file, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            old = self._mm
+            self._pos = {cid: i for i, cid in enumerate(ids)}
+            self._offsets, self._lengths = offsets, lengths
+            self._data_file, self._mm = data_file, mm
+            self._loaded_mtime = mtime
+        if old is not None:
+            old.close()
+        return self
+
+    def maybe_reload(self):
+        """Pick up tables written by another process (ingestion) since the last load."""
+        now = time.monotonic()
+        if now - self._checked_at < TEXT_STORE_RELOAD_SEC:
+            return
+        self._checked_at = now
+        try:
+            if (self.path / "table.npz").stat().st_mtime > self._loaded_mtime:
+                self.load()
+        except OSError:
+            pass
+
+    def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Records of the given ids; unknown ids are left out."""
+        out = {}
+        with self._lock:
+            mm, pos, offsets, lengths = self._mm, self._pos, self._offsets, self._lengths
+            if mm is None:
+                return out
+            for cid in chunk_ids:
+                i = pos.get(cid)
+                if i is None:
+                    continue
+                start = int(offsets[i])
+                out[cid] = json.loads(mm[start:start + int(lengths[i])].decode("utf-8"))
+        return out
+
+    # ---------------------------------------------------------
+    # Writing
+    # ---------------------------------------------------------
+    def _write_table(self, ids: List[str], offsets, lengths, data_file: str):
+        tmp = self.path / "table.tmp.npz"
+        np.savez(tmp, ids=np.asarray(ids, dtype=str), offsets=np.asarray(offsets, dtype=np.int64),
+                 lengths=np.asarray(lengths, dtype=np.int64), data_file=np.asarray(data_file))
+        os.replace(tmp, self.path / "table.npz")
+
+    def build(self, records: Iterable) -> int:
+        """Replace the store with (chunk_id, record) pairs."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        data_file = f"texts-{time.time_ns()}.bin"
+        ids, offsets, lengths = [], [], []
+        pos = 0
+        with open(self.path / data_file, "wb") as f:
+            for cid, rec in records:
+                blob = json.dumps(rec, ensure_ascii=False).encode("utf-8")
+                f.write(blob)
+                ids.append(cid)
+                offsets.append(pos)
+                lengths.append(len(blob))
+                pos += len(blob)
+        self._write_table(ids, offsets, lengths, data_file)
+        # Old generations: readers elsewhere may still map them (fails harmlessly on Windows)
+        for old in self.path.glob("texts-*.bin"):
+            if old.name != data_file:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        self.load()
+        return len(ids)
+
+    def append(self, records: Iterable) -> int:
+        """Add or replace records; a replaced id points at its newest copy."""
+        records = list(records)
+        if not records:
+            return 0
+        self.load()
+        if self._data_file is None:
+            return self.build(records)
+        with self._lock:
+            ids = [None] * len(self._pos)
+            for cid, i in self._pos.items():
+                ids[i] = cid
+            offsets, lengths = self._offsets.tolist(), self._lengths.tolist()
+            pos = dict(self._pos)
+        with open(self.path / self._data_file, "ab") as f:
+            end = f.seek(0, os.SEEK_END)
+            for cid, rec in records:
+                blob = json.dumps(rec, ensure_ascii=False).encode("utf-8")
+                f.write(blob)
+                i = pos.get(cid)
+                if i is None:
+                    pos[cid] = len(ids)
+                    ids.append(cid)
+                    offsets.append(end)
+                    lengths.append(len(blob))
+                else:
+                    offsets[i], lengths[i] = end, len(blob)
+                end += len(blob)
+        self._write_table(ids, offsets, lengths, self._data_file)
+        self.load()
+        return len(records)
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        """Drop ids from the table (their bytes stay in the data file until the next build)."""
+        self.load()
+        drop = set(chunk_ids)
+        with self._lock:
+            rows = [(cid, i) for cid, i in self._pos.items() if cid not in drop]
+            removed = len(self._pos) - len(rows)
+            data_file = self._data_file
+            offsets, lengths = self._offsets, self._lengths
+        if not removed or data_file is None:
+            return 0
+        rows.sort(key=lambda r: r[1])
+        self._write_table([cid for cid, _ in rows], [int(offsets[i]) for _, i in rows],
+                          [int(lengths[i]) for _, i in rows], data_file)
+        self.load()
+        return removed
+
+
+def build_text_store(chunk_ids: Optional[Iterable[str]] = None, path: str = TEXT_STORE_DIR) -> int:
+    """Rebuild the store from processed/chunks, or append just `chunk_ids`."""
+    store = TextStore(path)
+    if chunk_ids is None:
+        return store.build(_read_chunks())
+    return store.append(_read_chunks(chunk_ids))
+
+
+def remove_from_text_store(chunk_ids: Iterable[str], path: str = TEXT_STORE_DIR) -> int:
+    return TextStore(path).remove(chunk_ids)
+
+
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_text_store() -> TextStore:
+    global _store_instance
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                _store_instance = TextStore().load()
+    _store_instance.maybe_reload()
+    return _store_instance
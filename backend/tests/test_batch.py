@@ -0,0 +1,34 @@
+"""Batch answering streams results as they finish (src/rag/batch.py). Run from backend/: python -m pytest"""
+
+import threading
+
+from src.rag import batch
+from src.rag.pipeline import SearchResults
+
+
+class _Embedder:
+    def embed_queries(self, questions):
+        return [[float(i)] for i in range(len(questions))]
+
+
+def test_first_answer_does_not_wait_for_every_search(monkeypatch):
+    release, slow_done = threading.Event(), threading.Event()
+
+    def search(vector, top_k=4, filter=None):
+        if vector == [0.0]:
+            release.wait(5)  # the first question's search is slow
+            slow_done.set()
+        return SearchResults([{"id": f"doc__chunk_{int(vector[0])}", "text": "context"}])
+
+    monkeypatch.setattr(batch, "get_embedder", lambda: _Embedder())
+    monkeypatch.setattr(batch, "search", search)
+    monkeypatch.setattr(batch, "_generate", lambda prompt, system: "answer")
+
+    results = batch.run_batch(["slow", "fast"])
+    try:
+        first = next(results)
+        assert first["index"] == 1 and not slow_done.is_set()
+    finally:
+        release.set()
+    second = next(results)
+    assert second["index"] == 0 and second["answer"] == "answer"
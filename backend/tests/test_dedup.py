@@ -0,0 +1,102 @@
+"""MinHash/LSH near-duplicate detection (src/ingest/dedup.py). Run from backend/: python -m pytest"""
+
+import json
+
+from src.ingest import ingest
+from src.ingest.dedup import NearDuplicateIndex, minhash, similarity
+
+
+BASE = (
+    "Pregnant women should take a daily supplement of 400 micrograms of folic acid "
+    "from before conception until twelve weeks of pregnancy to reduce the risk of "
+    "neural tube defects such as spina bifida in the baby. Women with diabetes, "
+    "epilepsy or a previous affected pregnancy may be advised to take a higher dose "
+    "of five milligrams, which is only available on prescription from a doctor or "
+    "midwife, and should discuss this at their booking appointment."
+)
+NEAR_DUPLICATE = BASE.replace("booking appointment.", "first booking appointment.")
+UNRELATED = (
+    "Skin-to-skin contact straight after birth helps to regulate the newborn's "
+    "temperature and heart rate, supports the start of breastfeeding and is "
+    "encouraged after caesarean sections as well as vaginal births, whenever the "
+    "mother and baby are both well enough for it to be done safely on the ward."
+)
+THRESHOLD = 0.85
+
+
+def test_unrelated_text_scores_near_zero():
+    assert similarity(minhash(BASE), minhash(UNRELATED)) < 0.1
+
+
+def test_near_duplicate_scores_above_threshold():
+    assert similarity(minhash(BASE), minhash(NEAR_DUPLICATE)) >= THRESHOLD
+
+
+def test_signatures_are_stable():
+    assert (minhash(BASE) == minhash(BASE)).all()
+
+
+def test_index_finds_near_duplicates_only():
+    index = NearDuplicateIndex(THRESHOLD)
+    index.add("base__chunk_0", minhash(BASE))
+    match = index.find(minhash(NEAR_DUPLICATE))
+    assert match is not None and match[0] == "base__chunk_0"
+    assert index.find(minhash(UNRELATED)) is None
+
+
+def test_removed_keys_are_not_found():
+    index = NearDuplicateIndex(THRESHOLD)
+    index.add("base__chunk_0", minhash(BASE))
+    index.remove("base__chunk_0")
+    assert len(index) == 0
+    assert index.find(minhash(BASE)) is None
+
+
+def _ingest(tmp_path, name, text, dedup, refs):
+    path = tmp_path / "data" / f"{name}.txt"
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return ingest.ingest_file(path, dedup, refs)
+
+
+def _chunks(chunks_dir):
+    return {p.stem: json.loads(p.read_text(encoding="utf-8")) for p in chunks_dir.glob("*.json")}
+
+
+def test_reingest_keeps_chunks_other_files_collapsed_into(tmp_path, monkeypatch):
+    chunks_dir = tmp_path / "chunks"
+    chunks_dir.mkdir()
+    monkeypatch.setattr(ingest, "CHUNKS_DIR", str(chunks_dir))
+    dedup, refs = NearDuplicateIndex(THRESHOLD), {}
+
+    _ingest(tmp_path, "folic_guideline", BASE, dedup, refs)
+    _, skipped, _ = _ingest(tmp_path, "folic_copy", NEAR_DUPLICATE, dedup, refs)
+    assert skipped == 1 and "folic_copy__chunk_0" not in _chunks(chunks_dir)
+
+    touched, _, removed = _ingest(tmp_path, "folic_guideline", UNRELATED, dedup, refs)
+    chunks = _chunks(chunks_dir)
+    # The shared chunk moved to folic_copy under the id it would have had there;
+    # the old id holds the new text, so it is not reported as removed
+    assert removed == []
+    assert chunks["folic_copy__chunk_0"]["text"] == BASE
+    assert chunks["folic_copy__chunk_0"]["source_files"] == ["folic_copy"]
+    assert chunks["folic_guideline__chunk_0"]["text"] == UNRELATED
+    assert chunks["folic_guideline__chunk_0"]["source_files"] == ["folic_guideline"]
+    assert {"folic_copy__chunk_0", "folic_guideline__chunk_0"} <= set(touched)
+    assert ingest.load_source_refs() == refs
+
+
+def test_merge_joins_neighbours_across_a_collapsed_duplicate():
+    from src.rag.diversity import merge_adjacent
+
+    items = [
+        {"id": "leaflet__chunk_3", "score": 0.9, "text_snippet": "before the shared part"},
+        # leaflet's chunk 4 was collapsed into guideline's chunk 7
+        {"id": "guideline__chunk_7", "score": 0.8, "text_snippet": "the shared part",
+         "positions": ["guideline__chunk_7", "leaflet__chunk_4"]},
+        {"id": "leaflet__chunk_5", "score": 0.7, "text_snippet": "after the shared part"},
+    ]
+    merged = merge_adjacent(items)
+    assert len(merged) == 1
+    assert merged[0]["merged_ids"] == ["leaflet__chunk_3", "guideline__chunk_7", "leaflet__chunk_5"]
+    assert merged[0]["positions"] == ["leaflet__chunk_3", "leaflet__chunk_4", "leaflet__chunk_5"]
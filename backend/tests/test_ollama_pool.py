@@ -0,0 +1,90 @@
+"""Ollama endpoint pool failover and recovery (src/llm/ollama_pool.py), against local mock servers. Run from backend/: python -m pytest"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.llm import llm_ollama
+from src.llm.ollama_pool import OllamaPool
+
+
+class _MockOllama(BaseHTTPRequestHandler):
+    def _reply(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply({"models": [{"name": "phi3:mini"}]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._reply({"response": f"answer from {self.server.server_address[1]}", "done": True})
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MockOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def servers():
+    live, down = _serve(), _serve()
+    down_port = down.server_address[1]
+    down.shutdown()
+    down.server_close()  # refuses connections from now on
+    started = [live]
+    yield live, down_port, started
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def _wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_fails_over_and_recovers(servers, monkeypatch):
+    live, down_port, started = servers
+    live_port = live.server_address[1]
+    # The dead endpoint is listed first, so it is tried first
+    pool = OllamaPool([f"http://127.0.0.1:{down_port}", f"http://127.0.0.1:{live_port}"], retry_after=0.2)
+    dead, alive = pool.endpoints
+    monkeypatch.setattr(llm_ollama, "get_ollama_pool", lambda: pool)
+
+    assert llm_ollama.generate_llm_response("hi") == f"answer from {live_port}"
+    assert not dead.healthy and alive.healthy
+    assert pool.health() == (True, "Ollama is running (1/2 endpoints healthy)")
+
+    # Requests go straight to the healthy endpoint; nothing probes on this thread
+    t0 = time.perf_counter()
+    assert llm_ollama.generate_llm_response("again") == f"answer from {live_port}"
+    assert time.perf_counter() - t0 < 1.0
+
+    # The endpoint comes back: the background prober notices it
+    started.append(_serve(down_port))
+    assert _wait_for(lambda: dead.healthy)
+    assert pool.health() == (True, "Ollama is running (2/2 endpoints healthy)")
+
+
+def test_all_endpoints_down_is_unhealthy(servers):
+    _, down_port, _ = servers
+    pool = OllamaPool([f"http://127.0.0.1:{down_port}"], retry_after=60)
+    pool.probe_all(timeout=1)
+    healthy, message = pool.health()
+    assert not healthy and "Cannot connect" in message
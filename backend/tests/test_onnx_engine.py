@@ -0,0 +1,24 @@
+"""ONNX embedder agreement with the torch SentenceTransformer (src/embed/onnx_engine.py). Run from backend/: python -m pytest
+
+Skipped unless onnxruntime and sentence_transformers are installed and the
+model was exported (python -m src.cli onnx-export).
+"""
+
+from pathlib import Path
+
+import pytest
+
+from src.embed.onnx_engine import MIN_COSINE, MODEL_FILE, QUANTIZED_FILE, default_onnx_dir
+
+
+@pytest.mark.parametrize("model_file", [MODEL_FILE, QUANTIZED_FILE])
+def test_onnx_vectors_match_torch(model_file):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    if not (Path(default_onnx_dir()) / model_file).exists():
+        pytest.skip(f"{model_file} not exported to {default_onnx_dir()}")
+    from src.embed.onnx_engine import verify_against_torch
+
+    result = verify_against_torch(quantized=model_file == QUANTIZED_FILE)
+    assert result["model_file"] == model_file
+    assert result["min_cosine"] >= MIN_COSINE[model_file], result
@@ -0,0 +1,64 @@
+"""Sharded fan-out search and its partial-result report (src/vectorstore/sharded.py). Run from backend/: python -m pytest"""
+
+import threading
+import time
+
+from src.vectorstore.local_index import LocalIndex, LocalVectorStore
+from src.vectorstore.sharded import ShardedVectorStore
+
+
+DIM = 4
+
+
+def _local_shard(path, items):
+    """A LocalVectorStore over a small in-memory index (no embedding model needed)."""
+    store = LocalVectorStore.__new__(LocalVectorStore)
+    store.embedder, store.embedding_dim, store.path = None, DIM, str(path)
+    store.index = LocalIndex(str(path), dim=DIM)
+    store.index.upsert({"id": i, "values": v, "metadata": {"source_file": i.split("__")[0]}}
+                       for i, v in items)
+    store._enabled, store._checked_at = True, time.monotonic()
+    return store
+
+
+def _broken(store):
+    def query(*args, **kwargs):
+        raise RuntimeError("index corrupted")
+    store.index.query = query
+    return store
+
+
+def test_all_shards_answer(tmp_path):
+    sharded = ShardedVectorStore([
+        _local_shard(tmp_path / "a", [("a__chunk_0", [1, 0, 0, 0])]),
+        _local_shard(tmp_path / "b", [("b__chunk_0", [0.9, 0.1, 0, 0])]),
+    ])
+    resp = sharded.query([1, 0, 0, 0], top_k=2)
+    assert [m["id"] for m in resp["matches"]] == ["a__chunk_0", "b__chunk_0"]
+    assert resp["partial"] is False
+
+
+def test_failing_shard_is_reported(tmp_path):
+    sharded = ShardedVectorStore([
+        _local_shard(tmp_path / "a", [("a__chunk_0", [1, 0, 0, 0])]),
+        _broken(_local_shard(tmp_path / "b", [("b__chunk_0", [1, 0, 0, 0])])),
+    ])
+    resp = sharded.query([1, 0, 0, 0], top_k=2)
+    assert [m["id"] for m in resp["matches"]] == ["a__chunk_0"]
+    assert resp["partial"] is True
+    assert resp["shards"]["failed"] == [1] and resp["shards"]["timed_out"] == []
+
+
+def test_slow_shard_times_out(tmp_path):
+    release = threading.Event()
+    slow = _local_shard(tmp_path / "b", [("b__chunk_0", [1, 0, 0, 0])])
+    query = slow.index.query
+    slow.index.query = lambda *a, **kw: release.wait(5) and query(*a, **kw)
+    sharded = ShardedVectorStore([_local_shard(tmp_path / "a", [("a__chunk_0", [1, 0, 0, 0])]), slow],
+                                 timeout=0.1)
+    try:
+        resp = sharded.query([1, 0, 0, 0], top_k=2)
+    finally:
+        release.set()
+    assert [m["id"] for m in resp["matches"]] == ["a__chunk_0"]
+    assert resp["partial"] is True and resp["shards"]["timed_out"] == [1]
@@ -0,0 +1,18 @@
+"""Cold-start import budget of the API module (src/api/warmup.py). Run from backend/: python -m pytest"""
+
+import os
+
+from src.api.warmup import HEAVY_MODULES, measure_import
+
+
+STARTUP_BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", "1000"))
+
+
+def test_api_imports_within_budget():
+    result = measure_import("src.api.app")
+    assert result["ms"] <= STARTUP_BUDGET_MS, f"src.api.app took {result['ms']} ms (budget {STARTUP_BUDGET_MS} ms)"
+
+
+def test_api_import_defers_heavy_modules():
+    result = measure_import("src.api.app")
+    assert result["heavy"] == [], f"imported eagerly: {result['heavy']} (expected none of {HEAVY_MODULES})"